@@ -39,11 +39,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'miapp',
 ]
 
 MIDDLEWARE = [
+    'miapp.middleware.UrlconfAsgiMiddleware',           # Bajo ASGI: ASGI_URLCONF (dashboard async)
     'django.middleware.security.SecurityMiddleware',
+    'miapp.middleware.PresupuestoConsultasMiddleware',  # Cuenta consultas SQL por vista
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -53,6 +56,7 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'config.urls'
+ASGI_URLCONF = 'config.urls_asgi'
 
 TEMPLATES = [
     {
@@ -83,6 +87,96 @@ DATABASES = {
 }
 
 
+# Cache
+# LocMemCache es por proceso: con varios workers en producción conviene Redis o
+# Memcached para que la invalidación por señales (miapp/cache_versiones.py) llegue a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'clinica-renacer',
+    }
+}
+
+# Segundos que vive cada estadística del dashboard de dirección (red de seguridad si falla una señal)
+ESTADISTICAS_CACHE_TIMEOUT = 600
+
+# Tareas en segundo plano (miapp/tareas.py): hilos del proceso web. En pruebas
+# se puede poner TAREAS_SINCRONAS = True para ejecutarlas en línea.
+TAREAS_HILOS = 2
+TAREAS_SINCRONAS = False
+
+# Vistas async (miapp/asincrono.py): hilos, cada uno con su conexión, donde corren
+# las consultas que un dashboard lanza a la vez.
+CONSULTAS_HILOS = 8
+
+# Presupuesto de consultas (miapp/middleware.py): siempre cuenta las consultas y su tiempo;
+# el SQL y los parámetros de cada una (datos de pacientes) solo los guarda con DEBUG o con
+# CONSULTAS_REGISTRAR_SQL = True, que activan las pruebas y 'manage.py asesor_indices'.
+CONSULTAS_REGISTRAR_SQL = False
+
+# PDF (miapp/pdf.py): caché en disco por hash del HTML y pool de procesos para xhtml2pdf.
+# PDF_PROCESOS = 0 renderiza en línea. PDF_ESPERA: segundos que la petición espera
+# antes de responder con la página "generando..." que consulta el estado.
+PDF_CACHE_DIR = os.path.join(BASE_DIR, 'cache_pdf')
+PDF_PROCESOS = 2
+PDF_ESPERA = 3
+
+# Feed de órdenes de enfermería (miapp/ordenes.py). Bajo ASGI una consulta sin novedades
+# queda abierta FEED_ORDENES_ESPERA segundos esperando cambios (long-polling) antes de
+# responder 204. Bajo WSGI responde enseguida y el panel vuelve a preguntar a los
+# FEED_ORDENES_REINTENTO segundos (Retry-After).
+FEED_ORDENES_ESPERA = 20
+FEED_ORDENES_REINTENTO = 5
+
+# Importación masiva de pacientes (miapp/importacion.py): reportes de filas rechazadas
+# de las cargas hechas desde el admin. Fuera de MEDIA_ROOT: tienen datos de pacientes.
+IMPORTACION_DIR = os.path.join(BASE_DIR, 'importaciones')
+
+# Documentos de pacientes (miapp/documentos.py): se suben por partes de SUBIDAS_FRAGMENTO
+# bytes que se acumulan en SUBIDAS_DIR (fuera de MEDIA_ROOT) y se pueden reanudar durante
+# SUBIDAS_VIGENCIA_HORAS. Al completarse se guardan una sola vez por contenido (SHA-256).
+SUBIDAS_DIR = os.path.join(BASE_DIR, 'subidas')
+SUBIDAS_FRAGMENTO = 8 * 1024 * 1024
+SUBIDAS_VIGENCIA_HORAS = 24
+DOCUMENTOS_TAMANO_MAXIMO = 1024 * 1024 * 1024
+
+# Reservas (miapp/reservas.py): una clave de idempotencia solo protege del doble envío;
+# pasadas IDEMPOTENCIA_VIGENCIA_HORAS la borra 'manage.py limpiar_subidas'.
+IDEMPOTENCIA_VIGENCIA_HORAS = 24
+
+# Envío de archivos (miapp/medios.py): la vista decide permisos y caché y el servidor
+# web hace la transferencia. None: desde Python (desarrollo). 'x-sendfile' (Apache,
+# lighttpd) o 'x-accel-redirect' (nginx, con una 'location internal' por carpeta):
+#   MEDIOS_UBICACIONES_INTERNAS = {MEDIA_ROOT: '/_media/', PDF_CACHE_DIR: '/_pdf/'}
+MEDIOS_ENVIO = None
+MEDIOS_UBICACIONES_INTERNAS = {}
+
+# Recordatorios de citas (miapp/recordatorios.py, comando enviar_recordatorios): el
+# aviso del día anterior sale a partir de RECORDATORIOS_HORA_DIA_ANTERIOR (hora local) y
+# el del mismo día RECORDATORIOS_HORAS_ANTES horas antes de la cita. Un backend por canal;
+# en producción: 'miapp.recordatorios.SmsHttpBackend' y 'miapp.recordatorios.CorreoBackend'.
+# ArchivoBackend deja los mensajes en RECORDATORIOS_ARCHIVO (una línea JSON por mensaje).
+RECORDATORIOS_BACKENDS = {
+    'sms': 'miapp.recordatorios.ConsolaBackend',
+    'correo': 'miapp.recordatorios.ConsolaBackend',
+}
+RECORDATORIOS_HORA_DIA_ANTERIOR = 16
+RECORDATORIOS_HORAS_ANTES = 3
+RECORDATORIOS_POR_SEGUNDO = 20  # límite del proveedor; 0 sin límite
+RECORDATORIOS_INTENTOS = 5
+RECORDATORIOS_ARCHIVO = os.path.join(BASE_DIR, 'recordatorios.jsonl')
+RECORDATORIOS_SMS_URL = os.environ.get('RECORDATORIOS_SMS_URL', '')
+RECORDATORIOS_SMS_TOKEN = os.environ.get('RECORDATORIOS_SMS_TOKEN', '')
+
+# API REST (miapp/api.py) en /api/v1/: solo JSON (sin la interfaz navegable) y la sesión
+# de Django como autenticación. Permisos por rol y paginación: miapp.api.RecursoApi.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.SessionAuthentication'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
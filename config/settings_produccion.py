@@ -0,0 +1,58 @@
+"""
+Perfil de base de datos para producción (SQLite con varios workers/hilos).
+
+    DJANGO_SETTINGS_MODULE=config.settings_produccion
+
+Todo lo demás sale de config/settings.py. Comparar antes/después con
+`python manage.py benchmark_concurrencia` bajo cada perfil.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+# Pragmas aplicados a cada conexión nueva:
+#   journal_mode=WAL      lectores y escritor no se bloquean entre sí (queda grabado en el archivo)
+#   busy_timeout          ms que una escritura espera el candado antes de "database is locked"
+#   synchronous=NORMAL    en WAL es seguro ante caídas del proceso; solo un corte de luz
+#                         puede perder la última transacción, nunca corromper la base
+#   mmap_size             lecturas por memoria mapeada (256 MB) en vez de read()
+#   cache_size            caché de páginas por conexión, negativo = KiB (64 MB)
+PRAGMAS_SQLITE = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA busy_timeout=20000;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA cache_size=-65536;"
+)
+
+# Conexiones persistentes (abrir una con estos pragmas cuesta más que muchas consultas),
+# comprobadas antes de reutilizarlas: tras un reinicio de la base se abre otra.
+# Valen también para el pool de hilos de las vistas async (miapp/asincrono.py).
+CONEXIONES_PERSISTENTES = {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        **CONEXIONES_PERSISTENTES,
+        'OPTIONS': {
+            'init_command': PRAGMAS_SQLITE,
+            # BEGIN IMMEDIATE: la transacción toma el candado de escritura al empezar. Con
+            # BEGIN DEFERRED, subir de lectura a escritura a mitad de camino falla en el acto
+            # sin respetar busy_timeout.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'lectura': {
+        **DATABASES['default'],
+        **CONEXIONES_PERSISTENTES,
+        'OPTIONS': {'init_command': PRAGMAS_SQLITE + "PRAGMA query_only=ON;"},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['miapp.routers.RouterLecturaEscritura']
+
+MIDDLEWARE = [*MIDDLEWARE]
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('miapp.middleware.PresupuestoConsultasMiddleware') + 1,
+    'miapp.routers.LecturaSeparadaMiddleware',
+)
@@ -17,8 +17,6 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import path, include
-from django.conf import settings            
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,6 +24,4 @@ urlpatterns = [
     path('', include('miapp.urls')),
 ]
 
-# Esto permite ver las imágenes subidas mientras estamos desarrollando
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Los archivos subidos (MEDIA_URL) los sirve miapp.views.servir_medio, con sus permisos
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+URLconf para config/asgi.py (la elige miapp.middleware.UrlconfAsgiMiddleware).
+
+Las mismas rutas que config/urls.py, salvo las que bajo ASGI tienen versión async:
+el dashboard (sus consultas independientes corren a la vez) y el feed de órdenes
+(el long-polling espera sin ocupar un hilo).
+"""
+from django.urls import path
+
+from miapp import views
+from .urls import urlpatterns as urlpatterns_wsgi
+
+urlpatterns = [
+    path('dashboard/', views.dashboard_async, name='dashboard'),
+    path('ordenes/feed/', views.feed_ordenes_async, name='feed_ordenes'),
+    *urlpatterns_wsgi,
+]
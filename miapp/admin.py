@@ -1,4 +1,17 @@
-from django.contrib import admin
+import datetime
+import logging
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from .models import (
     Paciente, 
     Cita, 
@@ -10,8 +23,18 @@ from .models import (
     PersonalAutorizado, 
     MovimientoContable, 
     OrdenMedica, 
-    Especialidad
+    Especialidad,
+    HorarioMedico,
+    ExcepcionHorario,
+    Recordatorio,
+    TasaCambio
 )
+from .documentos import asignar_contenido
+from .exportacion import zip_en_streaming
+from .forms import ImportarPacientesForm
+from .importacion import leer_archivo, importar_pacientes
+
+logger = logging.getLogger(__name__)
 
 # ==========================================
 # 1. SEGURIDAD Y ROLES (LISTA BLANCA)
@@ -32,12 +55,17 @@ class PerfilUsuarioAdmin(admin.ModelAdmin):
 # 2. CONTABILIDAD
 # ==========================================
 class MovimientoContableAdmin(admin.ModelAdmin):
-    list_display = ('fecha', 'tipo', 'descripcion', 'monto', 'es_divisa', 'responsable')
+    list_display = ('fecha', 'tipo', 'descripcion', 'monto', 'es_divisa', 'tasa_cambio', 'tasa_manual', 'responsable')
     list_filter = ('tipo', 'fecha', 'es_divisa')
     search_fields = ('descripcion', 'referencia')
     date_hierarchy = 'fecha'
     list_editable = ('tipo',) # Esto funciona bien porque 'fecha' es el enlace por defecto
 
+class TasaCambioAdmin(admin.ModelAdmin):
+    """ Tasa BCV del día: al cargarla o corregirla, los movimientos sin tasa manual la toman (signals.py) """
+    list_display = ('fecha', 'tasa', 'fecha_registro')
+    date_hierarchy = 'fecha'
+
 # ==========================================
 # 3. GESTIÓN MÉDICA
 # ==========================================
@@ -45,6 +73,73 @@ class PacienteAdmin(admin.ModelAdmin):
     list_display = ('cedula', 'nombre', 'apellido', 'telefono', 'fecha_registro')
     search_fields = ('cedula', 'nombre', 'apellido')
     list_display_links = ('cedula', 'nombre')
+    actions = ['exportar_historiales_pdf']
+
+    @admin.action(description="Exportar historias clínicas (ZIP de PDF)")
+    def exportar_historiales_pdf(self, request, queryset):
+        # El ZIP se va enviando mientras se generan los PDF: el navegador muestra el avance de la descarga
+        ids = list(queryset.order_by('apellido', 'nombre').values_list('id', flat=True))
+        paso = max(len(ids) // 10, 1)
+
+        def progreso(hechos, total):
+            if hechos % paso == 0 or hechos == total:
+                logger.info("Exportación de historias para %s: %d/%d", request.user, hechos, total)
+
+        response = StreamingHttpResponse(zip_en_streaming(ids, progreso), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="historias_{datetime.date.today():%Y%m%d}.zip"'
+        return response
+
+    # --- Importación masiva (miapp/importacion.py) ---
+    change_list_template = 'admin/miapp/paciente/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('importar/', self.admin_site.admin_view(self.importar), name='miapp_paciente_importar'),
+            path('importar/errores/<str:nombre>/', self.admin_site.admin_view(self.descargar_errores),
+                 name='miapp_paciente_importar_errores'),
+        ] + super().get_urls()
+
+    def importar(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = ImportarPacientesForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            columnas, filas = leer_archivo(archivo, archivo.name, form.cleaned_data['codificacion'])
+            if 'cedula' not in columnas:
+                form.add_error('archivo', f"No hay columna de cédula. Encabezados leídos: {', '.join(columnas)}.")
+            else:
+                os.makedirs(settings.IMPORTACION_DIR, exist_ok=True)
+                nombre = f"errores_{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.csv"
+                ruta = os.path.join(settings.IMPORTACION_DIR, nombre)
+                with open(ruta, 'w', newline='', encoding='utf-8') as reporte:
+                    resumen = importar_pacientes(columnas, filas, reporte=reporte)
+                logger.info("Importación de pacientes por %s (%s): %s", request.user, archivo.name, resumen)
+
+                messages.success(request, f"{resumen['creadas']} pacientes nuevos y {resumen['actualizadas']} actualizados "
+                                          f"en {resumen['segundos']}s ({resumen['filas_por_segundo']} filas/s).")
+                if resumen['rechazadas']:
+                    enlace = reverse('admin:miapp_paciente_importar_errores', args=[nombre])
+                    messages.warning(request, format_html('{} filas rechazadas. <a href="{}">Descargar el reporte</a>.',
+                                                          resumen['rechazadas'], enlace))
+                else:
+                    os.remove(ruta)
+                return redirect('admin:miapp_paciente_changelist')
+
+        return TemplateResponse(request, 'admin/miapp/paciente/importar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Importar pacientes",
+            'form': form,
+        })
+
+    def descargar_errores(self, request, nombre):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        ruta = os.path.join(settings.IMPORTACION_DIR, nombre)
+        if not re.fullmatch(r'errores_[\w]+\.csv', nombre) or not os.path.exists(ruta):
+            raise Http404
+        return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre, content_type='text/csv')
 
 class CitaAdmin(admin.ModelAdmin):
     list_display = ('fecha', 'hora', 'paciente', 'medico', 'estado', 'realizada')
@@ -52,10 +147,42 @@ class CitaAdmin(admin.ModelAdmin):
     search_fields = ('paciente__nombre', 'paciente__cedula', 'medico__username')
     date_hierarchy = 'fecha'
 
+class RecordatorioAdmin(admin.ModelAdmin):
+    """ Bitácora del comando enviar_recordatorios: solo lectura """
+    list_display = ('fecha_creacion', 'cita', 'ventana', 'canal', 'destino', 'estado', 'intentos', 'fecha_envio')
+    list_filter = ('estado', 'canal', 'ventana')
+    search_fields = ('destino', 'cita__paciente__cedula')
+    list_select_related = ('cita__paciente', 'cita__medico')
+    readonly_fields = [campo.name for campo in Recordatorio._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+class HorarioMedicoAdmin(admin.ModelAdmin):
+    list_display = ('medico', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_turno', 'activo')
+    list_filter = ('dia_semana', 'activo', 'medico')
+    list_editable = ('activo',)
+
+class ExcepcionHorarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'medico', 'hora_inicio', 'hora_fin', 'motivo')
+    list_filter = ('medico',)
+    date_hierarchy = 'fecha'
+
 class OrdenMedicaAdmin(admin.ModelAdmin):
     list_display = ('fecha_creacion', 'paciente', 'medico', 'ejecutada', 'enfermera_responsable')
     list_filter = ('ejecutada', 'fecha_creacion')
 
+class DocumentoAdmin(admin.ModelAdmin):
+    list_display = ('fecha_subida', 'paciente', 'descripcion', 'nombre_original')
+    search_fields = ('paciente__cedula', 'descripcion', 'nombre_original')
+    raw_id_fields = ('paciente',)
+
+    def save_model(self, request, obj, form, change):
+        # Al almacén por contenido (miapp/documentos.py), igual que las subidas de la web
+        if 'archivo' in form.changed_data:
+            asignar_contenido(obj, form.cleaned_data['archivo'])
+        super().save_model(request, obj, form, change)
+
 # ==========================================
 # 4. CMS (WEB) - CORREGIDO AQUÍ
 # ==========================================
@@ -79,11 +206,15 @@ class PreguntaAdmin(admin.ModelAdmin):
 admin.site.register(PersonalAutorizado, PersonalAutorizadoAdmin)
 admin.site.register(PerfilUsuario, PerfilUsuarioAdmin)
 admin.site.register(MovimientoContable, MovimientoContableAdmin)
+admin.site.register(TasaCambio, TasaCambioAdmin)
 admin.site.register(Paciente, PacienteAdmin)
 admin.site.register(Cita, CitaAdmin)
+admin.site.register(Recordatorio, RecordatorioAdmin)
 admin.site.register(OrdenMedica, OrdenMedicaAdmin)
+admin.site.register(HorarioMedico, HorarioMedicoAdmin)
+admin.site.register(ExcepcionHorario, ExcepcionHorarioAdmin)
 admin.site.register(Especialidad)
-admin.site.register(Documento)
+admin.site.register(Documento, DocumentoAdmin)
 admin.site.register(CarruselImagen, CarruselAdmin)
 admin.site.register(PreguntaFrecuente, PreguntaAdmin)
 admin.site.register(AvisoImportante)
\ No newline at end of file
@@ -0,0 +1,231 @@
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError as ErrorDeValidacion
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import exceptions, status, viewsets
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import BasePermission, SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import PerfilUsuario
+from .paginacion import consulta_de_pagina, paginar_por_cursor
+from .reservas import reservar_cita, TurnoOcupado
+from .serializers import PacienteSerializer, CitaSerializer, OrdenMedicaSerializer, MovimientoContableSerializer
+
+# ==========================================
+# API REST /api/v1/ (PACIENTES, CITAS, ÓRDENES, LIBRO CONTABLE)
+# ==========================================
+# Para los clientes móviles y de recepción, que hasta ahora leían el HTML de las vistas.
+#  - Paginación por cursor (fecha, id) con ?despues= / ?antes= y ?tamano= (máx. 200).
+#  - ?fields=a,b: solo esos campos, y el SELECT solo con sus columnas (only()).
+#  - ETag: huella de las columnas que va a serializar (las de las relaciones incluidas), leídas
+#    de las mismas filas con values_list(). Con If-None-Match igual se responde 304 sin cargar
+#    los modelos ni serializar. Sale de la base y no de las versiones de la caché, que son
+#    por proceso y no ven update() ni los cambios de nombre de User.
+
+class Conflicto(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "El recurso cambió mientras se procesaba la petición."
+
+
+class PermisoPorRol(BasePermission):
+    """ vista.roles[lectura|creacion|modificacion]; el superusuario pasa siempre """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user.is_authenticated:
+            return False
+        if user.is_superuser:
+            return True
+        if request.method in SAFE_METHODS:
+            accion = 'lectura'
+        else:
+            accion = 'creacion' if request.method == 'POST' else 'modificacion'
+        rol = PerfilUsuario.objects.filter(usuario=user).values_list('rol', flat=True).first()
+        return rol in view.roles.get(accion, ())
+
+
+class PaginacionCursor(BasePagination):
+    """ paginar_por_cursor() de miapp/paginacion.py sobre el campo_cursor de la vista """
+    tamano = 50
+    tamano_maximo = 200
+
+    def tamano_pedido(self, request):
+        try:
+            return min(max(int(request.query_params.get('tamano', self.tamano)), 1), self.tamano_maximo)
+        except ValueError:
+            return self.tamano
+
+    def consulta(self, queryset, request, view):
+        """ Las filas de la página sin evaluar (para la huella del ETag) """
+        return consulta_de_pagina(queryset, view.campo_cursor, tamano=self.tamano_pedido(request),
+                                  despues=request.query_params.get('despues'), antes=request.query_params.get('antes'))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.pagina = paginar_por_cursor(
+            queryset, view.campo_cursor, tamano=self.tamano_pedido(request),
+            despues=request.query_params.get('despues'), antes=request.query_params.get('antes'),
+        )
+        return self.pagina['objetos']
+
+    def get_paginated_response(self, data):
+        return Response({
+            'siguiente': self._enlace('despues', self.pagina['siguiente']),
+            'anterior': self._enlace('antes', self.pagina['anterior']),
+            'resultados': data,
+        })
+
+    def _enlace(self, parametro, cursor):
+        if not cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'antes' if parametro == 'despues' else 'despues')
+        return replace_query_param(url, parametro, cursor)
+
+
+class RecursoApi(viewsets.ModelViewSet):
+    """ Base de los recursos: filtros exactos, campos parciales, ETag y sin DELETE (son registros clínicos) """
+    http_method_names = ['get', 'post', 'patch', 'head', 'options']
+    permission_classes = [PermisoPorRol]
+    pagination_class = PaginacionCursor
+    campo_cursor = 'fecha'
+    filtros = ()            # parámetros ?campo=valor aceptados (booleanos: true/false)
+    roles = {}
+
+    def campos_pedidos(self):
+        legibles = self.serializer_class.campos_legibles()
+        pedidos = self.request.query_params.get('fields')
+        if not pedidos:
+            return legibles
+        campos = [campo.strip() for campo in pedidos.split(',') if campo.strip()]
+        desconocidos = [campo for campo in campos if campo not in legibles]
+        if desconocidos:
+            raise exceptions.ValidationError({'fields': f"Campos desconocidos: {', '.join(desconocidos)}. "
+                                                        f"Disponibles: {', '.join(legibles)}."})
+        return campos
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method in SAFE_METHODS:
+            kwargs['campos'] = self.campos_pedidos()
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = self.serializer_class.Meta.model.objects.all()
+        if self.request.method in SAFE_METHODS:
+            columnas = self.serializer_class.columnas_para(self.campos_pedidos())
+            columnas.append(self.campo_cursor)
+        else:
+            columnas = self.serializer_class.columnas_para(self.serializer_class.campos_legibles())
+        relaciones = {columna.split('__')[0] for columna in columnas if '__' in columna}
+        if self.request.method in SAFE_METHODS:
+            queryset = queryset.only(*columnas)
+        queryset = queryset.select_related(*relaciones)
+
+        modelo = self.serializer_class.Meta.model
+        valores = {campo: self.request.query_params[campo] for campo in self.filtros if campo in self.request.query_params}
+        for campo, valor in valores.items():
+            if modelo._meta.get_field(campo).get_internal_type() == 'BooleanField':
+                valores[campo] = valor.lower() in ('1', 'true', 'si', 'sí')
+        try:
+            return queryset.filter(**valores)
+        except (ValueError, ErrorDeValidacion):
+            raise exceptions.ValidationError({'filtros': f"Valor inválido en {', '.join(valores)}."})
+
+    def etag(self, request):
+        """
+        Huella de lo que se va a responder, sin armarlo: las columnas de los campos pedidos de
+        las mismas filas (la de más de la página incluida: decide los enlaces), la URL y el día
+        ('edad' se calcula con la fecha de hoy). None si el objeto pedido no existe.
+        """
+        columnas = self.serializer_class.columnas_para(self.campos_pedidos()) + [self.campo_cursor]
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]})
+            except (ValueError, ErrorDeValidacion):
+                return None
+        else:
+            queryset = self.paginator.consulta(queryset, request, self)
+        filas = list(queryset.values_list(*columnas))
+        if self.action == 'retrieve' and not filas:
+            return None
+        huella = json.dumps([request.build_absolute_uri(), timezone.localdate(), filas],
+                            cls=encoders.JSONEncoder, separators=(',', ':'))
+        return f'"{hashlib.sha1(huella.encode()).hexdigest()}"'
+
+    def _condicional(self, request, generar):
+        # Si los datos cambian entre la huella y generar(), el cuerpo es más nuevo que el ETag:
+        # la próxima petición no coincide y recibe la página completa, nunca un 304 viejo
+        etag = self.etag(request)
+        response = (etag and get_conditional_response(request, etag=etag)) or generar()
+        if etag:
+            response['ETag'] = etag
+        # Cada cliente revalida siempre: el ETag le ahorra la descarga, no la pregunta
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._condicional(request, lambda: super(RecursoApi, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._condicional(request, lambda: super(RecursoApi, self).retrieve(request, *args, **kwargs))
+
+
+# ==========================================
+# RECURSOS
+# ==========================================
+
+PERSONAL_CLINICO = ('medico', 'secretaria', 'enfermera', 'gerente')
+
+class PacienteApi(RecursoApi):
+    serializer_class = PacienteSerializer
+    campo_cursor = 'fecha_registro'
+    filtros = ('cedula',)
+    roles = {'lectura': PERSONAL_CLINICO, 'creacion': ('medico', 'secretaria'), 'modificacion': ('medico', 'secretaria')}
+
+class CitaApi(RecursoApi):
+    serializer_class = CitaSerializer
+    filtros = ('paciente', 'medico', 'fecha', 'estado')
+    roles = {'lectura': PERSONAL_CLINICO, 'creacion': ('medico', 'secretaria'), 'modificacion': ('medico', 'secretaria')}
+
+    def create(self, request, *args, **kwargs):
+        """ Reserva con las mismas garantías que la web (miapp/reservas.py), cabecera Idempotency-Key incluida """
+        clave = request.headers.get('Idempotency-Key') or None
+        if clave and len(clave) > 64:
+            raise exceptions.ValidationError({'Idempotency-Key': "Máximo 64 caracteres."})
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            cita, creada = reservar_cita(serializer.validated_data, clave=clave)
+        except TurnoOcupado as e:
+            raise Conflicto(str(e))
+        return Response(self.get_serializer(cita).data, status=status.HTTP_201_CREATED if creada else status.HTTP_200_OK)
+
+class OrdenMedicaApi(RecursoApi):
+    serializer_class = OrdenMedicaSerializer
+    campo_cursor = 'fecha_creacion'
+    filtros = ('paciente', 'medico', 'ejecutada')
+    roles = {'lectura': ('medico', 'enfermera', 'gerente'), 'creacion': ('medico',), 'modificacion': ('medico', 'enfermera')}
+
+    def perform_create(self, serializer):
+        serializer.save(medico=self.request.user)
+
+    def perform_update(self, serializer):
+        # Como ejecutar_orden: quien la marca como ejecutada queda de responsable
+        if serializer.validated_data.get('ejecutada') and not serializer.instance.ejecutada:
+            serializer.save(enfermera_responsable=self.request.user, fecha_ejecucion=timezone.now())
+        else:
+            serializer.save()
+
+class MovimientoContableApi(RecursoApi):
+    serializer_class = MovimientoContableSerializer
+    filtros = ('tipo', 'fecha', 'es_divisa')
+    roles = {'lectura': ('contador', 'gerente'), 'creacion': ('contador', 'gerente'), 'modificacion': ('contador', 'gerente')}
+
+    def perform_create(self, serializer):
+        serializer.save(responsable=self.request.user)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MiappConfig(AppConfig):
     name = 'miapp'
+
+    def ready(self):
+        # Registra los receptores de señales (resumen contable, etc.)
+        from . import signals  # noqa: F401
@@ -0,0 +1,44 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+# ==========================================
+# CONSULTAS CONCURRENTES EN VISTAS ASYNC
+# ==========================================
+# Los métodos async del ORM (acount, aget, ...) corren todos en el único hilo
+# "thread_sensitive" de asgiref: un gather sobre ellos se ejecuta en fila. Para que
+# las consultas independientes de un dashboard se solapen de verdad, cada una va a
+# un hilo de este pool, que tiene su propia conexión. Antes y después de cada llamada
+# pasan por close_old_connections(), como hace Django al empezar y terminar una
+# petición: con CONN_MAX_AGE (config/settings_produccion.py) la conexión queda abierta
+# con su hilo (abrir una en cada llamada costaba más que la consulta misma), y con
+# CONN_HEALTH_CHECKS una conexión caída (reinicio de la base) se reemplaza en vez de fallar.
+# Lo que corre aquí no ve transacciones abiertas en la conexión de la petición.
+
+_ejecutor = None
+
+def _obtener_ejecutor():
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = ThreadPoolExecutor(max_workers=settings.CONSULTAS_HILOS, thread_name_prefix='consultas')
+    return _ejecutor
+
+def _con_conexiones_al_dia(funcion, *args, **kwargs):
+    close_old_connections()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+async def en_hilo(funcion, *args, **kwargs):
+    """ Ejecuta `funcion` (síncrona, que ya evalúe sus querysets) en un hilo del pool de consultas """
+    return await sync_to_async(_con_conexiones_al_dia, thread_sensitive=False, executor=_obtener_ejecutor())(
+        funcion, *args, **kwargs)
+
+async def consultas_concurrentes(**funciones):
+    """ {nombre: resultado} corriendo todas las funciones a la vez """
+    resultados = await asyncio.gather(*(en_hilo(funcion) for funcion in funciones.values()))
+    return dict(zip(funciones, resultados))
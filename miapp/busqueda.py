@@ -0,0 +1,106 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Paciente, TokenBusquedaPaciente
+from .paginacion import PaginaSimple
+
+# ==========================================
+# BÚSQUEDA DE PACIENTES (ÍNDICE DE TOKENS)
+# ==========================================
+# "Pérez" y "perez" se guardan igual: minúsculas y sin acentos. La cédula se
+# guarda solo con sus dígitos ("V-12.345.678" -> "12345678"). Buscar es una
+# consulta por rango sobre el índice (token, paciente), nunca un LIKE '%x%'.
+
+MAX_TERMINOS = 5
+TOPE_SELECTIVIDAD = 1000
+
+def normalizar(texto):
+    """ 'José Pérez' -> 'jose perez' """
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+def tokens(texto):
+    return re.findall(r'[a-z0-9]+', normalizar(texto))
+
+def tokens_paciente(paciente):
+    """ Palabras del nombre y apellido + los dígitos de la cédula """
+    resultado = set(tokens(paciente.nombre)) | set(tokens(paciente.apellido))
+    digitos = re.sub(r'\D', '', paciente.cedula or '')
+    if digitos:
+        resultado.add(digitos)
+    return {t[:100] for t in resultado}
+
+def indexar_paciente(paciente):
+    with transaction.atomic():
+        TokenBusquedaPaciente.objects.filter(paciente=paciente).delete()
+        TokenBusquedaPaciente.objects.bulk_create([
+            TokenBusquedaPaciente(paciente=paciente, token=t) for t in tokens_paciente(paciente)
+        ])
+
+def reindexar_pacientes(queryset=None, lote=2000):
+    """ Reconstruye el índice (todo, o solo el queryset dado) en lotes. Devuelve cuántos pacientes indexó """
+    queryset = queryset if queryset is not None else Paciente.objects.all()
+    total = 0
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), lote):
+        bloque = Paciente.objects.filter(id__in=ids[i:i + lote]).only('id', 'nombre', 'apellido', 'cedula')
+        with transaction.atomic():
+            TokenBusquedaPaciente.objects.filter(paciente_id__in=ids[i:i + lote]).delete()
+            TokenBusquedaPaciente.objects.bulk_create([
+                TokenBusquedaPaciente(paciente_id=p.id, token=t) for p in bloque for t in tokens_paciente(p)
+            ], batch_size=lote)
+        total += len(bloque)
+    return total
+
+CEDULA = re.compile(r'\s*(?:[VEJGPvejgp]\s*-?\s*)?\d[\d.\s-]*')
+
+def _terminos(consulta):
+    # Una cédula escrita con puntos o guiones se busca como en el índice: solo sus dígitos
+    if CEDULA.fullmatch(consulta or ''):
+        return [re.sub(r'\D', '', consulta)]
+    terminos = list(dict.fromkeys(tokens(consulta)))
+    # "V-123" -> ignoramos la letra suelta de la nacionalidad si hay más términos
+    if len(terminos) > 1:
+        terminos = [t for t in terminos if len(t) > 1] or terminos
+    return terminos[:MAX_TERMINOS]
+
+def _rango(termino, campo='token'):
+    """ Prefijo como rango: usa el índice y no depende de LIKE """
+    return Q(**{f'{campo}__gte': termino, f'{campo}__lt': termino + '\uffff'})
+
+def _termino_guia(terminos):
+    """ El término más selectivo guía la búsqueda; contamos con tope para no recorrer rangos enormes """
+    if len(terminos) == 1:
+        return terminos[0]
+    return min(terminos, key=lambda t: TokenBusquedaPaciente.objects.filter(_rango(t))[:TOPE_SELECTIVIDAD].count())
+
+def buscar_pacientes(consulta):
+    """
+    IDs de pacientes que tienen TODOS los términos como prefijo de alguna palabra, en orden de ranking:
+    primero la coincidencia exacta de la palabra, luego los prefijos más cercanos, y a igualdad los más recientes.
+    El orden (token, -paciente) lo entrega el índice, así que LIMIT corta sin ordenar todos los resultados.
+    """
+    terminos = _terminos(consulta)
+    if not terminos:
+        return TokenBusquedaPaciente.objects.none().values_list('paciente_id', flat=True)
+
+    guia = _termino_guia(terminos)
+    qs = TokenBusquedaPaciente.objects.filter(_rango(guia))
+    for termino in terminos:
+        if termino != guia:
+            qs = qs.filter(Exists(TokenBusquedaPaciente.objects.filter(_rango(termino), paciente_id=OuterRef('paciente_id'))))
+    # Cada paciente aparece una sola vez: en su palabra más cercana al término guía
+    qs = qs.exclude(Exists(TokenBusquedaPaciente.objects.filter(
+        paciente_id=OuterRef('paciente_id'), token__gte=guia, token__lt=OuterRef('token')
+    )))
+    return qs.order_by('token', '-paciente_id').values_list('paciente_id', flat=True)
+
+def pagina_de_busqueda(consulta, numero=1, por_pagina=25):
+    """ Página de objetos Paciente en el orden del ranking (sin COUNT del total) """
+    pagina = PaginaSimple(buscar_pacientes(consulta), numero, por_pagina)
+    pacientes = Paciente.objects.in_bulk(pagina.object_list)
+    pagina.object_list = [pacientes[i] for i in pagina.object_list if i in pacientes]
+    return pagina
@@ -0,0 +1,71 @@
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache_versiones import obtener_o_calcular, obtener_version, incrementar_version
+
+# ==========================================
+# CACHÉ DE PÁGINA COMPLETA PARA EL CMS
+# ==========================================
+# La portada solo cambia cuando alguien edita el carrusel, las FAQ o el aviso.
+# Guardamos el HTML ya renderizado bajo la versión del contenido CMS; las señales
+# de esos modelos suben la versión. En régimen estable un visitante anónimo no
+# toca la base de datos.
+
+VERSION_CMS = 'cms'
+CLAVE_MODIFICADO = 'cms:modificado'
+TIMEOUT_PAGINA = 60 * 60 * 24
+
+def version_cms():
+    """ (versión, timestamp de la última modificación) """
+    modificado = cache.get(CLAVE_MODIFICADO)
+    if modificado is None:
+        modificado = int(time.time())
+        cache.add(CLAVE_MODIFICADO, modificado, timeout=None)
+    return obtener_version(VERSION_CMS), modificado
+
+def invalidar_cms():
+    def subir():
+        incrementar_version(VERSION_CMS)
+        cache.set(CLAVE_MODIFICADO, int(time.time()), timeout=None)
+    transaction.on_commit(subir)
+
+def _tiene_mensajes(request):
+    """ Hay mensajes flash pendientes (p. ej. 'Cita agendada'): esa respuesta no se puede compartir """
+    if 'messages' in request.COOKIES:
+        return True
+    return hasattr(request, 'session') and bool(request.session.get('_messages'))
+
+def cache_pagina_cms(vista):
+    """ Decorador: cachea la respuesta anónima de la vista bajo la versión CMS, con ETag y Last-Modified """
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated or _tiene_mensajes(request):
+            return vista(request, *args, **kwargs)
+
+        version, modificado = version_cms()
+        etag = quote_etag(f"cms-{version}")
+
+        response = get_conditional_response(request, etag=etag, last_modified=modificado)
+        if response is None:
+            def renderizar():
+                original = vista(request, *args, **kwargs)
+                return (original.content, original['Content-Type'])
+
+            contenido, tipo = obtener_o_calcular(f"pagina:{request.path}:{version}", renderizar, TIMEOUT_PAGINA)
+            response = HttpResponse(contenido, content_type=tipo)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modificado)
+        # El navegador puede guardarla, pero debe revalidar (un 304 no cuesta nada)
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    return envoltura
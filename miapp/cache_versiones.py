@@ -0,0 +1,89 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# ==========================================
+# VERSIONES EN CACHÉ (INVALIDACIÓN POR CLAVE)
+# ==========================================
+# En vez de borrar claves una por una, cada grupo de datos tiene un número de
+# versión que forma parte de la clave. Subir la versión deja huérfanas las
+# entradas viejas (expiran solas). La versión inicial es un timestamp para que,
+# si la caché pierde el contador, nunca se reutilice una versión anterior.
+
+def _clave_version(nombre):
+    return f"version:{nombre}"
+
+def _version_nueva():
+    return int(time.time() * 1000)
+
+def obtener_version(nombre):
+    return obtener_versiones([nombre])[nombre]
+
+def obtener_versiones(nombres):
+    """ Varias versiones en un solo viaje a la caché """
+    claves = {_clave_version(n): n for n in nombres}
+    encontradas = cache.get_many(list(claves))
+    faltantes = {clave: _version_nueva() for clave in claves if clave not in encontradas}
+    for clave, valor in faltantes.items():
+        # add() no pisa un valor que otro proceso haya creado en paralelo
+        if not cache.add(clave, valor, timeout=None):
+            faltantes[clave] = cache.get(clave, valor)
+    encontradas.update(faltantes)
+    return {claves[clave]: valor for clave, valor in encontradas.items()}
+
+def incrementar_version(nombre):
+    clave = _clave_version(nombre)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        valor = _version_nueva()
+        cache.set(clave, valor, timeout=None)
+        return valor
+
+def incrementar_al_confirmar(nombre):
+    """ Sube la versión cuando la transacción termine; antes, otra petición podría cachear datos sin confirmar """
+    transaction.on_commit(lambda: incrementar_version(nombre))
+
+def nombre_de_modelo(modelo):
+    return f"modelo:{modelo._meta.label_lower}"
+
+
+# ==========================================
+# RECÁLCULO SIN ESTAMPIDA
+# ==========================================
+
+def obtener_o_calcular(clave, funcion, timeout=600, clave_respaldo=None, espera=2.0):
+    """
+    Devuelve cache[clave] o la calcula. Si muchas peticiones fallan a la vez, solo una
+    (la que obtiene el candado con cache.add) recalcula; las demás devuelven la copia
+    anterior (clave_respaldo) o esperan a que aparezca el valor nuevo.
+    """
+    valor = cache.get(clave)
+    if valor is not None:
+        return valor
+
+    candado = f"{clave}:calculando"
+    if cache.add(candado, 1, timeout=30):
+        try:
+            valor = funcion()
+            cache.set(clave, valor, timeout)
+            if clave_respaldo:
+                cache.set(clave_respaldo, valor, timeout=None)
+            return valor
+        finally:
+            cache.delete(candado)
+
+    if clave_respaldo:
+        valor = cache.get(clave_respaldo)
+        if valor is not None:
+            return valor
+
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        valor = cache.get(clave)
+        if valor is not None:
+            return valor
+    # El que calculaba tardó demasiado o murió: calculamos nosotros
+    return funcion()
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .cache_versiones import obtener_version, nombre_de_modelo
+from .models import MovimientoContable, ResumenContable, TasaCambio
+
+# Todo lo que no es 'ingreso' resta de la caja
+TIPOS_EGRESO = ['egreso', 'nomina', 'impuesto']
+
+CENTIMO = Decimal('0.01')
+CERO = Decimal('0')
+
+
+# ==========================================
+# 1. TASAS DE CAMBIO (BCV) Y CONVERSIÓN
+# ==========================================
+# Cada movimiento guarda la tasa con la que se registró: la de TasaCambio vigente en
+# su fecha, o una escrita a mano (tasa_manual). Si se carga o corrige una tasa, los
+# movimientos que la tomaron solos se vuelven a calcular (reasignar_tasas); los de
+# tasa manual no se tocan. El resumen lo suma convertido a las dos monedas.
+# Los paneles se guardan y consultan muchas veces con pocas fechas distintas: la tasa
+# de cada fecha se cachea en el proceso TASAS_VIGENCIA segundos, y antes si cambia la
+# versión de TasaCambio (signals.py la sube al guardar una tasa; con LocMemCache solo
+# en este proceso, de ahí el plazo). Una fecha sin tasa no se cachea: se carga tarde.
+
+TASAS_VIGENCIA = 60
+
+_tasas_por_fecha = {}
+_tasas_version = [None]
+_tasas_candado = threading.Lock()
+
+def convertir(monto, es_divisa, tasa):
+    """ (monto en Bs, monto en USD) de un movimiento con su tasa; sin tasa, la otra moneda queda en None """
+    monto = Decimal(str(monto))
+    if es_divisa:
+        return ((monto * tasa).quantize(CENTIMO) if tasa else None), monto
+    return monto, ((monto / tasa).quantize(CENTIMO) if tasa else None)
+
+def _sin_tasa(ves, usd):
+    return ves is None or usd is None
+
+def olvidar_tasas():
+    with _tasas_candado:
+        _tasas_por_fecha.clear()
+
+def tasa_del_dia(fecha):
+    """ La tasa BCV vigente en 'fecha' (la última publicada hasta ese día), o None si no hay ninguna """
+    version = obtener_version(nombre_de_modelo(TasaCambio))
+    with _tasas_candado:
+        if version != _tasas_version[0]:
+            _tasas_por_fecha.clear()
+            _tasas_version[0] = version
+        tasa, vence = _tasas_por_fecha.get(fecha, (None, 0))
+        if time.monotonic() < vence:
+            return tasa
+    tasa = TasaCambio.objects.filter(fecha__lte=fecha).order_by('-fecha').values_list('tasa', flat=True).first()
+    if tasa is not None:
+        with _tasas_candado:
+            _tasas_por_fecha[fecha] = (tasa, time.monotonic() + TASAS_VIGENCIA)
+    return tasa
+
+def reasignar_tasas(desde, hasta=None):
+    """
+    Movimientos sin tasa manual entre desde y hasta (excluido) cuya tasa ya no es la vigente: se
+    vuelven a guardar para que tomen la de la tabla y las señales corrijan el resumen. Devuelve cuántos cambiaron.
+    """
+    olvidar_tasas()
+    automaticos = MovimientoContable.objects.filter(tasa_manual=False, fecha__gte=desde)
+    if hasta:
+        automaticos = automaticos.filter(fecha__lt=hasta)
+    cambiados = 0
+    for pk, fecha, tasa in automaticos.values_list('pk', 'fecha', 'tasa_cambio').iterator():
+        if tasa == (tasa_del_dia(fecha) or 0):
+            continue
+        with transaction.atomic():
+            # Releída con candado: mientras tanto alguien pudo escribirle una tasa a mano,
+            # cambiarle la fecha o borrarla, y guardar la copia vieja lo desharía
+            movimiento = MovimientoContable.objects.select_for_update().filter(pk=pk, tasa_manual=False).first()
+            if movimiento is None or movimiento.tasa_cambio == (tasa_del_dia(movimiento.fecha) or 0):
+                continue
+            movimiento.save(update_fields=['tasa_cambio', 'tasa_manual'])
+        cambiados += 1
+    return cambiados
+
+def asignar_tasas_en_bloque():
+    """ Carga histórica: una UPDATE por tasa para todos los movimientos sin tasa de su periodo; luego reconstruir_resumen() """
+    tasas = list(TasaCambio.objects.order_by('fecha').values_list('fecha', 'tasa'))
+    actualizados = 0
+    for i, (fecha, tasa) in enumerate(tasas):
+        periodo = MovimientoContable.objects.filter(tasa_cambio=0, fecha__gte=fecha)
+        if i + 1 < len(tasas):
+            periodo = periodo.filter(fecha__lt=tasas[i + 1][0])
+        actualizados += periodo.update(tasa_cambio=tasa)
+    return actualizados
+
+
+# ==========================================
+# 2. MANTENIMIENTO INCREMENTAL DEL RESUMEN
+# ==========================================
+
+def _periodos(fecha):
+    """ Cada movimiento cae en una fila diaria y en una mensual """
+    return [('dia', fecha), ('mes', fecha.replace(day=1))]
+
+def aplicar_movimiento(fecha, tipo, es_divisa, monto, tasa, signo=1):
+    """ Suma (signo=1) o resta (signo=-1) un movimiento de las filas de resumen que le tocan """
+    ves, usd = convertir(monto, es_divisa, tasa)
+    valores = {
+        'total': Decimal(str(monto)) * signo,
+        'total_ves': (ves or CERO) * signo,
+        'total_usd': (usd or CERO) * signo,
+        'sin_tasa': signo if _sin_tasa(ves, usd) else 0,
+        'cantidad': signo,
+    }
+    sumar = {campo: F(campo) + valor for campo, valor in valores.items()}
+    with transaction.atomic():
+        for periodo, fecha_periodo in _periodos(fecha):
+            filtro = {'periodo': periodo, 'fecha': fecha_periodo, 'tipo': tipo, 'es_divisa': es_divisa}
+            actualizadas = ResumenContable.objects.filter(**filtro).update(**sumar)
+            if actualizadas:
+                continue
+            try:
+                # La fila aún no existe: la creamos (otro proceso pudo ganarnos la carrera)
+                with transaction.atomic():
+                    ResumenContable.objects.create(**valores, **filtro)
+            except IntegrityError:
+                ResumenContable.objects.filter(**filtro).update(**sumar)
+
+def reconstruir_resumen(lote=5000):
+    """
+    Recalcula todo el resumen desde el libro. Necesario tras bulk_create/update() que no disparan
+    señales. Convierte fila por fila, igual que aplicar_movimiento: agrupar primero y convertir
+    la suma redondearía distinto (y en SQLite la división entre DECIMAL es entera).
+    """
+    acumulado = defaultdict(lambda: [CERO, CERO, CERO, 0, 0])
+    movimientos = MovimientoContable.objects.values_list('fecha', 'tipo', 'es_divisa', 'monto', 'tasa_cambio')
+    with transaction.atomic():
+        for fecha, tipo, es_divisa, monto, tasa in movimientos.iterator(chunk_size=lote):
+            ves, usd = convertir(monto, es_divisa, tasa)
+            for periodo, fecha_periodo in _periodos(fecha):
+                fila = acumulado[(periodo, fecha_periodo, tipo, es_divisa)]
+                fila[0] += monto
+                fila[1] += ves or CERO
+                fila[2] += usd or CERO
+                fila[3] += _sin_tasa(ves, usd)
+                fila[4] += 1
+
+        ResumenContable.objects.all().delete()
+        ResumenContable.objects.bulk_create([
+            ResumenContable(periodo=periodo, fecha=fecha, tipo=tipo, es_divisa=es_divisa, total=total,
+                            total_ves=ves, total_usd=usd, sin_tasa=sin_tasa, cantidad=cantidad)
+            for (periodo, fecha, tipo, es_divisa), (total, ves, usd, sin_tasa, cantidad) in acumulado.items()
+        ], batch_size=500)
+    return len(acumulado)
+
+
+# ==========================================
+# 3. LECTURA PARA LOS DASHBOARDS
+# ==========================================
+
+def totales_contables():
+    """
+    Ingresos, egresos y balance en dólares (lo que muestran los paneles) y en bolívares, y el
+    detalle por tipo. Una consulta agrupada por tipo sobre las filas mensuales (unas pocas por año).
+    """
+    filas = ResumenContable.objects.filter(periodo='mes').values('tipo').annotate(
+        ves=Sum('total_ves'), usd=Sum('total_usd'), sin_tasa=Sum('sin_tasa'),
+    ).order_by()
+    por_tipo = {r['tipo']: r for r in filas}
+
+    def total(moneda, tipos):
+        return sum((por_tipo[t][moneda] or CERO for t in tipos if t in por_tipo), CERO)
+
+    ingresos_usd, egresos_usd = total('usd', ['ingreso']), total('usd', TIPOS_EGRESO)
+    ingresos_ves, egresos_ves = total('ves', ['ingreso']), total('ves', TIPOS_EGRESO)
+
+    # Redondeo en Python (la plantilla muestra el valor tal cual)
+    return {
+        'ingresos': round(ingresos_usd, 2),
+        'egresos': round(egresos_usd, 2),
+        'balance': round(ingresos_usd - egresos_usd, 2),
+        'ingresos_ves': round(ingresos_ves, 2),
+        'egresos_ves': round(egresos_ves, 2),
+        'balance_ves': round(ingresos_ves - egresos_ves, 2),
+        'sin_tasa': sum(r['sin_tasa'] or 0 for r in por_tipo.values()),
+        'por_tipo': [
+            {'tipo': tipo, 'nombre': nombre, 'usd': round(por_tipo[tipo]['usd'] or CERO, 2),
+             'ves': round(por_tipo[tipo]['ves'] or CERO, 2)}
+            for tipo, nombre in MovimientoContable.TIPOS if tipo in por_tipo
+        ],
+    }
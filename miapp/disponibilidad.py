@@ -0,0 +1,168 @@
+import datetime
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+
+from .models import Cita, HorarioMedico, ExcepcionHorario
+
+# ==========================================
+# DISPONIBILIDAD DE MÉDICOS (TURNOS LIBRES)
+# ==========================================
+# Los turnos salen de HorarioMedico (plantilla semanal). Lo ocupado de cada
+# médico/día se carga con DOS consultas por rango (citas y excepciones) para todo
+# el horizonte pedido y se guarda en un índice de intervalos en memoria; luego
+# cada turno candidato se comprueba con una búsqueda binaria, sin tocar la base.
+
+ESTADOS_QUE_LIBERAN = ['cancelada']  # una cita cancelada no ocupa el turno
+HORIZONTE_DIAS = 60
+DIAS_POR_CARGA = 7
+DURACION_SIN_HORARIO = 30            # médicos sin plantilla: se asume esta duración por cita
+
+Turno = namedtuple('Turno', 'medico_id medico especialidad fecha hora duracion')
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+def _hora(minutos):
+    return datetime.time(minutos // 60, minutos % 60)
+
+
+class IndiceIntervalos:
+    """ Intervalos ocupados [inicio, fin) en minutos del día, fusionados y ordenados """
+
+    def __init__(self, intervalos=()):
+        self.inicios, self.fines = [], []
+        for inicio, fin in sorted(intervalos):
+            if self.fines and inicio <= self.fines[-1]:
+                self.fines[-1] = max(self.fines[-1], fin)
+            else:
+                self.inicios.append(inicio)
+                self.fines.append(fin)
+
+    def libre(self, inicio, fin):
+        # El último intervalo que empieza antes de `fin` es el único que puede solaparse
+        i = bisect_right(self.inicios, fin - 1) - 1
+        return i < 0 or self.fines[i] <= inicio
+
+    def __len__(self):
+        return len(self.inicios)
+
+
+Bloque = namedtuple('Bloque', 'medico_id dia_semana hora_inicio hora_fin duracion_turno medico especialidad')
+
+def _horarios(medico_ids=None, especialidad=None):
+    """ {medico_id: {dia_semana: [Bloque, ...]}} de médicos activos (tuplas: sin instanciar modelos) """
+    horarios = HorarioMedico.objects.filter(activo=True, medico__is_active=True, medico__perfilusuario__rol='medico')
+    if medico_ids is not None:
+        horarios = horarios.filter(medico_id__in=medico_ids)
+    if especialidad is not None:
+        horarios = horarios.filter(medico__perfilusuario__especialidad=especialidad)
+
+    por_medico = defaultdict(lambda: defaultdict(list))
+    for fila in horarios.values_list(
+        'medico_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_turno',
+        'medico__first_name', 'medico__last_name', 'medico__perfilusuario__especialidad__nombre',
+    ):
+        medico_id, dia, inicio, fin, duracion, nombre, apellido, nombre_especialidad = fila
+        por_medico[medico_id][dia].append(Bloque(
+            medico_id, dia, inicio, fin, duracion,
+            f"Dr(a). {nombre} {apellido}".strip(), nombre_especialidad or "Medicina General",
+        ))
+    return por_medico
+
+def _duraciones(horarios_por_medico):
+    """ Duración del turno de cada médico/día de la semana (la del primer bloque) """
+    return {
+        (medico_id, dia): bloques[0].duracion_turno
+        for medico_id, dias in horarios_por_medico.items() for dia, bloques in dias.items()
+    }
+
+def cargar_indices(medico_ids, desde, hasta, duraciones=None, excluir_cita_id=None):
+    """ {(medico_id, fecha): IndiceIntervalos} con citas activas y excepciones entre desde y hasta """
+    duraciones = duraciones or {}
+    ocupado = defaultdict(list)
+
+    citas = Cita.objects.filter(
+        medico_id__in=medico_ids, fecha__range=(desde, hasta)
+    ).exclude(estado__in=ESTADOS_QUE_LIBERAN)
+    if excluir_cita_id is not None:
+        # Al editar una cita, su propio turno no cuenta como ocupado
+        citas = citas.exclude(pk=excluir_cita_id)
+    citas = citas.values_list('medico_id', 'fecha', 'hora')
+    for medico_id, fecha, hora in citas:
+        inicio = _minutos(hora)
+        duracion = duraciones.get((medico_id, fecha.weekday()), DURACION_SIN_HORARIO)
+        ocupado[(medico_id, fecha)].append((inicio, inicio + duracion))
+
+    excepciones = ExcepcionHorario.objects.filter(
+        medico_id__in=medico_ids, fecha__range=(desde, hasta)
+    ).values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+    for medico_id, fecha, hora_inicio, hora_fin in excepciones:
+        if hora_inicio and hora_fin:
+            ocupado[(medico_id, fecha)].append((_minutos(hora_inicio), _minutos(hora_fin)))
+        else:
+            ocupado[(medico_id, fecha)].append((0, 24 * 60))
+
+    return {clave: IndiceIntervalos(intervalos) for clave, intervalos in ocupado.items()}
+
+def _turnos_del_bloque(bloque):
+    """ Minuto de inicio de cada turno de un HorarioMedico (o Bloque) """
+    inicio, fin, paso = _minutos(bloque.hora_inicio), _minutos(bloque.hora_fin), bloque.duracion_turno
+    return range(inicio, fin - paso + 1, paso)
+
+def turnos_libres(especialidad=None, medico=None, desde=None, cantidad=10, dias=HORIZONTE_DIAS, ahora=None):
+    """ Los próximos `cantidad` turnos libres (de todos los médicos, o de uno / una especialidad), en orden """
+    ahora = ahora or datetime.datetime.now()
+    desde = max(desde or ahora.date(), ahora.date())
+    hasta = desde + datetime.timedelta(days=dias)
+
+    horarios = _horarios([medico.pk] if medico else None, especialidad)
+    if not horarios:
+        return []
+    duraciones = _duraciones(horarios)
+    vacio = IndiceIntervalos()
+
+    resultado = []
+    fecha = desde
+    while fecha <= hasta and len(resultado) < cantidad:
+        # Cargamos lo ocupado por semanas: casi siempre la primera alcanza
+        if (fecha - desde).days % DIAS_POR_CARGA == 0:
+            fin_carga = min(fecha + datetime.timedelta(days=DIAS_POR_CARGA - 1), hasta)
+            indices = cargar_indices(list(horarios), fecha, fin_carga, duraciones)
+        minimo = _minutos(ahora.time()) + 1 if fecha == ahora.date() else 0
+        candidatos = []
+        for medico_id, dias_semana in horarios.items():
+            indice = indices.get((medico_id, fecha), vacio)
+            for bloque in dias_semana.get(fecha.weekday(), []):
+                for inicio in _turnos_del_bloque(bloque):
+                    if inicio >= minimo and indice.libre(inicio, inicio + bloque.duracion_turno):
+                        candidatos.append((inicio, bloque))
+        candidatos.sort(key=lambda c: (c[0], c[1].medico))
+        for inicio, bloque in candidatos[:cantidad - len(resultado)]:
+            resultado.append(Turno(bloque.medico_id, bloque.medico, bloque.especialidad,
+                                   fecha, _hora(inicio), bloque.duracion_turno))
+        fecha += datetime.timedelta(days=1)
+    return resultado
+
+def validar_turno(medico, fecha, hora, excluir_cita_id=None, ahora=None):
+    """ None si el turno se puede reservar; si no, el motivo (para mostrarlo en el formulario) """
+    ahora = ahora or datetime.datetime.now()
+    if datetime.datetime.combine(fecha, hora) <= ahora:
+        return "La fecha y hora deben ser futuras."
+
+    plantilla = list(HorarioMedico.objects.filter(medico=medico, activo=True))
+    bloques = [b for b in plantilla if b.dia_semana == fecha.weekday()]
+    inicio = _minutos(hora)
+    if plantilla:
+        bloque = next((b for b in bloques if inicio in _turnos_del_bloque(b)), None)
+        if bloque is None:
+            return "El médico no atiende a esa hora. Elija uno de los turnos disponibles."
+        duracion = bloque.duracion_turno
+    else:
+        # Médico sin plantilla cargada: solo evitamos choques con otras citas
+        duracion = DURACION_SIN_HORARIO
+
+    indices = cargar_indices([medico.pk], fecha, fecha, {(medico.pk, fecha.weekday()): duracion}, excluir_cita_id)
+    if not indices.get((medico.pk, fecha), IndiceIntervalos()).libre(inicio, inicio + duracion):
+        return "Ese turno ya está ocupado. Elija otro horario."
+    return None
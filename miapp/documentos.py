@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .models import ContenidoArchivo, Documento, SubidaDocumento
+
+# ==========================================
+# DOCUMENTOS DE PACIENTES: ALMACÉN POR CONTENIDO
+# ==========================================
+# Cada archivo se guarda una sola vez, con el SHA-256 de sus bytes como nombre
+# (documentos/ab/cd/<sha256>.pdf). El mismo resultado de laboratorio subido dos
+# veces, o para dos pacientes, crea dos Documento que apuntan al mismo
+# ContenidoArchivo. El contenido no se borra mientras algún documento lo use
+# (PROTECT); los huérfanos los retira el comando limpiar_subidas.
+
+BLOQUE = 1024 * 1024
+ROLES_DOCUMENTOS = ('medico', 'secretaria', 'enfermera', 'gerente')
+
+
+class ErrorDeSubida(Exception):
+    """ estado: código HTTP con el que responder """
+
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class _ArchivoEnDisco(File):
+    """
+    Un archivo que ya está en disco. Con temporary_file_path() FileSystemStorage lo mueve
+    en vez de copiarlo, como hace con las subidas grandes de Django.
+    """
+
+    def __init__(self, ruta):
+        super().__init__(open(ruta, 'rb'), name=ruta)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def huella_archivo(archivo):
+    """ SHA-256 leyendo por bloques; deja el archivo al principio """
+    archivo.seek(0)
+    sha = hashlib.sha256()
+    for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+        sha.update(bloque)
+    archivo.seek(0)
+    return sha.hexdigest()
+
+def _ruta_contenido(huella, nombre):
+    extension = os.path.splitext(nombre)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,8}', extension):
+        extension = ''
+    return f"documentos/{huella[:2]}/{huella[2:4]}/{huella}{extension}"
+
+def almacenar(archivo, nombre, huella=None):
+    """ (ContenidoArchivo, nuevo): guarda los bytes solo si ese contenido no estaba ya """
+    huella = huella or huella_archivo(archivo)
+    existente = ContenidoArchivo.objects.filter(huella=huella).first()
+    if existente:
+        return existente, False
+    tamano = archivo.size  # antes de guardar: _ArchivoEnDisco se mueve
+    guardado = default_storage.save(_ruta_contenido(huella, nombre), archivo)
+    try:
+        with transaction.atomic():
+            return ContenidoArchivo.objects.create(huella=huella, archivo=guardado, tamano=tamano), True
+    except IntegrityError:
+        # El mismo contenido terminó de subirse en otra petición justo antes: se usa ese
+        ganador = ContenidoArchivo.objects.get(huella=huella)
+        if guardado != ganador.archivo.name:
+            default_storage.delete(guardado)
+        return ganador, False
+
+def asignar_contenido(documento, archivo, nombre=None):
+    """ Apunta el documento (sin guardarlo) al contenido de archivo, almacenándolo si es nuevo """
+    nombre = nombre or archivo.name
+    contenido, nuevo = almacenar(archivo, nombre)
+    documento.contenido = contenido
+    documento.archivo = contenido.archivo.name
+    documento.nombre_original = os.path.basename(nombre)[:255]
+    return nuevo
+
+
+# ==========================================
+# SUBIDAS POR PARTES, REANUDABLES
+# ==========================================
+# Un estudio de imágenes de cientos de MB en una sola petición se pierde entero si
+# se corta la conexión, y Django lo copia a un temporal antes de que la vista lo vea.
+# El cliente abre una SubidaDocumento (nombre, tamaño, SHA-256 opcional) y envía
+# fragmentos con PUT + Content-Range: bytes inicio-fin/total. Cada fragmento se
+# escribe directo a SUBIDAS_DIR/<id>.part mientras llega. Si la conexión se cae a
+# mitad de un fragmento, lo que alcanzó a llegar queda contado: GET de la subida
+# dice cuántos bytes hay y el cliente sigue desde ahí. Con el último byte se calcula
+# la huella, el archivo pasa al almacén y se crea el Documento.
+
+def ruta_parcial(subida):
+    return os.path.join(settings.SUBIDAS_DIR, f"{subida.pk}.part")
+
+def _rango(cabecera, tamano):
+    """ 'bytes 0-99/1000' -> (0, 99) """
+    coincidencia = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', (cabecera or '').strip())
+    if not coincidencia:
+        raise ErrorDeSubida("Falta la cabecera Content-Range: bytes inicio-fin/total.")
+    inicio, fin, total = map(int, coincidencia.groups())
+    if total != tamano or fin < inicio or fin >= tamano:
+        raise ErrorDeSubida(f"Rango {inicio}-{fin}/{total} fuera del archivo de {tamano} bytes.", 416)
+    return inicio, fin
+
+def recibir_fragmento(subida, content_range, flujo):
+    """ Escribe el fragmento que llega por flujo (la petición) y devuelve los bytes recibidos en total """
+    inicio, fin = _rango(content_range, subida.tamano)
+    if inicio != subida.recibidos:
+        raise ErrorDeSubida(f"Se esperaba el byte {subida.recibidos}.", 409)
+
+    ruta = ruta_parcial(subida)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    pendientes, escritos, cortado = fin - inicio + 1, 0, False
+    # Sin truncar: si el mismo fragmento llega dos veces a la vez, ambos escriben los mismos bytes
+    with open(ruta, 'r+b' if os.path.exists(ruta) else 'wb') as parte:
+        parte.seek(inicio)
+        try:
+            while escritos < pendientes:
+                bloque = flujo.read(min(BLOQUE, pendientes - escritos))
+                if not bloque:
+                    break
+                parte.write(bloque)
+                escritos += len(bloque)
+        except UnreadablePostError:
+            cortado = True
+
+    # Solo avanza quien partió del valor esperado; la base no queda bloqueada mientras llegan los bytes
+    avanzo = SubidaDocumento.objects.filter(pk=subida.pk, recibidos=inicio).update(
+        recibidos=inicio + escritos, fecha_modificacion=timezone.now()
+    )
+    if not avanzo:
+        subida.refresh_from_db(fields=['recibidos'])
+        raise ErrorDeSubida(f"Se esperaba el byte {subida.recibidos}.", 409)
+    subida.recibidos = inicio + escritos
+    if cortado or escritos < pendientes:
+        raise ErrorDeSubida(f"Fragmento incompleto: se recibieron {escritos} de {pendientes} bytes.")
+    return subida.recibidos
+
+def completar_subida(subida):
+    """ (Documento, duplicado) con la subida ya completa; borra la subida """
+    ruta = ruta_parcial(subida)
+    with open(ruta, 'rb') as parte:
+        huella = huella_archivo(parte)
+    if subida.sha256 and subida.sha256 != huella:
+        descartar_subida(subida)
+        raise ErrorDeSubida("El archivo recibido no coincide con el SHA-256 declarado. Vuelva a subirlo.", 422)
+
+    with transaction.atomic():
+        with _ArchivoEnDisco(ruta) as archivo:
+            contenido, nuevo = almacenar(archivo, subida.nombre_original, huella)
+        documento = Documento.objects.create(
+            paciente_id=subida.paciente_id, descripcion=subida.descripcion, contenido=contenido,
+            archivo=contenido.archivo.name, nombre_original=subida.nombre_original,
+        )
+        subida.delete()
+    if os.path.exists(ruta):  # duplicado, o un almacenamiento que copia en vez de mover
+        os.remove(ruta)
+    return documento, not nuevo
+
+def descartar_subida(subida):
+    ruta = ruta_parcial(subida)
+    subida.delete()
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+
+# ==========================================
+# MANTENIMIENTO
+# ==========================================
+
+def descartar_subidas_vencidas(horas=None):
+    """ Subidas sin fragmentos nuevos en SUBIDAS_VIGENCIA_HORAS; devuelve cuántas """
+    limite = timezone.now() - datetime.timedelta(hours=horas or settings.SUBIDAS_VIGENCIA_HORAS)
+    vencidas = list(SubidaDocumento.objects.filter(fecha_modificacion__lt=limite))
+    for subida in vencidas:
+        descartar_subida(subida)
+    return len(vencidas)
+
+def purgar_contenidos_huerfanos():
+    """ Contenidos que ya ningún documento usa (se borraron los documentos); devuelve (cantidad, bytes) """
+    cantidad = liberados = 0
+    for contenido in ContenidoArchivo.objects.filter(documento__isnull=True).iterator():
+        # Se vuelve a comprobar al borrar: un documento pudo tomarlo mientras tanto
+        if not ContenidoArchivo.objects.filter(pk=contenido.pk, documento__isnull=True).delete()[0]:
+            continue
+        default_storage.delete(contenido.archivo.name)
+        if contenido.vista_previa:
+            default_storage.delete(contenido.vista_previa.name)
+        cantidad += 1
+        liberados += contenido.tamano
+    return cantidad, liberados
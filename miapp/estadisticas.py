@@ -0,0 +1,60 @@
+import datetime
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .asincrono import consultas_concurrentes
+from .cache_versiones import obtener_versiones, obtener_o_calcular, nombre_de_modelo
+from .contabilidad import totales_contables
+from .models import Paciente, Cita, PerfilUsuario, MovimientoContable
+
+# ==========================================
+# ESTADÍSTICAS DEL DASHBOARD DE DIRECCIÓN
+# ==========================================
+# Cada dato se cachea por separado con la versión del modelo del que depende:
+# registrar un pago solo recalcula las finanzas, no el conteo de pacientes.
+
+TIMEOUT = getattr(settings, 'ESTADISTICAS_CACHE_TIMEOUT', 600)
+
+def _partes(hoy):
+    """ nombre -> (modelo del que depende, función que lo calcula) """
+    return {
+        'total_pacientes': (Paciente, lambda: Paciente.objects.count()),
+        'medicos_count': (PerfilUsuario, lambda: PerfilUsuario.objects.filter(rol='medico').count()),
+        'citas_hoy': (Cita, lambda: Cita.objects.filter(fecha=hoy).count()),
+        'finanzas': (MovimientoContable, totales_contables),
+    }
+
+def _desde_cache(hoy):
+    """ (lo que ya está en caché, {nombre: función que calcula y cachea lo que falta}) """
+    partes = _partes(hoy)
+    versiones = obtener_versiones([nombre_de_modelo(modelo) for modelo, _ in partes.values()])
+
+    claves = {
+        nombre: f"estadisticas:{nombre}:{versiones[nombre_de_modelo(modelo)]}:{hoy.isoformat()}"
+        for nombre, (modelo, _) in partes.items()
+    }
+    en_cache = cache.get_many(list(claves.values()))
+
+    resultado, faltantes = {}, {}
+    for nombre, (modelo, funcion) in partes.items():
+        clave = claves[nombre]
+        if clave in en_cache:
+            resultado[nombre] = en_cache[clave]
+        else:
+            faltantes[nombre] = partial(obtener_o_calcular, clave, funcion, TIMEOUT,
+                                        clave_respaldo=f"estadisticas:{nombre}:ultima:{hoy.isoformat()}")
+    return resultado, faltantes
+
+def estadisticas_admin():
+    resultado, faltantes = _desde_cache(datetime.date.today())
+    for nombre, calcular in faltantes.items():
+        resultado[nombre] = calcular()
+    return resultado
+
+async def estadisticas_admin_async():
+    """ Igual, pero lo que falta en caché (conteos, finanzas) se calcula a la vez """
+    resultado, faltantes = _desde_cache(datetime.date.today())
+    resultado.update(await consultas_concurrentes(**faltantes))
+    return resultado
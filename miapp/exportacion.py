@@ -0,0 +1,252 @@
+import csv
+import datetime
+import io
+import logging
+import re
+import zipfile
+from collections import deque
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.text import get_valid_filename
+
+from .contabilidad import convertir
+from .models import Paciente, Cita, OrdenMedica, MovimientoContable
+from .pdf import solicitar_pdf, esperar_pdf, ruta_pdf, ESTADO_LISTO
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# EXPORTACIÓN MASIVA DE HISTORIAS CLÍNICAS
+# ==========================================
+# Para auditorías y aseguradoras: un PDF por paciente dentro de un ZIP.
+# El proceso web solo consulta la base (por lotes, sin N+1) y arma el HTML; el
+# render va al pool de miapp/pdf.py, que deja cada PDF en su caché de disco.
+# El ZIP se escribe leyendo esos archivos uno a uno, así que en memoria nunca
+# hay más que una ventana de documentos en vuelo.
+
+LOTE_CONSULTA = 200
+
+def _pacientes_con_historial(paciente_ids):
+    for inicio in range(0, len(paciente_ids), LOTE_CONSULTA):
+        lote = paciente_ids[inicio:inicio + LOTE_CONSULTA]
+        pacientes = Paciente.objects.filter(id__in=lote).prefetch_related(
+            Prefetch('cita_set', queryset=Cita.objects.select_related('medico').order_by('fecha', 'hora')),
+            Prefetch('ordenmedica_set', queryset=OrdenMedica.objects.select_related(
+                'medico', 'enfermera_responsable').order_by('fecha_creacion')),
+            'documento_set',
+        ).in_bulk()
+        for paciente_id in lote:
+            if paciente_id in pacientes:
+                yield pacientes[paciente_id]
+
+def html_historial(paciente, fecha_emision=None):
+    return render_to_string('miapp/historial_pdf.html', {
+        'paciente': paciente,
+        'citas': paciente.cita_set.all(),
+        'ordenes': paciente.ordenmedica_set.all(),
+        'documentos': paciente.documento_set.all(),
+        'fecha_emision': fecha_emision or datetime.date.today(),
+    })
+
+def nombre_archivo(paciente):
+    return get_valid_filename(f"{paciente.cedula}_{paciente.apellido}_{paciente.nombre}.pdf")
+
+def historiales_renderizados(paciente_ids):
+    """ Genera (paciente, huella o None si falló) en orden, con hasta 2×PDF_PROCESOS renders en vuelo """
+    ventana = max(2 * settings.PDF_PROCESOS, 1)
+    en_vuelo = deque()
+    fecha_emision = datetime.date.today()
+
+    for paciente in _pacientes_con_historial(list(paciente_ids)):
+        en_vuelo.append((paciente, solicitar_pdf(html_historial(paciente, fecha_emision))))
+        if len(en_vuelo) >= ventana:
+            yield _esperar(*en_vuelo.popleft())
+    while en_vuelo:
+        yield _esperar(*en_vuelo.popleft())
+
+def _esperar(paciente, huella):
+    if esperar_pdf(huella, timeout=None) == ESTADO_LISTO:
+        return paciente, huella
+    logger.error("No se pudo generar la historia clínica de %s", paciente.cedula)
+    return paciente, None
+
+def _escribir_historiales(salida, paciente_ids):
+    """ Escribe el ZIP en `salida` y cede (hechos, total, fallidos) después de cada paciente """
+    paciente_ids = list(paciente_ids)
+    total, fallidos = len(paciente_ids), []
+    # Los PDF ya vienen comprimidos: ZIP_STORED evita gastar CPU en recomprimirlos
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for hechos, (paciente, huella) in enumerate(historiales_renderizados(paciente_ids), 1):
+            if huella:
+                archivo_zip.write(ruta_pdf(huella), arcname=nombre_archivo(paciente))
+            else:
+                fallidos.append(paciente.cedula)
+            yield hechos, total, fallidos
+        if fallidos:
+            archivo_zip.writestr('ERRORES.txt', "No se pudo generar la historia de:\n" + "\n".join(fallidos) + "\n")
+
+def escribir_zip(salida, paciente_ids, progreso=None):
+    """ ZIP a un archivo. progreso(hechos, total) tras cada paciente. Devuelve las cédulas que fallaron. """
+    fallidos = []
+    for hechos, total, fallidos in _escribir_historiales(salida, paciente_ids):
+        if progreso:
+            progreso(hechos, total)
+    return fallidos
+
+
+class _Tubo:
+    """ Objeto tipo archivo sin seek: acumula lo escrito hasta que alguien lo vacía """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos, self.partes = b''.join(self.partes), []
+        return datos
+
+def zip_en_streaming(paciente_ids, progreso=None):
+    """ Bytes del ZIP para StreamingHttpResponse: cada PDF sale al cliente en cuanto está listo """
+    tubo = _Tubo()
+    for hechos, total, _ in _escribir_historiales(tubo, paciente_ids):
+        if progreso:
+            progreso(hechos, total)
+        yield tubo.vaciar()
+    yield tubo.vaciar()  # directorio central del ZIP
+
+
+# ==========================================
+# EXPORTACIÓN DEL LIBRO CONTABLE (CSV / XLSX)
+# ==========================================
+# Para las declaraciones ante el SENIAT: años de libro sin que crezca la memoria
+# del worker. La consulta se recorre con iterator(chunk_size) (en PostgreSQL es un
+# cursor del lado del servidor) como tuplas, sin crear objetos del modelo, y cada
+# bloque de filas se envía al cliente antes de leer el siguiente.
+# El XLSX se escribe a mano (openpyxl no es dependencia): un ZIP en streaming con
+# una sola hoja; los números y fechas van como celdas numéricas para que Excel
+# sume y ordene sin importar la configuración regional.
+
+LOTE_LIBRO = 2000
+
+COLUMNAS_LIBRO = ['Fecha', 'Tipo', 'Concepto', 'Referencia', 'Moneda', 'Monto', 'Tasa BCV',
+                  'Monto Bs', 'Monto USD', 'Responsable']
+
+def filas_libro(movimientos, lote=LOTE_LIBRO):
+    """ Tuplas en el orden de COLUMNAS_LIBRO, del más antiguo al más reciente """
+    tipos = dict(MovimientoContable.TIPOS)
+    consulta = movimientos.order_by('fecha', 'id').values_list(
+        'fecha', 'tipo', 'descripcion', 'referencia', 'es_divisa', 'monto', 'tasa_cambio', 'responsable__username'
+    )
+    for fecha, tipo, descripcion, referencia, es_divisa, monto, tasa, responsable in consulta.iterator(chunk_size=lote):
+        monto_bs, monto_usd = convertir(monto, es_divisa, tasa)
+        yield (fecha, tipos.get(tipo, tipo), descripcion, referencia, 'USD' if es_divisa else 'Bs', monto,
+               tasa or None, monto_bs, monto_usd, responsable or '')
+
+def _en_bloques(filas, lote):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= lote:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+def libro_csv(movimientos, lote=LOTE_LIBRO):
+    """ Bytes del CSV (UTF-8 con BOM para que Excel respete los acentos), un bloque de filas por vez """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_LIBRO)
+    yield '\ufeff'.encode('utf-8') + buffer.getvalue().encode('utf-8')
+    for bloque in _en_bloques(filas_libro(movimientos, lote), lote):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(['' if valor is None else valor for valor in fila] for fila in bloque)
+        yield buffer.getvalue().encode('utf-8')
+
+
+_XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Libro" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Estilos: 0 general, 1 fecha (formato 14), 2 número con dos decimales (formato 4)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+_INICIO_EXCEL = datetime.date(1899, 12, 30)
+_CONTROL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _celda_xlsx(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, datetime.date):
+        return f'<c s="1"><v>{(valor - _INICIO_EXCEL).days}</v></c>'
+    if isinstance(valor, Decimal):
+        return f'<c s="2"><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(_CONTROL_XML.sub("", str(valor)))}</t></is></c>'
+
+def _fila_xlsx(valores):
+    return '<row>' + ''.join(_celda_xlsx(valor) for valor in valores) + '</row>'
+
+def libro_xlsx(movimientos, lote=LOTE_LIBRO):
+    """ Bytes del XLSX: la hoja se comprime y se envía por bloques; el directorio del ZIP va al final """
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _XLSX_ESTATICOS.items():
+            libro.writestr(nombre, contenido)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                        + _fila_xlsx(COLUMNAS_LIBRO)).encode('utf-8'))
+            for bloque in _en_bloques(filas_libro(movimientos, lote), lote):
+                hoja.write(''.join(_fila_xlsx(fila) for fila in bloque).encode('utf-8'))
+                yield tubo.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield tubo.vaciar()
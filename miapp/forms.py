@@ -1,13 +1,19 @@
+import re
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
 
 # Importamos todos los modelos necesarios
 from .models import (
     Paciente, Cita, Documento, 
     CarruselImagen, PreguntaFrecuente, AvisoImportante,
-    PerfilUsuario, PersonalAutorizado, MovimientoContable, OrdenMedica
+    PerfilUsuario, PersonalAutorizado, MovimientoContable, OrdenMedica, Especialidad,
+    SubidaDocumento
 )
+from .disponibilidad import validar_turno
 
 # ==========================================
 # 1. GESTIÓN DE PACIENTES Y CITAS
@@ -34,7 +40,34 @@ class PacienteForm(forms.ModelForm):
             'enfermedades_cronicas': forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Ej: Asma, Hipertensión... o "Ninguna".'}),
         }
 
-class CitaForm(forms.ModelForm):
+class ImportarPacientesForm(forms.Form):
+    """ Carga masiva desde el admin (miapp/importacion.py) """
+    archivo = forms.FileField(help_text="CSV (separado por coma o punto y coma) o XLSX.")
+    codificacion = forms.ChoiceField(
+        choices=[('utf-8-sig', 'UTF-8'), ('latin-1', 'Latin-1 (Excel antiguo)')], initial='utf-8-sig',
+        help_text="Solo para CSV.",
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError("El archivo debe ser .csv o .xlsx.")
+        return archivo
+
+class ValidarTurnoMixin:
+    """ Rechaza horas fuera del horario del médico o ya ocupadas (ver miapp/disponibilidad.py) """
+
+    def clean(self):
+        datos = super().clean()
+        medico, fecha, hora = datos.get('medico'), datos.get('fecha'), datos.get('hora')
+        if medico and fecha and hora:
+            instancia = getattr(self, 'instance', None)
+            motivo = validar_turno(medico, fecha, hora, excluir_cita_id=instancia.pk if instancia else None)
+            if motivo:
+                self.add_error('hora', motivo)
+        return datos
+
+class CitaForm(ValidarTurnoMixin, forms.ModelForm):
     class Meta:
         model = Cita
         fields = ['medico', 'fecha', 'hora', 'motivo']
@@ -45,7 +78,7 @@ class CitaForm(forms.ModelForm):
             'motivo': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
         }
 
-class CitaInvitadoForm(forms.Form):
+class CitaInvitadoForm(ValidarTurnoMixin, forms.Form):
     # Formulario especial que no guarda usuario, solo datos básicos + cita
     cedula = forms.CharField(label="Cédula", widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: V-12345678'}))
     nombre = forms.CharField(label="Nombre", widget=forms.TextInput(attrs={'class': 'form-control'}))
@@ -62,6 +95,8 @@ class CitaInvitadoForm(forms.Form):
     fecha = forms.DateField(label="Fecha Deseada", widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
     hora = forms.TimeField(label="Hora Preferida", widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}))
     motivo = forms.CharField(label="Motivo de Consulta", widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 2}))
+    # Se genera al mostrar el formulario: si el mismo envío llega dos veces, no se duplica la cita
+    clave_idempotencia = forms.CharField(required=False, max_length=64, widget=forms.HiddenInput)
 
 # ==========================================
 # 2. ÁREA MÉDICA Y ENFERMERÍA
@@ -86,6 +121,26 @@ class DocumentoForm(forms.ModelForm):
             'archivo': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
+class SubidaDocumentoForm(forms.ModelForm):
+    # Abre una subida por partes (miapp/documentos.py); el archivo llega después en fragmentos
+    class Meta:
+        model = SubidaDocumento
+        fields = ['descripcion', 'nombre_original', 'tamano', 'sha256']
+
+    def clean_tamano(self):
+        tamano = self.cleaned_data['tamano']
+        if tamano <= 0:
+            raise forms.ValidationError("El archivo está vacío.")
+        if tamano > settings.DOCUMENTOS_TAMANO_MAXIMO:
+            raise forms.ValidationError(f"El máximo es {filesizeformat(settings.DOCUMENTOS_TAMANO_MAXIMO)}.")
+        return tamano
+
+    def clean_sha256(self):
+        sha256 = self.cleaned_data['sha256'].lower()
+        if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+            raise forms.ValidationError("Debe ser el SHA-256 en hexadecimal (64 caracteres).")
+        return sha256
+
 class OrdenMedicaForm(forms.ModelForm):
     class Meta:
         model = OrdenMedica
@@ -145,12 +200,58 @@ class MovimientoContableForm(forms.ModelForm):
             'tipo': forms.Select(attrs={'class': 'form-select'}),
             'descripcion': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: Pago Consulta Juan Pérez'}),
             'monto': forms.NumberInput(attrs={'class': 'form-control'}),
-            'tasa_cambio': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Tasa BCV'}),
+            'tasa_cambio': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Tasa BCV (vacío: la del día)'}),
             'referencia': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Nro Ref Bancaria'}),
             'fecha': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'es_divisa': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['tasa_cambio'].required = False
+
+    def clean_tasa_cambio(self):
+        # Vacío: al guardar se toma la tasa BCV de la fecha del movimiento (signals.py)
+        return self.cleaned_data.get('tasa_cambio') or 0
+
+class FiltroMovimientosForm(forms.Form):
+    # Filtros del libro (GET). Todos opcionales.
+    MONEDAS = [('', 'Todas las monedas'), ('bs', 'Bolívares'), ('usd', 'Dólares')]
+
+    tipo = forms.ChoiceField(required=False, choices=[('', 'Todos los tipos')] + MovimientoContable.TIPOS, widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    desde = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    hasta = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    moneda = forms.ChoiceField(required=False, choices=MONEDAS, widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    referencia = forms.CharField(required=False, max_length=50, widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Referencia'}))
+
+    def filtrar(self, queryset):
+        """ Aplica los filtros al queryset de MovimientoContable. Sin filtros, todo; con filtros inválidos, nada """
+        if not self.is_bound:
+            return queryset
+        if not self.is_valid():
+            # Como en la exportación: un filtro mal escrito no debe mostrar el libro completo
+            return queryset.none()
+        datos = self.cleaned_data
+        if datos.get('tipo'):
+            queryset = queryset.filter(tipo=datos['tipo'])
+        if datos.get('desde'):
+            queryset = queryset.filter(fecha__gte=datos['desde'])
+        if datos.get('hasta'):
+            queryset = queryset.filter(fecha__lte=datos['hasta'])
+        if datos.get('moneda'):
+            queryset = queryset.filter(es_divisa=(datos['moneda'] == 'usd'))
+        if datos.get('referencia'):
+            # Prefijo: las referencias bancarias se buscan por el inicio
+            queryset = queryset.filter(referencia__startswith=datos['referencia'])
+        return queryset
+
+class FiltroTurnosForm(forms.Form):
+    # Parámetros GET del buscador de turnos libres. Todos opcionales.
+    especialidad = forms.ModelChoiceField(queryset=Especialidad.objects.all(), required=False)
+    medico = forms.ModelChoiceField(queryset=User.objects.filter(perfilusuario__rol='medico'), required=False)
+    desde = forms.DateField(required=False)
+    cantidad = forms.IntegerField(required=False, min_value=1, max_value=50)
+
 # ==========================================
 # 5. GESTIÓN CMS (PÁGINA WEB)
 # ==========================================
@@ -168,7 +269,7 @@ class CarruselForm(forms.ModelForm):
             'activo': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
         help_texts = {
-            'imagen': '<strong class="text-danger">Importante:</strong> Se recomiendan imágenes horizontales de 1920x600 px.',
+            'imagen': '<strong class="text-danger">Importante:</strong> Se recomiendan imágenes horizontales de 1920x600 px. Las versiones livianas (WebP/JPEG) se generan solas.',
             'overlay': 'Oscurece la imagen para que el texto sea legible.',
         }
 
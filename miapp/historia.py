@@ -0,0 +1,103 @@
+import datetime
+from collections import namedtuple
+from heapq import merge
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cita, Documento, OrdenMedica
+
+# ==========================================
+# LÍNEA DE TIEMPO DEL PACIENTE
+# ==========================================
+# detalle_paciente traía de una vez todas las citas y todas las órdenes del paciente:
+# con un crónico de años la ficha tardaba segundos en abrir. Ahora citas, órdenes y
+# documentos forman una sola línea de tiempo, de lo más reciente a lo más antiguo, que
+# se pide por páginas de TAMANO eventos con un cursor (momento, tipo, id) al estilo de
+# miapp/paginacion.py. Cada página son tres consultas LIMIT TAMANO + 1, una por tipo,
+# sobre índices (paciente, fecha desc, id desc) y con sus relaciones unidas; se mezclan
+# en Python y se cortan en TAMANO. La plantilla pide la página siguiente al acercarse
+# al final (historia_paciente).
+
+TAMANO = 20
+
+# (momento, prioridad, id): la prioridad desempata tipos distintos en el mismo instante
+Evento = namedtuple('Evento', 'momento prioridad id tipo objeto')
+
+
+def _momento_cita(cita):
+    """ Las citas guardan fecha y hora locales sin zona """
+    return timezone.make_aware(datetime.datetime.combine(cita.fecha, cita.hora))
+
+# tipo: (prioridad, consulta, campos del momento, valores del momento en la consulta, momento del objeto)
+FUENTES = {
+    'cita': (
+        2,
+        lambda: Cita.objects.select_related('medico__perfilusuario__especialidad').order_by('-fecha', '-hora', '-id'),
+        ('fecha', 'hora'),
+        lambda momento: (timezone.localtime(momento).date(), timezone.localtime(momento).time()),
+        _momento_cita,
+    ),
+    'orden': (
+        1,
+        lambda: OrdenMedica.objects.select_related('medico', 'enfermera_responsable').order_by('-fecha_creacion', '-id'),
+        ('fecha_creacion',),
+        lambda momento: (momento,),
+        lambda orden: orden.fecha_creacion,
+    ),
+    'documento': (
+        0,
+        lambda: Documento.objects.select_related('contenido').order_by('-fecha_subida', '-id'),
+        ('fecha_subida',),
+        lambda momento: (momento,),
+        lambda documento: documento.fecha_subida,
+    ),
+}
+
+
+def codificar_cursor(evento):
+    return f"{evento.momento.isoformat()}_{evento.tipo}_{evento.id}"
+
+def decodificar_cursor(cursor):
+    """ '2025-03-01T10:30:00+00:00_cita_154' -> (datetime, 'cita', 154), o None si no es válido """
+    try:
+        momento, tipo, pk = cursor.rsplit('_', 2)
+        momento = datetime.datetime.fromisoformat(momento)
+        if tipo not in FUENTES:
+            return None
+        return momento if timezone.is_aware(momento) else timezone.make_aware(momento), tipo, int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+def _posteriores(campos, valores, incluir_iguales):
+    """ Filas que van después de 'valores' en orden descendente por 'campos' (comparación lexicográfica) """
+    condicion = Q(**dict(zip(campos, valores))) if incluir_iguales else None
+    for i, campo in enumerate(campos):
+        paso = Q(**dict(zip(campos[:i], valores[:i])), **{f"{campo}__lt": valores[i]})
+        condicion = paso if condicion is None else condicion | paso
+    return condicion
+
+def _eventos(tipo, paciente_id, clave, tamano):
+    prioridad, consulta, campos, valores, momento_de = FUENTES[tipo]
+    filas = consulta().filter(paciente_id=paciente_id)
+    if clave:
+        momento, tipo_cursor, pk = clave
+        prioridad_cursor = FUENTES[tipo_cursor][0]
+        if prioridad == prioridad_cursor:
+            filas = filas.filter(_posteriores(campos + ('id',), valores(momento) + (pk,), False))
+        else:
+            # Mismo instante que el cursor: solo si este tipo va detrás en el desempate
+            filas = filas.filter(_posteriores(campos, valores(momento), prioridad < prioridad_cursor))
+    for objeto in filas[:tamano + 1]:
+        yield Evento(momento_de(objeto), prioridad, objeto.id, tipo, objeto)
+
+def pagina_historia(paciente_id, despues=None, tamano=TAMANO):
+    """ {'eventos': [Evento], 'siguiente': cursor o None}: los tamano eventos más recientes tras 'despues' """
+    clave = decodificar_cursor(despues) if despues else None
+    fuentes = [list(_eventos(tipo, paciente_id, clave, tamano)) for tipo in FUENTES]
+    eventos = list(merge(*fuentes, key=lambda e: (e.momento, e.prioridad, e.id), reverse=True))
+    pagina = eventos[:tamano]
+    return {
+        'eventos': pagina,
+        'siguiente': codificar_cursor(pagina[-1]) if len(eventos) > tamano else None,
+    }
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import textwrap
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont, ImageOps, UnidentifiedImageError
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+from .cache_paginas import invalidar_cms
+from .models import CarruselImagen, ContenidoArchivo
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# VARIANTES RESPONSIVAS DEL CARRUSEL
+# ==========================================
+# Por cada imagen subida generamos copias WebP y JPEG en varios anchos. El nombre
+# lleva el hash del original, así que una URL de variante nunca cambia de contenido
+# (se puede cachear para siempre). inicio.html las sirve con srcset.
+
+ANCHOS_CARRUSEL = [480, 960, 1440, 1920]
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def _anchos_para(ancho_original):
+    """
+    Nunca agrandamos: los anchos estándar menores al original y, como la mayor, el original
+    (si no, una pantalla grande recibe una copia reducida que el navegador vuelve a estirar)
+    """
+    anchos = [a for a in ANCHOS_CARRUSEL if a < ancho_original]
+    return anchos + [ancho_original]
+
+def generar_variantes_carrusel(slide_id):
+    slide = CarruselImagen.objects.filter(id=slide_id).first()
+    if slide is None or not slide.imagen:
+        return
+    nombre_original = slide.imagen.name
+
+    with slide.imagen.open('rb') as archivo:
+        datos = archivo.read()
+    huella = hashlib.sha256(datos).hexdigest()[:16]
+    imagen = ImageOps.exif_transpose(Image.open(BytesIO(datos)))
+    imagen = imagen.convert('RGB')
+
+    variantes = {formato: [] for formato in FORMATOS}
+    for ancho in _anchos_para(imagen.width):
+        alto = round(imagen.height * ancho / imagen.width)
+        copia = imagen if ancho == imagen.width else imagen.resize((ancho, alto), Image.LANCZOS)
+        for formato, (formato_pil, opciones) in FORMATOS.items():
+            buffer = BytesIO()
+            copia.save(buffer, formato_pil, **opciones)
+            ruta = f"carrusel/variantes/{slide.id}/{huella}-{ancho}.{formato}"
+            if not default_storage.exists(ruta):
+                ruta = default_storage.save(ruta, ContentFile(buffer.getvalue()))
+            variantes[formato].append({'ancho': ancho, 'archivo': ruta})
+
+    # Si mientras tanto cambiaron la imagen, estas variantes ya no sirven
+    if CarruselImagen.objects.filter(id=slide.id, imagen=nombre_original).update(variantes=variantes):
+        invalidar_cms()
+    else:
+        borrar_variantes(variantes)
+
+def borrar_variantes(variantes):
+    for lista in (variantes or {}).values():
+        for variante in lista:
+            try:
+                default_storage.delete(variante['archivo'])
+            except OSError:
+                logger.warning("No se pudo borrar la variante %s", variante['archivo'])
+
+
+# ==========================================
+# VISTAS PREVIAS DE DOCUMENTOS
+# ==========================================
+# Una imagen WebP de ~10 KB por contenido del almacén (miapp/documentos.py), junto
+# al archivo: documentos/ab/cd/<sha256>.vista.webp. Como el contenido no cambia,
+# se genera una sola vez aunque el mismo archivo esté en varias fichas.
+# No hay un rasterizador de PDF entre las dependencias (pypdf lee, reportlab escribe):
+# los resultados escaneados traen la página como imagen y se usa esa; si la primera
+# página es texto se dibujan sus primeras líneas.
+
+ANCHO_VISTA_PREVIA = 240
+ALTO_VISTA_PREVIA = 320
+OPCIONES_VISTA_PREVIA = {'quality': 75, 'method': 4}
+MINIMO_TEXTO_PDF = 40  # caracteres: menos que esto en la primera página es un escaneo
+
+def _vista_de_imagen(archivo):
+    imagen = Image.open(archivo)
+    # JPEG: decodifica ya reducido (escala DCT), sin cargar la foto completa en memoria
+    imagen.draft('RGB', (ANCHO_VISTA_PREVIA * 2, ALTO_VISTA_PREVIA * 2))
+    return ImageOps.exif_transpose(imagen)
+
+def _pagina_de_texto(texto, proporcion):
+    """ Las primeras líneas de la página sobre una hoja blanca con sus proporciones """
+    ancho = ANCHO_VISTA_PREVIA * 2
+    hoja = Image.new('RGB', (ancho, round(ancho * proporcion)), 'white')
+    dibujo = ImageDraw.Draw(hoja)
+    fuente = ImageFont.load_default(size=15)
+    margen, interlineado = 24, 19
+    columnas = max(int((ancho - 2 * margen) / fuente.getlength('n')), 10)
+    lineas = [l for parrafo in texto.splitlines() for l in (textwrap.wrap(parrafo, columnas) or [''])]
+    for numero, linea in enumerate(lineas[:(hoja.height - 2 * margen) // interlineado]):
+        dibujo.text((margen, margen + numero * interlineado), linea, fill=(60, 60, 60), font=fuente)
+    dibujo.rectangle([0, 0, hoja.width - 1, hoja.height - 1], outline=(200, 200, 200))
+    return hoja
+
+def _vista_de_pdf(archivo):
+    """ (imagen, páginas) de la primera página """
+    lector = PdfReader(archivo)
+    pagina = lector.pages[0]
+    texto = pagina.extract_text() or ''
+    if len(texto.strip()) < MINIMO_TEXTO_PDF and pagina.images:
+        escaneo = max(pagina.images, key=lambda imagen: len(imagen.data))
+        return escaneo.image, len(lector.pages)
+    caja = pagina.mediabox
+    return _pagina_de_texto(texto, float(caja.height) / float(caja.width)), len(lector.pages)
+
+def generar_vista_previa(contenido_id):
+    contenido = ContenidoArchivo.objects.filter(id=contenido_id).first()
+    if contenido is None:
+        return
+    paginas = None
+    try:
+        with contenido.archivo.open('rb') as archivo:
+            if archivo.read(5) == b'%PDF-':
+                archivo.seek(0)
+                imagen, paginas = _vista_de_pdf(archivo)
+            else:
+                archivo.seek(0)
+                imagen = _vista_de_imagen(archivo)
+            imagen.thumbnail((ANCHO_VISTA_PREVIA, ALTO_VISTA_PREVIA), Image.LANCZOS)
+            imagen = imagen.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        return  # otro formato (DICOM, Word...): la ficha muestra un ícono
+    except (PyPdfError, IndexError, OSError, ValueError):
+        logger.warning("No se pudo generar la vista previa de %s", contenido.archivo.name, exc_info=True)
+        if paginas is not None:
+            ContenidoArchivo.objects.filter(id=contenido.id).update(paginas=paginas)
+        return
+
+    buffer = BytesIO()
+    imagen.save(buffer, 'WEBP', **OPCIONES_VISTA_PREVIA)
+    ruta = f"{os.path.splitext(contenido.archivo.name)[0]}.vista.webp"
+    if not default_storage.exists(ruta):
+        ruta = default_storage.save(ruta, ContentFile(buffer.getvalue()))
+    ContenidoArchivo.objects.filter(id=contenido.id).update(vista_previa=ruta, paginas=paginas)
@@ -0,0 +1,252 @@
+import csv
+import datetime
+import io
+import re
+import time
+import zipfile
+from xml.etree import ElementTree
+
+from django.db import transaction
+
+from .busqueda import normalizar, reindexar_pacientes
+from .cache_versiones import incrementar_al_confirmar, nombre_de_modelo
+from .forms import PacienteForm
+from .models import Paciente
+
+# ==========================================
+# IMPORTACIÓN MASIVA DE PACIENTES (CSV / XLSX)
+# ==========================================
+# Para migrar desde el sistema anterior. El archivo se lee fila a fila (nunca
+# entero en memoria), cada fila se valida con las reglas de PacienteForm y las
+# válidas se guardan por lotes con un solo INSERT ... ON CONFLICT (cedula) DO UPDATE:
+# si la cédula ya existe se actualizan las columnas que trae el archivo.
+# bulk_create no dispara señales, así que cada lote reindexa la búsqueda y sube
+# la versión de caché de Paciente por su cuenta (lo que harían signals.py).
+# Las filas rechazadas van a un reporte CSV con su número de fila y el motivo.
+
+LOTE = 1000
+
+# Encabezados del sistema anterior -> campo del modelo (ya normalizados: sin acentos, con _)
+ALIAS_COLUMNAS = {
+    'ci': 'cedula',
+    'cedula_de_identidad': 'cedula',
+    'nombres': 'nombre',
+    'apellidos': 'apellido',
+    'fecha_de_nacimiento': 'fecha_nacimiento',
+    'nacimiento': 'fecha_nacimiento',
+    'genero': 'sexo',
+    'email': 'correo',
+    'correo_electronico': 'correo',
+    'enfermedades': 'enfermedades_cronicas',
+}
+
+
+class ImportacionPacienteForm(PacienteForm):
+    """ Las reglas de PacienteForm sin el usuario de login ni la unicidad de la cédula (es un upsert) """
+    username = None
+    password = None
+
+    # Los sistemas locales exportan día/mes/año; con 'en-us' Django leería 05/03 como 3 de mayo
+    FORMATOS_FECHA = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y']
+
+    def __init__(self, *args, campos=None, **kwargs):
+        if campos is not None:
+            self.base_fields = {}  # nada que copiar: usa los campos que le pasan
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            self.fields = campos
+        else:
+            self.fields['fecha_nacimiento'].input_formats = self.FORMATOS_FECHA
+
+    def validate_unique(self):
+        pass
+
+    def para_fila(self, datos):
+        """
+        Un formulario nuevo, ligado a la fila, con los mismos campos que este. Cada
+        formulario copia (deepcopy) todos sus campos y eso casi duplicaba el tiempo de
+        validación; los campos no guardan nada de la validación, se pueden compartir.
+        """
+        return type(self)(datos, campos=self.fields)
+
+CAMPOS = [nombre for nombre in ImportacionPacienteForm.base_fields]
+
+
+# ==========================================
+# LECTURA EN STREAMING
+# ==========================================
+
+def _columna(encabezado):
+    nombre = re.sub(r'[^a-z0-9]+', '_', normalizar(encabezado)).strip('_')
+    return ALIAS_COLUMNAS.get(nombre, nombre)
+
+def _filas_csv(archivo, codificacion):
+    texto = io.TextIOWrapper(archivo, encoding=codificacion, newline='')
+    muestra = texto.read(8192)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(texto, dialecto)
+    for fila in lector:
+        yield lector.line_num, fila
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+def _textos_compartidos(libro):
+    """ La tabla sharedStrings (lo único del XLSX que hay que tener en memoria) """
+    if 'xl/sharedStrings.xml' not in libro.namelist():
+        return []
+    textos = []
+    with libro.open('xl/sharedStrings.xml') as xml:
+        for _, elemento in ElementTree.iterparse(xml):
+            if elemento.tag == _NS + 'si':
+                textos.append(''.join(t.text or '' for t in elemento.iter(_NS + 't')))
+                elemento.clear()
+    return textos
+
+def _primera_hoja(libro):
+    libro_xml = ElementTree.fromstring(libro.read('xl/workbook.xml'))
+    hoja = libro_xml.find(f'{_NS}sheets/{_NS}sheet')
+    relaciones = ElementTree.fromstring(libro.read('xl/_rels/workbook.xml.rels'))
+    for relacion in relaciones:
+        if relacion.get('Id') == hoja.get(_NS_REL + 'id'):
+            destino = relacion.get('Target').lstrip('/')
+            return destino if destino.startswith('xl/') else f'xl/{destino}'
+    return 'xl/worksheets/sheet1.xml'
+
+def _indice_columna(referencia):
+    """ 'C12' -> 2 """
+    indice = 0
+    for letra in re.match(r'[A-Z]+', referencia).group():
+        indice = indice * 26 + ord(letra) - ord('A') + 1
+    return indice - 1
+
+class NumeroExcel(str):
+    """ Valor de una celda numérica del XLSX. Excel guarda así las fechas: días desde 1899-12-30 """
+
+def _valor_celda(celda, compartidas):
+    tipo = celda.get('t')
+    if tipo == 'inlineStr':
+        return ''.join(t.text or '' for t in celda.iter(_NS + 't'))
+    valor = celda.findtext(_NS + 'v') or ''
+    if tipo == 's' and valor:
+        return compartidas[int(valor)]
+    if tipo in (None, 'n') and valor:
+        return NumeroExcel(valor)
+    return valor
+
+def _filas_xlsx(archivo):
+    """ Primera hoja, fila a fila con iterparse (openpyxl no es dependencia del proyecto) """
+    with zipfile.ZipFile(archivo) as libro:
+        compartidas = _textos_compartidos(libro)
+        with libro.open(_primera_hoja(libro)) as xml:
+            datos_hoja, numero = None, 0
+            for evento, elemento in ElementTree.iterparse(xml, events=('start', 'end')):
+                if evento == 'start':
+                    if elemento.tag == _NS + 'sheetData':
+                        datos_hoja = elemento
+                    continue
+                if elemento.tag != _NS + 'row':
+                    continue
+                # 'r' es opcional en el formato: sin él, la celda va a continuación de la anterior
+                valores, indice = {}, -1
+                for celda in elemento.iter(_NS + 'c'):
+                    indice = _indice_columna(celda.get('r')) if celda.get('r') else indice + 1
+                    valores[indice] = _valor_celda(celda, compartidas)
+                numero = int(elemento.get('r') or numero + 1)
+                yield numero, [valores.get(i, '') for i in range(max(valores, default=-1) + 1)]
+                datos_hoja.clear()  # las filas ya leídas no se acumulan en el árbol
+
+def leer_archivo(archivo, nombre, codificacion='utf-8-sig'):
+    """
+    (columnas, filas) de un CSV o XLSX abierto en binario. filas genera (número de fila, {campo: valor})
+    con los encabezados ya traducidos a campos del modelo.
+    """
+    filas = _filas_xlsx(archivo) if nombre.lower().endswith('.xlsx') else _filas_csv(archivo, codificacion)
+    _, encabezado = next(filas, (0, []))
+    columnas = [_columna(titulo) for titulo in encabezado]
+
+    def registros():
+        for numero, fila in filas:
+            if any(valor.strip() for valor in fila):
+                # strip() devolvería un str: la marca de celda numérica se pierde
+                yield numero, {columna: valor if isinstance(valor, NumeroExcel) else valor.strip()
+                               for columna, valor in zip(columnas, fila)}
+
+    return columnas, registros()
+
+
+# ==========================================
+# VALIDACIÓN Y UPSERT POR LOTES
+# ==========================================
+
+def _fecha_excel(valor):
+    """
+    Celda numérica del XLSX -> fecha: 32874 -> '1990-01-01'. Solo esas: en un CSV, o en una celda de
+    texto, '1990' es un año suelto y lo rechaza la validación de fechas del formulario
+    """
+    if not isinstance(valor, NumeroExcel):
+        return valor
+    try:
+        return (datetime.date(1899, 12, 30) + datetime.timedelta(days=int(float(valor)))).isoformat()
+    except (ValueError, OverflowError):
+        return valor
+
+def _guardar_lote(pacientes, actualizar):
+    cedulas = [p.cedula for p in pacientes]
+    with transaction.atomic():
+        existentes = Paciente.objects.filter(cedula__in=cedulas).count()
+        if actualizar:
+            Paciente.objects.bulk_create(pacientes, update_conflicts=True, unique_fields=['cedula'], update_fields=actualizar)
+        else:
+            Paciente.objects.bulk_create(pacientes, ignore_conflicts=True)
+        reindexar_pacientes(Paciente.objects.filter(cedula__in=cedulas), lote=len(cedulas))
+        incrementar_al_confirmar(nombre_de_modelo(Paciente))
+    return len(pacientes) - existentes, existentes
+
+def importar_pacientes(columnas, filas, reporte=None, lote=LOTE, progreso=None):
+    """
+    Valida y guarda las filas de leer_archivo(). reporte: archivo de texto donde se escriben
+    las filas rechazadas. progreso(resumen) se llama después de cada lote. Devuelve el resumen.
+    """
+    inicio = time.perf_counter()
+    resumen = {'leidas': 0, 'creadas': 0, 'actualizadas': 0, 'rechazadas': 0}
+    # En conflicto solo se pisan las columnas que trae el archivo (salvo la cédula, que es la clave)
+    actualizar = [campo for campo in CAMPOS if campo in columnas and campo != 'cedula']
+    escritor = csv.writer(reporte) if reporte else None
+    if escritor:
+        escritor.writerow(['fila', 'errores', *columnas])
+    pendientes = {}  # cédula -> Paciente: si el archivo repite una cédula, gana la última fila
+    plantilla = ImportacionPacienteForm()
+
+    def guardar():
+        creadas, actualizadas = _guardar_lote(list(pendientes.values()), actualizar)
+        resumen['creadas'] += creadas
+        resumen['actualizadas'] += actualizadas
+        pendientes.clear()
+        if progreso:
+            progreso(resumen)
+
+    for numero, datos in filas:
+        resumen['leidas'] += 1
+        if datos.get('fecha_nacimiento'):
+            datos['fecha_nacimiento'] = _fecha_excel(datos['fecha_nacimiento'])
+        form = plantilla.para_fila(datos)
+        if form.is_valid():
+            pendientes[form.instance.cedula] = form.instance
+            if len(pendientes) >= lote:
+                guardar()
+        else:
+            resumen['rechazadas'] += 1
+            if escritor:
+                errores = "; ".join(f"{campo}: {' '.join(mensajes)}" for campo, mensajes in form.errors.items())
+                escritor.writerow([numero, errores, *(datos.get(columna, '') for columna in columnas)])
+    if pendientes:
+        guardar()
+
+    resumen['segundos'] = round(time.perf_counter() - inicio, 2)
+    resumen['filas_por_segundo'] = round(resumen['leidas'] / resumen['segundos'], 1) if resumen['segundos'] else 0
+    return resumen
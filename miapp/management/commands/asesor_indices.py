@@ -0,0 +1,139 @@
+import logging
+import re
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from .benchmark_vistas import Command as BenchmarkVistas, ROLES
+
+# Lo que delata un plan sin índice útil, por motor:
+#   SQLite:     "SCAN miapp_cita" (sin USING INDEX)     y "USE TEMP B-TREE FOR ORDER BY"
+#   PostgreSQL: "Seq Scan on miapp_cita"                y un nodo "Sort"
+ESCANEO_SQLITE = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(.*)$')
+ESCANEO_POSTGRES = re.compile(r'Seq Scan on "?(\w+)"?')
+ORDEN_POSTGRES = re.compile(r'^\s*(?:->\s*)?(?:Incremental )?Sort\b')
+TABLA_PRINCIPAL = re.compile(r'\bFROM "(\w+)"')
+
+
+class Command(BaseCommand):
+    help = ("Recorre las vistas de miapp con el cliente de pruebas (como benchmark_vistas), pasa cada SELECT "
+            "por EXPLAIN y marca escaneos completos y ordenamientos en B-tree temporal, con el índice sugerido. "
+            "Córralo sobre datos de generar_datos_sinteticos: con tablas pequeñas el planificador no usa índices.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', nargs='+', default=ROLES, choices=ROLES)
+        parser.add_argument('--rutas', nargs='+', default=None, help="Solo estas rutas (por nombre)")
+        parser.add_argument('--min-filas', type=int, default=1000,
+                            help="Ignora tablas con menos filas (catálogos, usuarios...)")
+        parser.add_argument('--sql', action='store_true', help="Muestra cada consulta completa")
+        parser.add_argument('--estricto', action='store_true', help="Termina con error si hay hallazgos (para CI)")
+
+    def handle(self, *args, **o):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"EXPLAIN no soportado para '{connection.vendor}'.")
+
+        consultas = self.capturar(o['roles'], o['rutas'])
+        filas = self.filas_por_tabla()
+        hallazgos = defaultdict(list)  # tabla -> [(problema, sql, vistas)]
+        for sql, (parametros, vistas) in consultas.items():
+            for problema, tabla in self.problemas(sql, parametros):
+                if filas.get(tabla, 0) < o['min_filas']:
+                    continue
+                hallazgos[tabla].append((problema, sql, vistas))
+
+        self.stdout.write(f"{len(consultas)} consultas distintas analizadas.\n")
+        for tabla in sorted(hallazgos, key=lambda t: -filas.get(t, 0)):
+            self.stdout.write(self.style.WARNING(f"{tabla} ({filas.get(tabla, '?')} filas)"))
+            for problema, sql, vistas in hallazgos[tabla]:
+                self.stdout.write(f"  [{problema}] {', '.join(sorted(vistas))}")
+                self.stdout.write(f"      {sql if o['sql'] else sql[:160] + ('...' if len(sql) > 160 else '')}")
+                columnas = self.columnas_sugeridas(sql, tabla)
+                if columnas:
+                    self.stdout.write(f"      sugerencia: models.Index(fields={columnas!r})")
+
+        total = sum(len(h) for h in hallazgos.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS("Sin escaneos completos ni ordenamientos temporales."))
+        elif o['estricto']:
+            raise CommandError(f"{total} consultas sin índice adecuado.")
+
+    def capturar(self, roles, solo_rutas):
+        """ {sql: (parámetros, {"ruta (rol)", ...})} de los SELECT que hacen las vistas """
+        bench = BenchmarkVistas(stdout=self.stdout, stderr=self.stderr)
+        rutas = bench.rutas(solo_rutas)
+        consultas = {}
+        logging.disable(logging.WARNING)  # presupuestos y 403 esperados: no son lo que buscamos aquí
+        try:
+            # El middleware solo guarda el SQL de cada consulta si se le pide
+            with override_settings(CONSULTAS_REGISTRAR_SQL=True):
+                for rol in roles:
+                    cliente = bench.cliente_para(rol)
+                    for nombre, url in rutas:
+                        registro = getattr(cliente.get(url).wsgi_request, 'consultas_sql', None)
+                        if registro is None:
+                            continue
+                        for sql, parametros in zip(registro.sql, registro.parametros):
+                            if sql.lstrip().upper().startswith('SELECT'):
+                                consultas.setdefault(sql, (parametros, set()))[1].add(f"{nombre} ({rol})")
+        finally:
+            logging.disable(logging.NOTSET)
+        return consultas
+
+    def filas_por_tabla(self):
+        with connection.cursor() as cursor:
+            tablas = connection.introspection.table_names(cursor)
+            filas = {}
+            for tabla in tablas:
+                cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(tabla)}")
+                filas[tabla] = cursor.fetchone()[0]
+        return filas
+
+    def plan(self, sql, parametros):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)
+                return [fila[-1] for fila in cursor.fetchall()]
+            cursor.execute(f"EXPLAIN {sql}", parametros)
+            return [fila[0] for fila in cursor.fetchall()]
+
+    def problemas(self, sql, parametros):
+        """ (problema, tabla) por cada paso del plan que recorre una tabla entera u ordena en temporal """
+        principal = TABLA_PRINCIPAL.search(sql)
+        principal = principal.group(1) if principal else '?'
+        if self.recorre_por_clave_con_limite(sql, principal):
+            return []
+        encontrados = []
+        for paso in self.plan(sql, parametros):
+            if connection.vendor == 'sqlite':
+                escaneo = ESCANEO_SQLITE.match(paso)
+                if escaneo and 'INDEX' not in escaneo.group(2):
+                    encontrados.append(('escaneo completo', escaneo.group(1)))
+                elif paso.startswith('USE TEMP B-TREE'):
+                    encontrados.append((paso[len('USE '):].lower(), principal))
+            else:
+                escaneo = ESCANEO_POSTGRES.search(paso)
+                if escaneo:
+                    encontrados.append(('escaneo completo', escaneo.group(1)))
+                elif ORDEN_POSTGRES.match(paso):
+                    encontrados.append(('ordenamiento', principal))
+        return encontrados
+
+    def recorre_por_clave_con_limite(self, sql, tabla):
+        """ ORDER BY id ... LIMIT n: el "escaneo" recorre la clave primaria y se detiene a las n filas """
+        return ' LIMIT ' in sql and re.search(rf' ORDER BY "{tabla}"\."id"', sql) is not None
+
+    def columnas_sugeridas(self, sql, tabla):
+        """ Heurística: columnas de `tabla` en el WHERE (en orden de aparición) y luego las del ORDER BY """
+        where, _, order_by = sql.partition(' ORDER BY ')
+        where = where.partition(' WHERE ')[2]
+        columnas = []
+        for columna in re.findall(rf'"{tabla}"\."(\w+)"', where):
+            if columna not in columnas:
+                columnas.append(columna)
+        for columna, descendente in re.findall(rf'"{tabla}"\."(\w+)"( DESC)?', order_by):
+            campo = f"-{columna}" if descendente else columna
+            if columna not in columnas:
+                columnas.append(campo)
+        return columnas
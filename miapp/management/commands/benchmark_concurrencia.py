@@ -0,0 +1,176 @@
+import datetime
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.urls import reverse
+
+from miapp.disponibilidad import turnos_libres
+from miapp.models import Cita, Paciente, MovimientoContable, OrdenMedica
+from miapp.reservas import reservar_cita, TurnoOcupado
+from .benchmark_vistas import Command as BenchmarkVistas, percentil
+
+# Lo que leen las estaciones mientras otros escriben: (rol, nombre de la ruta)
+LECTURAS = [
+    ('enfermera', 'dashboard'),
+    ('contador', 'dashboard'),
+    ('secretaria', 'dashboard'),
+    ('medico', 'lista_pacientes'),
+]
+MARCA = 'BENCH-CONCURRENCIA'
+CEDULA = 'BENCH-'  # la cédula admite 15 caracteres
+
+
+class Command(BaseCommand):
+    help = ("Mide la base bajo carga mixta: hilos lectores (GET de dashboards con el cliente de pruebas) y "
+            "escritores (reservas, asientos del libro, ejecución de órdenes) durante N segundos. Reporta "
+            "operaciones/s, latencias y errores 'database is locked' en JSON. Ejecutar una vez con "
+            "config.settings y otra con config.settings_produccion para comparar. Escribe en la base "
+            "(sobre datos de generar_datos_sinteticos) y al final deshace lo que creó.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lectores', type=int, default=8)
+        parser.add_argument('--escritores', type=int, default=4)
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument('--salida', default=None, help="Archivo JSON (por defecto se imprime)")
+
+    def handle(self, *args, **o):
+        bench = BenchmarkVistas(stdout=self.stdout, stderr=self.stderr)
+        # Un cliente por hilo lector: el cliente de pruebas guarda cookies y no es seguro entre hilos
+        clientes = [bench.cliente_para(LECTURAS[i % len(LECTURAS)][0]) for i in range(o['lectores'])]
+        self.turnos = turnos_libres(cantidad=o['escritores'] * 400)
+        self.medicos = User.objects.in_bulk({t.medico_id for t in self.turnos})
+        self.ordenes = list(OrdenMedica.objects.filter(ejecutada=False).values_list('id', flat=True)[:5000])
+        self.ejecutadas = []
+        self.candado = threading.Lock()
+        connections.close_all()  # cada hilo abre las suyas (con los pragmas del perfil)
+
+        tiempos = defaultdict(list)
+        errores = defaultdict(lambda: defaultdict(int))
+        fin = time.monotonic() + o['segundos']
+        salida = threading.Barrier(o['lectores'] + o['escritores'])
+
+        def trabajador(numero, tarea):
+            rnd = random.Random(numero)
+            salida.wait()
+            try:
+                while time.monotonic() < fin:
+                    tipo, operacion = tarea(rnd, numero)
+                    inicio = time.perf_counter()
+                    try:
+                        operacion()
+                        with self.candado:
+                            tiempos[tipo].append((time.perf_counter() - inicio) * 1000)
+                    except TurnoOcupado:
+                        with self.candado:
+                            errores[tipo]['turno_ocupado'] += 1
+                    except OperationalError as e:
+                        with self.candado:
+                            errores[tipo]['locked' if 'locked' in str(e) else str(e)] += 1
+                    except Exception as e:
+                        with self.candado:
+                            errores[tipo][e.__class__.__name__] += 1
+            finally:
+                connections.close_all()
+
+        def lectura(rnd, numero):
+            cliente, url = clientes[numero], reverse(LECTURAS[numero % len(LECTURAS)][1])
+            return 'lectura', lambda: cliente.get(url)
+
+        def escritura(rnd, numero):
+            tipo = rnd.choice(['reserva', 'libro', 'orden'])
+            return tipo, {'reserva': self.reservar, 'libro': self.asentar, 'orden': self.ejecutar_orden}[tipo]
+
+        hilos = [threading.Thread(target=trabajador, args=(i, lectura)) for i in range(o['lectores'])]
+        hilos += [threading.Thread(target=trabajador, args=(o['lectores'] + i, escritura)) for i in range(o['escritores'])]
+        inicio = time.monotonic()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.monotonic() - inicio
+
+        reporte = {
+            'perfil': settings.SETTINGS_MODULE,
+            'journal_mode': self.pragma('journal_mode'),
+            'alias_lectura': 'lectura' in settings.DATABASES,
+            'lectores': o['lectores'],
+            'escritores': o['escritores'],
+            'segundos': round(duracion, 2),
+            'operaciones': {
+                tipo: {
+                    'ok': len(tiempos[tipo]),
+                    'por_segundo': round(len(tiempos[tipo]) / duracion, 1),
+                    'p50_ms': round(percentil(tiempos[tipo], 50), 2) if tiempos[tipo] else None,
+                    'p95_ms': round(percentil(tiempos[tipo], 95), 2) if tiempos[tipo] else None,
+                    'errores': dict(errores[tipo]),
+                }
+                for tipo in ['lectura', 'reserva', 'libro', 'orden']
+            },
+        }
+        self.deshacer()
+
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if o['salida']:
+            with open(o['salida'], 'w', encoding='utf-8') as f:
+                f.write(texto)
+            self.stdout.write(self.style.SUCCESS(f"Reporte guardado en {o['salida']}"))
+        else:
+            self.stdout.write(texto)
+
+    # --- Escrituras (las mismas rutas de código que usan las vistas) ---
+
+    def reservar(self):
+        with self.candado:
+            if not self.turnos:
+                raise TurnoOcupado("Sin turnos libres para el benchmark")
+            turno = self.turnos.pop(random.randrange(len(self.turnos)))
+        n = random.randrange(10 ** 6)
+        reservar_cita({
+            'cedula': f"{CEDULA}{n:06d}", 'nombre': 'Carga', 'apellido': 'Concurrente', 'telefono': '04140000000',
+            'fecha_nacimiento': datetime.date(1990, 1, 1), 'sexo': 'F',
+            'medico': self.medicos[turno.medico_id], 'fecha': turno.fecha, 'hora': turno.hora, 'motivo': MARCA,
+        })
+
+    def asentar(self):
+        MovimientoContable.objects.create(
+            tipo=random.choice(['ingreso', 'egreso']), monto=Decimal('1.00'),
+            descripcion=MARCA, fecha=datetime.date.today(),
+        )
+
+    def ejecutar_orden(self):
+        with self.candado:
+            if not self.ordenes:
+                return
+            orden_id = self.ordenes.pop()
+        with transaction.atomic():
+            orden = OrdenMedica.objects.select_for_update().get(id=orden_id)
+            orden.ejecutada = True
+            orden.nota_enfermeria = MARCA
+            orden.fecha_ejecucion = datetime.datetime.now(datetime.timezone.utc)
+            orden.save()
+        with self.candado:
+            self.ejecutadas.append(orden_id)
+
+    def deshacer(self):
+        Cita.objects.filter(motivo=MARCA).delete()
+        Paciente.objects.filter(cedula__startswith=CEDULA).delete()
+        MovimientoContable.objects.filter(descripcion=MARCA).delete()  # las señales restan del resumen
+        OrdenMedica.objects.filter(id__in=self.ejecutadas).update(
+            ejecutada=False, nota_enfermeria='', fecha_ejecucion=None, enfermera_responsable=None,
+        )
+
+    def pragma(self, nombre):
+        if connection.vendor != 'sqlite':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {nombre}")
+            return cursor.fetchone()[0]
+
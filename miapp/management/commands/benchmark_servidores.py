@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient
+from django.urls import reverse
+
+from .benchmark_vistas import Command as BenchmarkVistas, ROLES, percentil
+
+ROLES_CON_DASHBOARD = [rol for rol in ROLES if rol != 'anonimo']
+
+
+class Command(BaseCommand):
+    help = ("Compara la latencia del dashboard bajo WSGI (vista síncrona, un hilo por petición en curso) y "
+            "ASGI (dashboard_async en un event loop) con N peticiones en paralelo. Usa los manejadores del "
+            "cliente de pruebas, sin servidor ni red de por medio. Usuarios bench_<rol> de generar_datos_sinteticos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200, help="Por rol")
+        parser.add_argument('--concurrencia', type=int, default=16)
+        parser.add_argument('--roles', nargs='+', default=ROLES_CON_DASHBOARD, choices=ROLES_CON_DASHBOARD)
+        parser.add_argument('--latencia-bd', type=float, default=0,
+                            help="ms de espera simulada por consulta (ida y vuelta a un servidor de base de datos)")
+        parser.add_argument('--salida', default=None, help="Archivo JSON (por defecto se imprime)")
+
+    def handle(self, *args, **o):
+        if o['latencia_bd']:
+            self.simular_latencia(o['latencia_bd'] / 1000)
+        url = reverse('dashboard')
+        resultados = {}
+        for rol in o['roles']:
+            wsgi = self.medir_wsgi(rol, url, o['peticiones'], o['concurrencia'])
+            asgi = asyncio.run(self.medir_asgi(rol, url, o['peticiones'], o['concurrencia']))
+            resultados[rol] = {'wsgi': wsgi, 'asgi': asgi}
+            self.stderr.write(f"{rol:10} wsgi p50={wsgi['p50_ms']:.1f}ms {wsgi['por_segundo']}/s   "
+                              f"asgi p50={asgi['p50_ms']:.1f}ms {asgi['por_segundo']}/s")
+
+        texto = json.dumps({
+            'peticiones': o['peticiones'],
+            'concurrencia': o['concurrencia'],
+            'latencia_bd_ms': o['latencia_bd'],
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False)
+        if o['salida']:
+            with open(o['salida'], 'w', encoding='utf-8') as f:
+                f.write(texto)
+            self.stdout.write(self.style.SUCCESS(f"Reporte guardado en {o['salida']}"))
+        else:
+            self.stdout.write(texto)
+
+    def medir_wsgi(self, rol, url, peticiones, concurrencia):
+        bench = BenchmarkVistas(stdout=self.stdout, stderr=self.stderr)
+        locales = threading.local()
+
+        def pedir(_):
+            if not hasattr(locales, 'cliente'):
+                locales.cliente = bench.cliente_para(rol)
+            inicio = time.perf_counter()
+            estado = locales.cliente.get(url).status_code
+            return (time.perf_counter() - inicio) * 1000, estado
+
+        bench.cliente_para(rol).get(url)  # calentamiento
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            medidas = list(pool.map(pedir, range(peticiones)))
+            # Cada hilo del pool abrió su conexión: la cerramos desde ese mismo hilo
+            list(pool.map(lambda _: connections.close_all(), range(concurrencia)))
+        return self.resumen(medidas, time.perf_counter() - inicio)
+
+    async def medir_asgi(self, rol, url, peticiones, concurrencia):
+        cliente = AsyncClient()
+        await cliente.aforce_login(await User.objects.aget(username=f"bench_{rol}"))
+        await cliente.get(url)  # calentamiento
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def pedir():
+            async with semaforo:
+                inicio = time.perf_counter()
+                estado = (await cliente.get(url)).status_code
+                return (time.perf_counter() - inicio) * 1000, estado
+
+        inicio = time.perf_counter()
+        medidas = await asyncio.gather(*(pedir() for _ in range(peticiones)))
+        duracion = time.perf_counter() - inicio
+        await sync_to_async(connections.close_all)()
+        return self.resumen(medidas, duracion)
+
+    def simular_latencia(self, segundos):
+        """ SQLite responde en microsegundos: sin esto no hay espera de red que solapar """
+        def esperar(execute, sql, params, many, context):
+            time.sleep(segundos)
+            return execute(sql, params, many, context)
+
+        def agregar(connection, **kwargs):
+            connection.execute_wrappers.append(esperar)
+
+        connection_created.connect(agregar, weak=False)
+        for conexion in connections.all(initialized_only=True):
+            agregar(conexion)
+
+    def resumen(self, medidas, duracion):
+        tiempos = [ms for ms, _ in medidas]
+        return {
+            'por_segundo': round(len(medidas) / duracion, 1),
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'errores': sum(1 for _, estado in medidas if estado >= 400),
+        }
@@ -0,0 +1,125 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import URLPattern, reverse
+
+from miapp import urls as miapp_urls
+from miapp.models import Paciente, OrdenMedica, CarruselImagen, PreguntaFrecuente
+
+# Rutas que modifican datos o cierran la sesión: no se miden
+EXCLUIDAS = {'logout', 'eliminar_slide', 'eliminar_faq', 'bloquear_personal'}
+
+# Para las rutas con <int:id>: de qué modelo sacamos un id existente
+OBJETO_DE_RUTA = {
+    'detalle_paciente': Paciente,
+    'ejecutar_orden': OrdenMedica,
+    'editar_slide': CarruselImagen,
+    'editar_faq': PreguntaFrecuente,
+}
+
+ROLES = ['anonimo', 'medico', 'enfermera', 'contador', 'secretaria', 'paciente']
+
+
+def percentil(valores, p):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+class Command(BaseCommand):
+    help = ("Mide cada ruta con nombre de miapp/urls.py para cada rol y reporta p50/p95/p99 y consultas SQL en JSON. "
+            "Usa los usuarios bench_<rol> que crea generar_datos_sinteticos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--roles', nargs='+', default=ROLES, choices=ROLES)
+        parser.add_argument('--rutas', nargs='+', default=None, help="Solo estas rutas (por nombre)")
+        parser.add_argument('--salida', default=None, help="Archivo JSON (por defecto se imprime)")
+
+    def handle(self, *args, **o):
+        rutas = self.rutas(o['rutas'])
+        resultados = {}
+        for rol in o['roles']:
+            cliente = self.cliente_para(rol)
+            resultados[rol] = {}
+            for nombre, url in rutas:
+                resultados[rol][nombre] = self.medir(cliente, url, o['repeticiones'])
+                self.stderr.write(f"{rol:10} {nombre:28} p50={resultados[rol][nombre]['p50_ms']:.1f}ms")
+
+        reporte = {
+            'commit': self.commit_actual(),
+            'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeticiones': o['repeticiones'],
+            'pacientes': Paciente.objects.count(),
+            'resultados': resultados,
+        }
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if o['salida']:
+            with open(o['salida'], 'w', encoding='utf-8') as f:
+                f.write(texto)
+            self.stdout.write(self.style.SUCCESS(f"Reporte guardado en {o['salida']}"))
+        else:
+            self.stdout.write(texto)
+
+    def rutas(self, solo=None):
+        """ (nombre, url) de cada ruta GET medible de miapp """
+        rutas = []
+        for patron in miapp_urls.urlpatterns:
+            if not isinstance(patron, URLPattern) or not patron.name or patron.name in EXCLUIDAS:
+                continue
+            if solo and patron.name not in solo:
+                continue
+            if patron.pattern.converters:
+                modelo = OBJETO_DE_RUTA.get(patron.name)
+                objeto = modelo.objects.order_by('-id').first() if modelo else None
+                if objeto is None:
+                    self.stderr.write(f"Omitida '{patron.name}': no hay objeto para sus parámetros.")
+                    continue
+                rutas.append((patron.name, reverse(patron.name, args=[objeto.id])))
+            else:
+                rutas.append((patron.name, reverse(patron.name)))
+        return rutas
+
+    def cliente_para(self, rol):
+        cliente = Client()
+        if rol == 'anonimo':
+            return cliente
+        try:
+            cliente.force_login(User.objects.get(username=f"bench_{rol}"))
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario bench_{rol}. Ejecute primero generar_datos_sinteticos.")
+        return cliente
+
+    def medir(self, cliente, url, repeticiones):
+        tiempos, consultas, tiempos_sql = [], [], []
+        estado = None
+        cliente.get(url)  # calentamiento (plantillas, caché de conexiones)
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            response = cliente.get(url)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            estado = response.status_code
+            registro = getattr(response.wsgi_request, 'consultas_sql', None)
+            if registro is not None:
+                consultas.append(registro.cantidad)
+                tiempos_sql.append(registro.tiempo_ms)
+        return {
+            'url': url,
+            'status': estado,
+            'p50_ms': round(percentil(tiempos, 50), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'p99_ms': round(percentil(tiempos, 99), 2),
+            'consultas': max(consultas) if consultas else None,
+            'sql_p50_ms': round(percentil(tiempos_sql, 50), 2) if tiempos_sql else None,
+        }
+
+    def commit_actual(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,42 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from miapp.documentos import asignar_contenido
+from miapp.models import Documento
+
+
+class Command(BaseCommand):
+    help = ("Pasa al almacén por contenido (miapp/documentos.py) los documentos subidos antes de él, "
+            "en 'resultados/'. Los archivos repetidos quedan guardados una sola vez.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--borrar-originales', action='store_true',
+                            help="Borra cada archivo de 'resultados/' una vez copiado al almacén")
+
+    def handle(self, *args, **options):
+        migrados = duplicados = faltantes = 0
+        ahorrados = 0
+        for documento in Documento.objects.filter(contenido__isnull=True).iterator(chunk_size=200):
+            original = documento.archivo.name
+            if not original or not default_storage.exists(original):
+                faltantes += 1
+                continue
+            with default_storage.open(original, 'rb') as archivo:
+                if not asignar_contenido(documento, archivo, os.path.basename(original)):
+                    duplicados += 1
+                    ahorrados += documento.contenido.tamano
+            documento.save(update_fields=['contenido', 'archivo', 'nombre_original'])
+            migrados += 1
+            # Otro documento viejo pudo compartir el mismo archivo: se borra cuando ya nadie lo usa
+            if options['borrar_originales'] and not Documento.objects.filter(archivo=original).exists():
+                default_storage.delete(original)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{migrados} documentos en el almacén ({duplicados} eran copias de otro: "
+            f"{filesizeformat(ahorrados)} menos)."
+        ))
+        if faltantes:
+            self.stdout.write(self.style.WARNING(f"{faltantes} documentos sin archivo en disco quedaron como estaban."))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from miapp.recordatorios import LOTE, despachar, programar
+
+
+class Command(BaseCommand):
+    help = ("Encola los recordatorios de las citas de mañana y de las próximas horas y los envía "
+            "por lotes. Se puede correr desde cron cada pocos minutos (nunca envía dos veces) "
+            "o dejarlo corriendo con --cada.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LOTE)
+        parser.add_argument('--por-segundo', type=float, default=None,
+                            help="Mensajes por segundo (por defecto RECORDATORIOS_POR_SEGUNDO).")
+        parser.add_argument('--cada', type=int, default=0, metavar='SEGUNDOS',
+                            help="Repetir indefinidamente cada tantos segundos.")
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.perf_counter()
+            encontradas = programar()
+            resumen = despachar(lote=options['lote'], por_segundo=options['por_segundo'])
+            ventanas = ", ".join(f"{ventana}: {cantidad}" for ventana, cantidad in encontradas.items())
+            self.stdout.write(self.style.SUCCESS(
+                f"Citas en ventana ({ventanas}). {resumen['enviados']} enviados, {resumen['reintentos']} "
+                f"para reintentar, {resumen['fallidos']} fallidos, {resumen['descartados']} descartados "
+                f"en {time.perf_counter() - inicio:.1f} s."
+            ))
+            if not options['cada']:
+                return
+            time.sleep(options['cada'])
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.exportacion import escribir_zip
+from miapp.models import Paciente
+
+
+class Command(BaseCommand):
+    help = "Exporta las historias clínicas (consultas, órdenes y documentos) a un ZIP con un PDF por paciente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Ruta del archivo ZIP a crear.")
+        parser.add_argument('--cedulas', nargs='+', help="Solo estos pacientes (por defecto, todos).")
+        parser.add_argument('--desde', help="Solo pacientes con citas desde esta fecha (AAAA-MM-DD).")
+
+    def handle(self, *args, **options):
+        pacientes = Paciente.objects.all()
+        if options['cedulas']:
+            pacientes = pacientes.filter(cedula__in=options['cedulas'])
+        if options['desde']:
+            pacientes = pacientes.filter(cita__fecha__gte=options['desde']).distinct()
+        ids = list(pacientes.order_by('apellido', 'nombre').values_list('id', flat=True))
+        if not ids:
+            raise CommandError("No hay pacientes que exportar.")
+
+        inicio = time.perf_counter()
+
+        def progreso(hechos, total):
+            transcurrido = time.perf_counter() - inicio
+            restante = transcurrido / hechos * (total - hechos)
+            self.stdout.write(f"\r  {hechos}/{total} historias ({hechos * 100 // total}%) - faltan ~{restante:.0f}s", ending='')
+            self.stdout.flush()
+
+        with open(options['salida'], 'wb') as salida:
+            fallidos = escribir_zip(salida, ids, progreso)
+        self.stdout.write('')
+
+        if fallidos:
+            self.stdout.write(self.style.WARNING(f"{len(fallidos)} historias fallaron (ver ERRORES.txt dentro del ZIP)."))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(ids) - len(fallidos)} historias exportadas a {options['salida']} en {time.perf_counter() - inicio:.1f}s."
+        ))
@@ -0,0 +1,202 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from miapp.busqueda import reindexar_pacientes
+from miapp.contabilidad import asignar_tasas_en_bloque, reconstruir_resumen
+from miapp.models import (
+    Paciente, Cita, Documento, PerfilUsuario, Especialidad, MovimientoContable, OrdenMedica,
+    CarruselImagen, PreguntaFrecuente, AvisoImportante, HorarioMedico, TasaCambio
+)
+
+NOMBRES = ['María', 'José', 'Luis', 'Ana', 'Carlos', 'Carmen', 'Jesús', 'Rosa', 'Pedro', 'Yelitza',
+           'Miguel', 'Andrea', 'Jorge', 'Daniela', 'Rafael', 'Gabriela', 'Ángel', 'Valentina', 'Ramón', 'Sofía']
+APELLIDOS = ['González', 'Rodríguez', 'Pérez', 'Hernández', 'García', 'Martínez', 'López', 'Díaz', 'Sánchez',
+             'Romero', 'Núñez', 'Márquez', 'Rojas', 'Guzmán', 'Medina', 'Castillo', 'Marcano', 'Salazar']
+ESPECIALIDADES = ['Medicina General', 'Cardiología', 'Pediatría', 'Traumatología', 'Ginecología', 'Dermatología']
+MOTIVOS = ['Control', 'Dolor de cabeza', 'Chequeo anual', 'Fiebre', 'Dolor lumbar', 'Resultados de laboratorio']
+INDICACIONES = ['Paracetamol 500mg c/8h', 'Control de tensión cada 4h', 'Reposo absoluto', 'Hidratación IV', 'Curas diarias']
+
+# Usuarios fijos para benchmark_vistas (uno por rol)
+CLAVE_BENCHMARK = 'benchmark-renacer'
+ROLES_BENCHMARK = ['medico', 'enfermera', 'contador', 'secretaria']
+
+
+class Command(BaseCommand):
+    help = "Genera datos sintéticos realistas con bulk_create por lotes (pacientes, citas, órdenes, libro, documentos, CMS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=1000)
+        parser.add_argument('--citas', type=int, default=5000)
+        parser.add_argument('--ordenes', type=int, default=2000)
+        parser.add_argument('--movimientos', type=int, default=5000)
+        parser.add_argument('--documentos', type=int, default=1000)
+        parser.add_argument('--medicos', type=int, default=10)
+        parser.add_argument('--dias', type=int, default=365, help="Las fechas se reparten entre hoy-dias y hoy+30")
+        parser.add_argument('--lote', type=int, default=5000, help="Filas por INSERT")
+        parser.add_argument('--semilla', type=int, default=None)
+
+    def handle(self, *args, **o):
+        self.rnd = random.Random(o['semilla'])
+        self.lote = o['lote']
+        self.hoy = datetime.date.today()
+        self.dias = o['dias']
+        inicio = time.perf_counter()
+
+        with transaction.atomic():
+            medicos = self.crear_personal(o['medicos'])
+            self.crear_horarios(medicos)
+            pacientes = self.crear_pacientes(o['pacientes'])
+            self.crear_citas(o['citas'], pacientes, medicos)
+            self.crear_ordenes(o['ordenes'], pacientes, medicos)
+            self.crear_tasas()
+            self.crear_movimientos(o['movimientos'])
+            self.crear_documentos(o['documentos'], pacientes)
+            self.crear_cms()
+
+        # bulk_create no dispara señales: reconstruimos los índices derivados
+        self.paso("Índice de búsqueda", lambda: reindexar_pacientes(Paciente.objects.filter(id__gte=min(pacientes, default=0))))
+        self.paso("Tasas de los movimientos", asignar_tasas_en_bloque)
+        self.paso("Resumen contable", reconstruir_resumen)
+        self.stdout.write(self.style.SUCCESS(f"Listo en {time.perf_counter() - inicio:.1f}s."))
+
+    # --- utilidades ---
+
+    def paso(self, nombre, funcion):
+        t = time.perf_counter()
+        resultado = funcion()
+        self.stdout.write(f"  {nombre}: {resultado} ({time.perf_counter() - t:.1f}s)")
+        return resultado
+
+    def fecha_aleatoria(self):
+        return self.hoy + datetime.timedelta(days=self.rnd.randint(-self.dias, 30))
+
+    def insertar(self, modelo, filas):
+        modelo.objects.bulk_create(filas, batch_size=self.lote)
+        return len(filas)
+
+    # --- generadores ---
+
+    def crear_personal(self, n_medicos):
+        especialidades = [Especialidad.objects.get_or_create(nombre=e)[0] for e in ESPECIALIDADES]
+        clave = make_password(CLAVE_BENCHMARK)  # un solo hash para todos: make_password es lento a propósito
+        sufijo = User.objects.count()
+
+        usuarios = [User(username=f"sint_medico_{sufijo}_{i}", first_name=self.rnd.choice(NOMBRES),
+                         last_name=self.rnd.choice(APELLIDOS), password=clave) for i in range(n_medicos)]
+        for rol in ROLES_BENCHMARK:
+            if not User.objects.filter(username=f"bench_{rol}").exists():
+                usuarios.append(User(username=f"bench_{rol}", first_name=rol.title(), last_name="Benchmark", password=clave))
+        self.paso("Usuarios", lambda: self.insertar(User, usuarios))
+
+        usuarios = {u.username: u for u in User.objects.filter(username__in=[u.username for u in usuarios])}
+        perfiles = []
+        for username, user in usuarios.items():
+            rol = 'medico' if username.startswith('sint_medico') else username.removeprefix('bench_')
+            perfiles.append(PerfilUsuario(usuario=user, cedula=f"S-{user.id}", rol=rol,
+                                          especialidad=self.rnd.choice(especialidades) if rol == 'medico' else None))
+        self.paso("Perfiles", lambda: self.insertar(PerfilUsuario, perfiles))
+        return list(User.objects.filter(perfilusuario__rol='medico').values_list('id', flat=True))
+
+    def crear_horarios(self, medicos):
+        # Lunes a viernes, turno de mañana o de tarde, en bloques de 15 min (como las citas generadas)
+        con_horario = set(HorarioMedico.objects.values_list('medico_id', flat=True))
+        filas = []
+        for medico_id in medicos:
+            if medico_id in con_horario:
+                continue
+            inicio = self.rnd.choice([7, 13])
+            filas += [HorarioMedico(medico_id=medico_id, dia_semana=dia, hora_inicio=datetime.time(inicio),
+                                    hora_fin=datetime.time(inicio + 5), duracion_turno=15) for dia in range(5)]
+        self.paso("Horarios", lambda: self.insertar(HorarioMedico, filas))
+
+    def crear_pacientes(self, n):
+        desde = Paciente.objects.aggregate(m=Max('id'))['m'] or 0
+        filas = []
+        for i in range(desde, desde + n):
+            nacimiento = datetime.date(self.rnd.randint(1940, 2020), self.rnd.randint(1, 12), self.rnd.randint(1, 28))
+            filas.append(Paciente(
+                cedula=f"S-{30000000 + i}", nombre=self.rnd.choice(NOMBRES), apellido=f"{self.rnd.choice(APELLIDOS)} {self.rnd.choice(APELLIDOS)}",
+                fecha_nacimiento=nacimiento, sexo=self.rnd.choice('MF'), telefono=f"0414{self.rnd.randint(1000000, 9999999)}",
+                correo=f"paciente{i}@correo.com",
+            ))
+        self.paso("Pacientes", lambda: self.insertar(Paciente, filas))
+        # Rango de ids en vez de un IN gigante (SQLite limita las variables por consulta)
+        ids = list(Paciente.objects.filter(id__gt=desde).values_list('id', flat=True))
+
+        # Un paciente con usuario para el rol "paciente" del benchmark
+        if not User.objects.filter(username='bench_paciente').exists() and ids:
+            user = User.objects.create_user('bench_paciente', password=CLAVE_BENCHMARK)
+            Paciente.objects.filter(id=ids[0]).update(usuario=user)
+        return ids
+
+    def crear_citas(self, n, pacientes, medicos):
+        # Turnos ya tomados: la base no admite dos citas activas del mismo médico a la misma hora
+        ocupados = set(Cita.objects.exclude(estado='cancelada').filter(
+            fecha__gte=self.hoy - datetime.timedelta(days=self.dias)).values_list('medico_id', 'fecha', 'hora'))
+        capacidad = len(medicos) * (self.dias + 31) * 11 * 4  # médicos × días × horas × cuartos de hora
+        n = min(n, capacidad - len(ocupados))
+        filas = []
+        while len(filas) < n:
+            fecha = self.fecha_aleatoria()
+            medico_id = self.rnd.choice(medicos)
+            hora = datetime.time(self.rnd.randint(7, 17), self.rnd.choice([0, 15, 30, 45]))
+            if (medico_id, fecha, hora) in ocupados:
+                continue
+            ocupados.add((medico_id, fecha, hora))
+            realizada = fecha < self.hoy
+            filas.append(Cita(
+                paciente_id=self.rnd.choice(pacientes), medico_id=medico_id, fecha=fecha, hora=hora,
+                motivo=self.rnd.choice(MOTIVOS), estado='atendida' if realizada else 'pendiente', realizada=realizada,
+                diagnostico="Evolución favorable" if realizada else None, tratamiento="Control en 3 meses" if realizada else None,
+            ))
+        self.paso("Citas", lambda: self.insertar(Cita, filas))
+
+    def crear_ordenes(self, n, pacientes, medicos):
+        filas = [OrdenMedica(paciente_id=self.rnd.choice(pacientes), medico_id=self.rnd.choice(medicos),
+                             indicacion=self.rnd.choice(INDICACIONES), ejecutada=self.rnd.random() < 0.8)
+                 for _ in range(n)]
+        self.paso("Órdenes", lambda: self.insertar(OrdenMedica, filas))
+
+    def crear_tasas(self):
+        # Una tasa BCV por día hábil del rango, subiendo poco a poco (los movimientos la toman después)
+        filas, tasa = [], Decimal('36.5')
+        for dia in range(-self.dias, 31):
+            fecha = self.hoy + datetime.timedelta(days=dia)
+            if fecha.weekday() < 5:
+                tasa = (tasa * Decimal(1 + self.rnd.uniform(-0.002, 0.006))).quantize(Decimal('0.0001'))
+                filas.append(TasaCambio(fecha=fecha, tasa=tasa))
+        self.paso("Tasas BCV", lambda: len(TasaCambio.objects.bulk_create(filas, batch_size=self.lote, ignore_conflicts=True)))
+
+    def crear_movimientos(self, n):
+        tipos = ['ingreso'] * 6 + ['egreso'] * 2 + ['nomina', 'impuesto']
+        filas = []
+        for i in range(n):
+            es_divisa = self.rnd.random() < 0.4
+            filas.append(MovimientoContable(
+                tipo=self.rnd.choice(tipos), monto=Decimal(self.rnd.randint(500, 50000)) / 100,
+                descripcion=f"Movimiento sintético {i}", fecha=self.fecha_aleatoria(),
+                referencia=str(self.rnd.randint(10 ** 7, 10 ** 8)), es_divisa=es_divisa,
+            ))
+        self.paso("Movimientos", lambda: self.insertar(MovimientoContable, filas))
+
+    def crear_documentos(self, n, pacientes):
+        # Solo la fila: el archivo no existe en disco (stub)
+        filas = [Documento(paciente_id=self.rnd.choice(pacientes), archivo=f"resultados/sintetico_{i}.pdf",
+                           descripcion=self.rnd.choice(['Hematología', 'Rayos X', 'Ecografía', 'Informe médico']))
+                 for i in range(n)]
+        self.paso("Documentos", lambda: self.insertar(Documento, filas))
+
+    def crear_cms(self):
+        if CarruselImagen.objects.exists():
+            return
+        self.insertar(CarruselImagen, [CarruselImagen(titulo=f"Bienvenido {i}", imagen=f"carrusel/sintetico_{i}.jpg", orden=i) for i in range(1, 4)])
+        self.insertar(PreguntaFrecuente, [PreguntaFrecuente(pregunta=f"¿Pregunta frecuente {i}?", respuesta="Respuesta de ejemplo.", orden=i) for i in range(1, 9)])
+        AvisoImportante.objects.create(mensaje="Horario de atención: lunes a viernes de 7am a 5pm.")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from miapp.imagenes import generar_variantes_carrusel
+from miapp.models import CarruselImagen
+
+
+class Command(BaseCommand):
+    help = "Genera (en línea) las variantes WebP/JPEG de los slides del carrusel. Útil para imágenes subidas antes del pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Regenerar también los slides que ya tienen variantes.")
+
+    def handle(self, *args, **options):
+        slides = CarruselImagen.objects.exclude(imagen='')
+        if not options['todas']:
+            slides = slides.filter(variantes={})
+        total = 0
+        for slide_id in slides.values_list('id', flat=True):
+            generar_variantes_carrusel(slide_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Variantes generadas para {total} slides."))
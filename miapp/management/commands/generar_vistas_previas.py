@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from miapp.imagenes import generar_vista_previa
+from miapp.models import ContenidoArchivo
+
+
+class Command(BaseCommand):
+    help = ("Genera (en línea) las vistas previas de los documentos del almacén. Útil después de "
+            "deduplicar_documentos, para los archivos subidos antes del pipeline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help="Regenerar también las que ya existen.")
+
+    def handle(self, *args, **options):
+        contenidos = ContenidoArchivo.objects.all()
+        if not options['todas']:
+            contenidos = contenidos.filter(vista_previa='')
+        total = 0
+        for contenido_id in contenidos.values_list('id', flat=True).iterator():
+            generar_vista_previa(contenido_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Vistas previas procesadas: {total} documentos."))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.importacion import leer_archivo, importar_pacientes, LOTE
+
+
+class Command(BaseCommand):
+    help = ("Importa pacientes desde un CSV o XLSX (primera fila: encabezados). Valida cada fila como "
+            "PacienteForm y crea o actualiza por cédula, en lotes. Las filas rechazadas van a un reporte CSV.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del .csv o .xlsx")
+        parser.add_argument('--lote', type=int, default=LOTE, help="Filas por INSERT/transacción")
+        parser.add_argument('--errores', help="Reporte de filas rechazadas (por defecto <archivo>.errores.csv)")
+        parser.add_argument('--codificacion', default='utf-8-sig', help="Del CSV; p. ej. latin-1 para exportaciones viejas")
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if not os.path.exists(ruta):
+            raise CommandError(f"No existe {ruta}.")
+        ruta_errores = options['errores'] or f"{os.path.splitext(ruta)[0]}.errores.csv"
+
+        def progreso(resumen):
+            self.stdout.write(f"\r  {resumen['leidas']} filas ({resumen['creadas']} nuevas, "
+                              f"{resumen['actualizadas']} actualizadas, {resumen['rechazadas']} rechazadas)", ending='')
+            self.stdout.flush()
+
+        with open(ruta, 'rb') as archivo, open(ruta_errores, 'w', newline='', encoding='utf-8') as reporte:
+            columnas, filas = leer_archivo(archivo, ruta, options['codificacion'])
+            if 'cedula' not in columnas:
+                raise CommandError(f"El archivo no tiene columna de cédula. Encabezados leídos: {', '.join(columnas)}.")
+            resumen = importar_pacientes(columnas, filas, reporte=reporte, lote=options['lote'], progreso=progreso)
+        self.stdout.write('')
+
+        if resumen['rechazadas']:
+            self.stdout.write(self.style.WARNING(f"{resumen['rechazadas']} filas rechazadas: ver {ruta_errores}."))
+        else:
+            os.remove(ruta_errores)
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['creadas']} pacientes nuevos y {resumen['actualizadas']} actualizados en {resumen['segundos']}s "
+            f"({resumen['filas_por_segundo']} filas/s)."
+        ))
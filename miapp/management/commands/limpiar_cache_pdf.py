@@ -0,0 +1,21 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Borra de PDF_CACHE_DIR los PDF que nadie pidió en los últimos N días (y los errores/temporales viejos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30)
+
+    def handle(self, *args, **options):
+        limite = time.time() - options['dias'] * 86400
+        borrados = 0
+        for archivo in Path(settings.PDF_CACHE_DIR).glob('*/*'):
+            if archivo.suffix in ('.pdf', '.err', '.tmp') and archivo.stat().st_mtime < limite:
+                archivo.unlink(missing_ok=True)
+                borrados += 1
+        self.stdout.write(self.style.SUCCESS(f"Caché de PDF: {borrados} archivos borrados."))
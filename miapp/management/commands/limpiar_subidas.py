@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from miapp.documentos import descartar_subidas_vencidas, purgar_contenidos_huerfanos
+from miapp.reservas import purgar_claves_vencidas
+
+
+class Command(BaseCommand):
+    help = ("Descarta las subidas de documentos abandonadas (sin fragmentos nuevos en SUBIDAS_VIGENCIA_HORAS), "
+            "borra del almacén los contenidos que ya ningún documento usa y las claves de idempotencia "
+            "de reservas vencidas (IDEMPOTENCIA_VIGENCIA_HORAS).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=settings.SUBIDAS_VIGENCIA_HORAS)
+        parser.add_argument('--horas-claves', type=int, default=settings.IDEMPOTENCIA_VIGENCIA_HORAS)
+
+    def handle(self, *args, **options):
+        subidas = descartar_subidas_vencidas(options['horas'])
+        contenidos, liberados = purgar_contenidos_huerfanos()
+        claves = purgar_claves_vencidas(options['horas_claves'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{subidas} subidas vencidas descartadas; {contenidos} contenidos huérfanos borrados "
+            f"({filesizeformat(liberados)} liberados); {claves} claves de reserva vencidas borradas."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from miapp.contabilidad import asignar_tasas_en_bloque, reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = "Recalcula la tabla ResumenContable (totales diarios/mensuales en Bs y USD) a partir de MovimientoContable."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asignar-tasas', action='store_true',
+                            help="Antes, dar a los movimientos sin tasa la de TasaCambio vigente en su fecha.")
+
+    def handle(self, *args, **options):
+        if options['asignar_tasas']:
+            self.stdout.write(f"Movimientos con tasa asignada: {asignar_tasas_en_bloque()}.")
+        filas = reconstruir_resumen()
+        self.stdout.write(self.style.SUCCESS(f"Resumen contable reconstruido: {filas} filas."))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from miapp.busqueda import reindexar_pacientes
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de pacientes (TokenBusquedaPaciente)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help="Pacientes por transacción")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = reindexar_pacientes(lote=options['lote'])
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"{total} pacientes indexados en {segundos:.1f}s."))
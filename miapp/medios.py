@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+# ==========================================
+# ENVÍO DE ARCHIVOS (MEDIA, DOCUMENTOS, PDF)
+# ==========================================
+# Un archivo grande servido desde Python ocupa un worker mientras dure la descarga.
+# Con MEDIOS_ENVIO la vista solo decide (permisos, caché) y le pasa la transferencia
+# al servidor web con una cabecera:
+#   'x-sendfile'        Apache (mod_xsendfile), lighttpd: ruta absoluta en X-Sendfile
+#   'x-accel-redirect'  nginx: ubicación 'internal' de MEDIOS_UBICACIONES_INTERNAS
+# El servidor web atiende entonces Range y envía el archivo con sendfile(). Sin
+# MEDIOS_ENVIO (desarrollo, pruebas) la respuesta sale de aquí con las mismas
+# garantías: ETag y Last-Modified (304/412), rangos de bytes (206/416) e If-Range.
+
+BLOQUE = 64 * 1024
+
+INMUTABLE_PUBLICO = 'public, max-age=31536000, immutable'
+INMUTABLE_PRIVADO = 'private, max-age=31536000, immutable'
+REVALIDAR_PUBLICO = 'public, max-age=3600'
+REVALIDAR_PRIVADO = 'private, no-cache'
+
+
+class RangoInsatisfacible(Exception):
+    pass
+
+
+def rango_pedido(cabecera, tamano):
+    """
+    (inicio, fin) de 'Range: bytes=a-b' (también 'a-' y '-n'), o None si no hay que
+    atenderlo: sin cabecera, mal formada o con varios rangos (se responde el archivo entero).
+    """
+    coincidencia = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', cabecera or '')
+    if not coincidencia or coincidencia.groups() == ('', ''):
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio:  # los últimos n bytes
+        sufijo = int(fin)
+        if not sufijo or not tamano:
+            raise RangoInsatisfacible
+        return max(tamano - sufijo, 0), tamano - 1
+    inicio = int(inicio)
+    if fin and int(fin) < inicio:
+        return None  # 'bytes=5-2' no es válido: se ignora
+    if inicio >= tamano:
+        raise RangoInsatisfacible
+    return inicio, min(int(fin), tamano - 1) if fin else tamano - 1
+
+def _if_range_vigente(request, etag, modificado):
+    """ If-Range: el rango solo vale si el cliente tiene la misma versión del archivo """
+    valor = request.headers.get('If-Range')
+    if not valor:
+        return True
+    if valor.startswith(('"', 'W/')):
+        return valor == etag
+    return parse_http_date_safe(valor) == int(modificado)
+
+def _leer(ruta, inicio, largo):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        while largo > 0:
+            bloque = archivo.read(min(BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+def _ubicacion_interna(ruta):
+    for raiz, ubicacion in getattr(settings, 'MEDIOS_UBICACIONES_INTERNAS', {}).items():
+        relativa = os.path.relpath(ruta, raiz)
+        if not relativa.startswith(os.pardir):
+            return ubicacion.rstrip('/') + '/' + relativa.replace(os.sep, '/')
+    return None
+
+def servir_archivo(request, ruta, cache_control, content_type=None, nombre=None, etag=None):
+    """
+    Respuesta para el archivo en ruta (ya autorizado por la vista). etag: por defecto
+    tamaño + fecha de modificación; si el nombre del archivo ya es su huella, pasarla.
+    """
+    estado = os.stat(ruta)
+    etag = quote_etag(etag or f"{estado.st_size:x}-{estado.st_mtime_ns:x}")
+    modificado = estado.st_mtime
+    cabeceras = {
+        'ETag': etag,
+        'Last-Modified': http_date(modificado),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+    if nombre:
+        cabeceras['Content-Disposition'] = content_disposition_header(False, nombre)
+    content_type = content_type or mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(modificado))
+    if condicional is not None:
+        for cabecera in ('ETag', 'Last-Modified', 'Cache-Control'):
+            condicional[cabecera] = cabeceras[cabecera]
+        return condicional
+
+    envio = getattr(settings, 'MEDIOS_ENVIO', None)
+    if envio == 'x-sendfile':
+        cabeceras['X-Sendfile'] = os.path.abspath(ruta)
+    elif envio == 'x-accel-redirect' and _ubicacion_interna(ruta):
+        cabeceras['X-Accel-Redirect'] = _ubicacion_interna(ruta)
+    if 'X-Sendfile' in cabeceras or 'X-Accel-Redirect' in cabeceras:
+        # Cuerpo vacío: el servidor web pone el archivo, su longitud y los rangos
+        return HttpResponse(content_type=content_type, headers=cabeceras)
+
+    try:
+        rango = rango_pedido(request.headers.get('Range'), estado.st_size) if _if_range_vigente(request, etag, modificado) else None
+    except RangoInsatisfacible:
+        return HttpResponse(status=416, headers={'Content-Range': f"bytes */{estado.st_size}"})
+    if rango is None:
+        # wsgi.file_wrapper (sendfile en gunicorn/uwsgi) cuando el servidor lo ofrece
+        response = FileResponse(open(ruta, 'rb'), content_type=content_type)
+    else:
+        inicio, fin = rango
+        response = StreamingHttpResponse(_leer(ruta, inicio, fin - inicio + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {inicio}-{fin}/{estado.st_size}"
+        response['Content-Length'] = fin - inicio + 1
+    for cabecera, valor in cabeceras.items():
+        response[cabecera] = valor
+    return response
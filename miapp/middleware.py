@@ -0,0 +1,103 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# PRESUPUESTO DE CONSULTAS SQL POR VISTA
+# ==========================================
+
+class RegistroConsultas:
+    """
+    execute_wrapper de Django: cuenta las consultas y suma su tiempo. Con registrar_sql
+    guarda además cada SQL y sus parámetros (llevan datos de pacientes y crecen con cada
+    consulta: en producción no).
+    """
+
+    def __init__(self, registrar_sql=False):
+        self.cantidad = 0
+        self.tiempo = 0.0  # segundos
+        self.registrar_sql = registrar_sql
+        self.sql = []
+        self.parametros = []  # en paralelo a sql (asesor_indices los necesita para el EXPLAIN)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.cantidad += 1
+            if self.registrar_sql:
+                self.sql.append(sql)
+                self.parametros.append(params)
+
+    @property
+    def tiempo_ms(self):
+        return self.tiempo * 1000
+
+
+class PresupuestoConsultasMiddleware:
+    """
+    Mide cuántas consultas hace cada vista y cuánto tardan.
+    Deja el registro en request.consultas_sql (lo usan las pruebas y los benchmarks)
+    y avisa en el log cuando una vista supera su presupuesto en miapp/urls.py.
+    El SQL de cada consulta solo se guarda con DEBUG o CONSULTAS_REGISTRAR_SQL.
+    Bajo ASGI no mide: las consultas corren en otros hilos, con otras conexiones,
+    y el execute_wrapper no las ve. Los presupuestos se vigilan con WSGI y en las pruebas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        registro = RegistroConsultas(registrar_sql=settings.DEBUG or settings.CONSULTAS_REGISTRAR_SQL)
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(registro))
+            response = self.get_response(request)
+
+        request.consultas_sql = registro
+        nombre = getattr(request.resolver_match, 'url_name', None)
+        # Los presupuestos son de lectura: un POST que reserva o guarda hace más consultas y está bien
+        presupuesto = presupuesto_de(nombre) if request.method in ('GET', 'HEAD') else None
+        if presupuesto is not None and registro.cantidad > presupuesto:
+            logger.warning("La vista '%s' hizo %d consultas (presupuesto: %d, %.1f ms de SQL)",
+                           nombre, registro.cantidad, presupuesto, registro.tiempo_ms)
+        if settings.DEBUG:
+            response['Server-Timing'] = f'sql;desc="{registro.cantidad} consultas";dur={registro.tiempo_ms:.1f}'
+        return response
+
+
+def presupuesto_de(nombre_url):
+    # Import tardío: urls.py importa las vistas y las vistas no deben depender del middleware
+    from .urls import PRESUPUESTOS_CONSULTAS
+    return PRESUPUESTOS_CONSULTAS.get(nombre_url)
+
+
+class UrlconfAsgiMiddleware:
+    """ Bajo ASGI resuelve con settings.ASGI_URLCONF (las mismas rutas, con el dashboard async) """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASGI_URLCONF
+        return self.get_response(request)
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-18 05:44
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def poblar_resumen(apps, schema_editor):
+    # Llenamos el resumen con el libro que ya existe
+    MovimientoContable = apps.get_model('miapp', 'MovimientoContable')
+    ResumenContable = apps.get_model('miapp', 'ResumenContable')
+
+    filas = []
+    por_dia = MovimientoContable.objects.values('fecha', 'tipo', 'es_divisa').annotate(suma=Sum('monto'), n=Count('id')).order_by()
+    for r in por_dia:
+        filas.append(ResumenContable(periodo='dia', fecha=r['fecha'], tipo=r['tipo'], es_divisa=r['es_divisa'], total=r['suma'], cantidad=r['n']))
+    por_mes = MovimientoContable.objects.annotate(mes=TruncMonth('fecha')).values('mes', 'tipo', 'es_divisa').annotate(suma=Sum('monto'), n=Count('id')).order_by()
+    for r in por_mes:
+        filas.append(ResumenContable(periodo='mes', fecha=r['mes'], tipo=r['tipo'], es_divisa=r['es_divisa'], total=r['suma'], cantidad=r['n']))
+    ResumenContable.objects.bulk_create(filas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenContable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Diario'), ('mes', 'Mensual')], max_length=3)),
+                ('fecha', models.DateField(help_text='Día del movimiento, o el primer día del mes si el periodo es mensual')),
+                ('tipo', models.CharField(choices=[('ingreso', 'Ingreso (Consulta/Cirugía)'), ('egreso', 'Egreso (Gasto Operativo)'), ('nomina', 'Pago de Nómina'), ('impuesto', 'Pago de Impuestos (SENIAT/Alcaldía)')], max_length=20)),
+                ('es_divisa', models.BooleanField(default=False)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('periodo', 'fecha', 'tipo', 'es_divisa'), name='resumen_contable_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
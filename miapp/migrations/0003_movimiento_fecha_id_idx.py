@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0002_resumencontable'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientocontable',
+            index=models.Index(fields=['-fecha', '-id'], name='mov_fecha_id_idx'),
+        ),
+    ]
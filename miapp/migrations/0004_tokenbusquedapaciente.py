@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 05:46
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia de miapp.busqueda.tokens_paciente tal como era al crear el índice: la migración
+# no debe importar módulos que usan los modelos actuales
+def _tokens(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return re.findall(r'[a-z0-9]+', ''.join(c for c in texto if not unicodedata.combining(c)).lower())
+
+def _tokens_paciente(paciente):
+    resultado = set(_tokens(paciente.nombre)) | set(_tokens(paciente.apellido))
+    digitos = re.sub(r'\D', '', paciente.cedula or '')
+    if digitos:
+        resultado.add(digitos)
+    return {t[:100] for t in resultado}
+
+def indexar_existentes(apps, schema_editor):
+    Paciente = apps.get_model('miapp', 'Paciente')
+    TokenBusquedaPaciente = apps.get_model('miapp', 'TokenBusquedaPaciente')
+    filas = [
+        TokenBusquedaPaciente(paciente_id=p.id, token=t)
+        for p in Paciente.objects.only('id', 'nombre', 'apellido', 'cedula').iterator(chunk_size=2000)
+        for t in _tokens_paciente(p)
+    ]
+    TokenBusquedaPaciente.objects.bulk_create(filas, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0003_movimiento_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenBusquedaPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_busqueda', to='miapp.paciente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', '-paciente'], name='token_paciente_idx')],
+            },
+        ),
+        migrations.RunPython(indexar_existentes, migrations.RunPython.noop),
+    ]
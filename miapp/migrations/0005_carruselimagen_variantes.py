@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0004_tokenbusquedapaciente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carruselimagen',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
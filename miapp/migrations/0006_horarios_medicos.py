@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 06:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0005_carruselimagen_variantes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcepcionHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'ordering': ['fecha', 'hora_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HorarioMedico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('duracion_turno', models.PositiveSmallIntegerField(default=30, help_text='Minutos por cita')),
+                ('activo', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['medico', 'dia_semana', 'hora_inicio'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['medico', 'fecha', 'hora'], name='cita_medico_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='excepcionhorario',
+            name='medico',
+            field=models.ForeignKey(limit_choices_to={'perfilusuario__rol': 'medico'}, on_delete=django.db.models.deletion.CASCADE, related_name='excepciones_horario', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='horariomedico',
+            name='medico',
+            field=models.ForeignKey(limit_choices_to={'perfilusuario__rol': 'medico'}, on_delete=django.db.models.deletion.CASCADE, related_name='horarios', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='excepcionhorario',
+            index=models.Index(fields=['medico', 'fecha'], name='excepcion_medico_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='horariomedico',
+            constraint=models.CheckConstraint(condition=models.Q(('hora_fin__gt', models.F('hora_inicio'))), name='horario_fin_despues_inicio'),
+        ),
+        migrations.AddConstraint(
+            model_name='horariomedico',
+            constraint=models.CheckConstraint(condition=models.Q(('duracion_turno__gt', 0)), name='horario_duracion_positiva'),
+        ),
+    ]
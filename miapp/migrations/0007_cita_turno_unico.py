@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 06:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def cancelar_duplicadas(apps, schema_editor):
+    # Antes de la restricción: si ya hay dos citas activas en el mismo turno, se conserva
+    # la primera registrada y las demás pasan a 'cancelada' (siguen visibles en el admin).
+    Cita = apps.get_model('miapp', 'Cita')
+    activas = Cita.objects.exclude(estado='cancelada')
+    repetidos = activas.values('medico_id', 'fecha', 'hora').annotate(n=Count('id'), primera=Min('id')).filter(n__gt=1)
+    for turno in repetidos:
+        activas.filter(medico_id=turno['medico_id'], fecha=turno['fecha'], hora=turno['hora']).exclude(
+            id=turno['primera']
+        ).update(estado='cancelada')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0006_horarios_medicos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudIdempotente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(cancelar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'cancelada'), _negated=True), fields=('medico', 'fecha', 'hora'), name='cita_turno_unico'),
+        ),
+        migrations.AddField(
+            model_name='solicitudidempotente',
+            name='cita',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='miapp.cita'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def copiar_ultima_fecha(apps, schema_editor):
+    # Las órdenes existentes toman su último cambio conocido, no la hora de la migración
+    OrdenMedica = apps.get_model('miapp', 'OrdenMedica')
+    OrdenMedica.objects.update(fecha_modificacion=Coalesce('fecha_ejecucion', 'fecha_creacion'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0007_cita_turno_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordenmedica',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copiar_ultima_fecha, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 06:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0008_ordenmedica_fecha_modificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['paciente', '-fecha'], name='cita_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientocontable',
+            index=models.Index(fields=['tipo', '-fecha', '-id'], name='mov_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedica',
+            index=models.Index(fields=['medico', '-fecha_creacion'], name='orden_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedica',
+            index=models.Index(condition=models.Q(('ejecutada', False)), fields=['fecha_creacion', 'id'], name='orden_pendiente_idx'),
+        ),
+    ]
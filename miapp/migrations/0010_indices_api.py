@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 06:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0009_indices_consultas_frecuentes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['-fecha', '-id'], name='cita_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedica',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['-fecha_registro', '-id'], name='paciente_registro_idx'),
+        ),
+    ]
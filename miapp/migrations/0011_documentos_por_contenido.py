@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 07:06
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0010_indices_api'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContenidoArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(max_length=64, unique=True)),
+                ('archivo', models.FileField(upload_to='documentos/')),
+                ('tamano', models.BigIntegerField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='nombre_original',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='documento',
+            name='contenido',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='miapp.contenidoarchivo'),
+        ),
+        migrations.CreateModel(
+            name='SubidaDocumento',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('descripcion', models.CharField(max_length=200)),
+                ('nombre_original', models.CharField(max_length=255)),
+                ('tamano', models.BigIntegerField()),
+                ('recibidos', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, help_text='Declarado por el cliente; se verifica al completar', max_length=64)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='miapp.paciente')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0011_documentos_por_contenido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['archivo'], name='documento_archivo_idx'),
+        ),
+    ]
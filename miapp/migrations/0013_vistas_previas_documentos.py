@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0012_documento_archivo_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contenidoarchivo',
+            name='paginas',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='contenidoarchivo',
+            name='vista_previa',
+            field=models.FileField(blank=True, editable=False, upload_to='documentos/'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0013_vistas_previas_documentos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recordatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ventana', models.CharField(choices=[('dia_anterior', 'Día anterior'), ('mismo_dia', 'Mismo día')], max_length=20)),
+                ('canal', models.CharField(choices=[('sms', 'SMS'), ('correo', 'Correo')], max_length=10)),
+                ('destino', models.CharField(max_length=254)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido'), ('descartado', 'Descartado')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField()),
+                ('lote', models.UUIDField(blank=True, editable=False, null=True)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['fecha', 'hora'], name='cita_fecha_hora_idx'),
+        ),
+        migrations.AddField(
+            model_name='recordatorio',
+            name='cita',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to='miapp.cita'),
+        ),
+        migrations.AddIndex(
+            model_name='recordatorio',
+            index=models.Index(fields=['estado', 'proximo_intento'], name='recordatorio_cola_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recordatorio',
+            constraint=models.UniqueConstraint(fields=('cita', 'ventana', 'canal'), name='recordatorio_unico'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 07:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0014_recordatorios'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cita',
+            name='cita_paciente_fecha_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['paciente', '-fecha', '-hora', '-id'], name='cita_paciente_momento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documento',
+            index=models.Index(fields=['paciente', '-fecha_subida', '-id'], name='documento_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedica',
+            index=models.Index(fields=['paciente', '-fecha_creacion', '-id'], name='orden_paciente_fecha_idx'),
+        ),
+    ]
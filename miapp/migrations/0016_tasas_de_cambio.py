@@ -0,0 +1,101 @@
+# Generated by Django 6.0 on 2026-10-18 07:26
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def tasas_desde_el_libro(apps, schema_editor):
+    """ La tabla empieza con las tasas ya escritas en el libro (la mayor de cada día, si hay varias) """
+    MovimientoContable = apps.get_model('miapp', 'MovimientoContable')
+    TasaCambio = apps.get_model('miapp', 'TasaCambio')
+    por_dia = MovimientoContable.objects.filter(tasa_cambio__gt=0).values('fecha').annotate(tasa=Max('tasa_cambio')).order_by()
+    TasaCambio.objects.bulk_create([TasaCambio(fecha=r['fecha'], tasa=r['tasa']) for r in por_dia.iterator()],
+                                   batch_size=500, ignore_conflicts=True)
+
+
+def totales_en_dos_monedas(apps, schema_editor):
+    """
+    Los movimientos sin tasa toman la vigente en su fecha y el resumen se rehace con los totales
+    en Bs y USD, convertidos uno a uno como contabilidad.convertir (copiado: la migración usa los
+    modelos históricos y no puede depender del código de hoy)
+    """
+    MovimientoContable = apps.get_model('miapp', 'MovimientoContable')
+    ResumenContable = apps.get_model('miapp', 'ResumenContable')
+    TasaCambio = apps.get_model('miapp', 'TasaCambio')
+
+    tasas = list(TasaCambio.objects.order_by('fecha').values_list('fecha', 'tasa'))
+    for i, (fecha, tasa) in enumerate(tasas):
+        periodo = MovimientoContable.objects.filter(tasa_cambio=0, fecha__gte=fecha)
+        if i + 1 < len(tasas):
+            periodo = periodo.filter(fecha__lt=tasas[i + 1][0])
+        periodo.update(tasa_cambio=tasa)
+
+    centimo, cero = Decimal('0.01'), Decimal('0')
+    acumulado = defaultdict(lambda: [cero, cero, cero, 0, 0])
+    movimientos = MovimientoContable.objects.values_list('fecha', 'tipo', 'es_divisa', 'monto', 'tasa_cambio')
+    for fecha, tipo, es_divisa, monto, tasa in movimientos.iterator(chunk_size=5000):
+        if es_divisa:
+            ves, usd = ((monto * tasa).quantize(centimo) if tasa else None), monto
+        else:
+            ves, usd = monto, ((monto / tasa).quantize(centimo) if tasa else None)
+        for periodo, fecha_periodo in [('dia', fecha), ('mes', fecha.replace(day=1))]:
+            fila = acumulado[(periodo, fecha_periodo, tipo, es_divisa)]
+            fila[0] += monto
+            fila[1] += ves or cero
+            fila[2] += usd or cero
+            fila[3] += ves is None or usd is None
+            fila[4] += 1
+
+    ResumenContable.objects.all().delete()
+    ResumenContable.objects.bulk_create([
+        ResumenContable(periodo=periodo, fecha=fecha, tipo=tipo, es_divisa=es_divisa, total=total,
+                        total_ves=ves, total_usd=usd, sin_tasa=sin_tasa, cantidad=cantidad)
+        for (periodo, fecha, tipo, es_divisa), (total, ves, usd, sin_tasa, cantidad) in acumulado.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0015_linea_de_tiempo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TasaCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('tasa', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('fecha_registro', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddField(
+            model_name='resumencontable',
+            name='sin_tasa',
+            field=models.IntegerField(default=0, help_text='Movimientos que aún no tienen tasa: no suman en la otra moneda'),
+        ),
+        migrations.AddField(
+            model_name='resumencontable',
+            name='total_usd',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='resumencontable',
+            name='total_ves',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16),
+        ),
+        migrations.AlterField(
+            model_name='movimientocontable',
+            name='tasa_cambio',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='Tasa BCV del día. Vacío: la de la tabla de tasas para esa fecha', max_digits=14),
+        ),
+        migrations.RunPython(tasas_desde_el_libro, migrations.RunPython.noop),
+        migrations.RunPython(totales_en_dos_monedas, migrations.RunPython.noop),
+    ]
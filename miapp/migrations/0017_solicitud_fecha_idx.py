@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0016_tasas_de_cambio'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='solicitudidempotente',
+            index=models.Index(fields=['fecha_creacion'], name='solicitud_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0017_solicitud_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ordenmedica',
+            name='orden_pendiente_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ordenmedica',
+            index=models.Index(condition=models.Q(('ejecutada', False)), fields=['fecha_creacion', 'id', 'fecha_modificacion'], name='orden_pendiente_idx'),
+        ),
+    ]
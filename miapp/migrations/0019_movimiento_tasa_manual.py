@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+def marcar_tasas_manuales(apps, schema_editor):
+    """
+    Hasta ahora no se guardaba el origen de la tasa: se toma como manual la que no coincide con la
+    de TasaCambio vigente en su fecha. La que coincide sigue a la tabla si luego se corrige.
+    """
+    MovimientoContable = apps.get_model('miapp', 'MovimientoContable')
+    TasaCambio = apps.get_model('miapp', 'TasaCambio')
+    con_tasa = MovimientoContable.objects.filter(tasa_cambio__gt=0)
+    tasas = list(TasaCambio.objects.order_by('fecha').values_list('fecha', 'tasa'))
+    if not tasas:
+        con_tasa.update(tasa_manual=True)
+        return
+    con_tasa.filter(fecha__lt=tasas[0][0]).update(tasa_manual=True)
+    for i, (fecha, tasa) in enumerate(tasas):
+        periodo = con_tasa.filter(fecha__gte=fecha).exclude(tasa_cambio=tasa)
+        if i + 1 < len(tasas):
+            periodo = periodo.filter(fecha__lt=tasas[i + 1][0])
+        periodo.update(tasa_manual=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0018_feed_ordenes_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientocontable',
+            name='tasa_manual',
+            field=models.BooleanField(default=False, help_text='Tasa escrita a mano: no cambia si se corrige la tasa BCV del día'),
+        ),
+        migrations.RunPython(marcar_tasas_manuales, migrations.RunPython.noop),
+    ]
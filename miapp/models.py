@@ -1,5 +1,8 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from datetime import date
 
 # ==========================================
@@ -60,11 +63,60 @@ class MovimientoContable(models.Model):
     
     # Campo para control venezolano
     es_divisa = models.BooleanField(default=False, verbose_name="¿Es en Dólares?")
-    tasa_cambio = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Tasa BCV del día")
+    # Se completa al guardar con la TasaCambio vigente en 'fecha' (signals.py); 0 mientras no haya tasa cargada
+    tasa_cambio = models.DecimalField(max_digits=14, decimal_places=4, default=0,
+                                      help_text="Tasa BCV del día. Vacío: la de la tabla de tasas para esa fecha")
+    # Se marca sola al escribir (o cambiar) la tasa; sin marcar, la tasa sigue a la de TasaCambio aunque se corrija
+    tasa_manual = models.BooleanField(default=False, help_text="Tasa escrita a mano: no cambia si se corrige la tasa BCV del día")
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor del libro: ORDER BY fecha DESC, id DESC
+            models.Index(fields=['-fecha', '-id'], name='mov_fecha_id_idx'),
+            # El mismo libro filtrado por tipo (ingreso/egreso)
+            models.Index(fields=['tipo', '-fecha', '-id'], name='mov_tipo_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.monto}"
 
+class TasaCambio(models.Model):
+    """ Tasa oficial BCV (bolívares por dólar) de un día; sin publicación (fin de semana, feriado) rige la anterior """
+    fecha = models.DateField(unique=True)
+    tasa = models.DecimalField(max_digits=14, decimal_places=4)
+    fecha_registro = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.fecha}: Bs. {self.tasa}"
+
+class ResumenContable(models.Model):
+    """ Totales pre-agregados del libro (por día y por mes). Se mantiene con señales en signals.py """
+    PERIODOS = [
+        ('dia', 'Diario'),
+        ('mes', 'Mensual'),
+    ]
+    periodo = models.CharField(max_length=3, choices=PERIODOS)
+    fecha = models.DateField(help_text="Día del movimiento, o el primer día del mes si el periodo es mensual")
+    tipo = models.CharField(max_length=20, choices=MovimientoContable.TIPOS)
+    es_divisa = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Los mismos movimientos en las dos monedas, convertidos uno a uno con su tasa (contabilidad.convertir)
+    total_ves = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_usd = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sin_tasa = models.IntegerField(default=0, help_text="Movimientos que aún no tienen tasa: no suman en la otra moneda")
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'fecha', 'tipo', 'es_divisa'], name='resumen_contable_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_periodo_display()} {self.fecha} - {self.tipo}: {self.total}"
+
 # ==========================================
 # 3. MÓDULO ENFERMERÍA Y ÓRDENES
 # ==========================================
@@ -80,6 +132,22 @@ class OrdenMedica(models.Model):
     nota_enfermeria = models.TextField(blank=True, help_text="Observaciones de la enfermera al aplicar")
     enfermera_responsable = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="ordenes_atendidas")
     fecha_ejecucion = models.DateTimeField(null=True, blank=True)
+    # Cursor del feed de enfermería: toda modificación (crear, ejecutar, editar) la mueve
+    fecha_modificacion = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Últimas órdenes de un médico (dashboard_medico)
+            models.Index(fields=['medico', '-fecha_creacion'], name='orden_medico_fecha_idx'),
+            # Cola de enfermería y su feed: solo las pendientes, que son pocas frente al histórico.
+            # Con fecha_modificacion la versión del feed (miapp/ordenes.py) se lee solo del índice
+            models.Index(fields=['fecha_creacion', 'id', 'fecha_modificacion'], condition=models.Q(ejecutada=False),
+                         name='orden_pendiente_idx'),
+            # Paginación por cursor de la API (miapp/api.py)
+            models.Index(fields=['-fecha_creacion', '-id'], name='orden_fecha_id_idx'),
+            # Línea de tiempo del paciente (miapp/historia.py)
+            models.Index(fields=['paciente', '-fecha_creacion', '-id'], name='orden_paciente_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Orden para {self.paciente} - Dr. {self.medico.last_name}"
@@ -101,6 +169,12 @@ class Paciente(models.Model):
     enfermedades_cronicas = models.TextField(blank=True, default="Ninguna")
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Paginación por cursor de la API (miapp/api.py)
+            models.Index(fields=['-fecha_registro', '-id'], name='paciente_registro_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
     
@@ -111,6 +185,17 @@ class Paciente(models.Model):
             return today.year - self.fecha_nacimiento.year - ((today.month, today.day) < (self.fecha_nacimiento.month, self.fecha_nacimiento.day))
         return 0
 
+class TokenBusquedaPaciente(models.Model):
+    """ Índice de búsqueda: una fila por palabra normalizada (sin acentos) del nombre/apellido y por la cédula """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name="tokens_busqueda")
+    token = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            # Búsqueda por prefijo: token >= 'per' AND token < 'per\uffff' ORDER BY token, paciente DESC
+            models.Index(fields=['token', '-paciente'], name='token_paciente_idx'),
+        ]
+
 class Cita(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
     medico = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'perfilusuario__rol': 'medico'})
@@ -122,15 +207,153 @@ class Cita(models.Model):
     tratamiento = models.TextField(blank=True, null=True)
     realizada = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Agenda de un médico por rango de fechas (miapp/disponibilidad.py)
+            models.Index(fields=['medico', 'fecha', 'hora'], name='cita_medico_fecha_idx'),
+            # Historial de un paciente, de la más reciente a la más antigua (portal y línea de tiempo, miapp/historia.py)
+            models.Index(fields=['paciente', '-fecha', '-hora', '-id'], name='cita_paciente_momento_idx'),
+            # Paginación por cursor de la API (miapp/api.py)
+            models.Index(fields=['-fecha', '-id'], name='cita_fecha_id_idx'),
+            # Citas de una ventana de recordatorios: fecha = X y hora entre A y B (miapp/recordatorios.py)
+            models.Index(fields=['fecha', 'hora'], name='cita_fecha_hora_idx'),
+        ]
+        constraints = [
+            # Un turno activo por médico/fecha/hora (las canceladas liberan el turno). Ver miapp/reservas.py
+            models.UniqueConstraint(
+                fields=['medico', 'fecha', 'hora'], condition=~models.Q(estado='cancelada'), name='cita_turno_unico'
+            ),
+        ]
+
     def __str__(self):
         return f"Cita {self.paciente} con Dr. {self.medico.last_name}"
 
+class Recordatorio(models.Model):
+    """ Un aviso de cita por ventana y canal; la restricción única es la que evita mandarlo dos veces """
+    VENTANAS = [('dia_anterior', 'Día anterior'), ('mismo_dia', 'Mismo día')]
+    CANALES = [('sms', 'SMS'), ('correo', 'Correo')]
+    ESTADOS = [
+        ('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'), ('descartado', 'Descartado'),
+    ]
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name='recordatorios')
+    ventana = models.CharField(max_length=20, choices=VENTANAS)
+    canal = models.CharField(max_length=10, choices=CANALES)
+    destino = models.CharField(max_length=254)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # Pendiente: desde cuándo se puede intentar. Enviando: hasta cuándo es de quien lo tomó.
+    proximo_intento = models.DateTimeField()
+    lote = models.UUIDField(null=True, blank=True, editable=False)
+    ultimo_error = models.TextField(blank=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cita', 'ventana', 'canal'], name='recordatorio_unico'),
+        ]
+        indexes = [models.Index(fields=['estado', 'proximo_intento'], name='recordatorio_cola_idx')]
+
+    def __str__(self):
+        return f"{self.get_ventana_display()} por {self.canal} - cita {self.cita_id} ({self.estado})"
+
+class SolicitudIdempotente(models.Model):
+    """ Clave única que manda el cliente al reservar: si el mismo envío llega dos veces, se devuelve la misma cita """
+    clave = models.CharField(max_length=64, unique=True)
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Limpieza de las vencidas (reservas.purgar_claves_vencidas)
+            models.Index(fields=['fecha_creacion'], name='solicitud_fecha_idx'),
+        ]
+
+class HorarioMedico(models.Model):
+    """ Plantilla semanal: el médico atiende tal día entre hora_inicio y hora_fin, en turnos de N minutos """
+    DIAS_SEMANA = [
+        (0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'),
+        (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo'),
+    ]
+    medico = models.ForeignKey(User, on_delete=models.CASCADE, related_name="horarios", limit_choices_to={'perfilusuario__rol': 'medico'})
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS_SEMANA)
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    duracion_turno = models.PositiveSmallIntegerField(default=30, help_text="Minutos por cita")
+    activo = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['medico', 'dia_semana', 'hora_inicio']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(hora_fin__gt=models.F('hora_inicio')), name='horario_fin_despues_inicio'),
+            models.CheckConstraint(condition=models.Q(duracion_turno__gt=0), name='horario_duracion_positiva'),
+        ]
+
+    def __str__(self):
+        return f"Dr. {self.medico.last_name} - {self.get_dia_semana_display()} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}"
+
+class ExcepcionHorario(models.Model):
+    """ Bloqueo puntual (vacaciones, congreso, quirófano). Sin horas = todo el día. """
+    medico = models.ForeignKey(User, on_delete=models.CASCADE, related_name="excepciones_horario", limit_choices_to={'perfilusuario__rol': 'medico'})
+    fecha = models.DateField()
+    hora_inicio = models.TimeField(null=True, blank=True)
+    hora_fin = models.TimeField(null=True, blank=True)
+    motivo = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['fecha', 'hora_inicio']
+        indexes = [models.Index(fields=['medico', 'fecha'], name='excepcion_medico_fecha_idx')]
+
+    def __str__(self):
+        rango = f"{self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}" if self.hora_inicio and self.hora_fin else "todo el día"
+        return f"Dr. {self.medico.last_name} - {self.fecha:%d/%m/%Y} ({rango})"
+
+class ContenidoArchivo(models.Model):
+    """ Bytes de un archivo guardados una sola vez, con su SHA-256 como nombre (ver miapp/documentos.py) """
+    huella = models.CharField(max_length=64, unique=True)
+    archivo = models.FileField(upload_to='documentos/')
+    tamano = models.BigIntegerField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Las llena miapp.imagenes en segundo plano: imagen chica de la primera página (o de la
+    # foto) para la ficha del paciente, y cuántas páginas tiene si es un PDF
+    vista_previa = models.FileField(upload_to='documentos/', blank=True, editable=False)
+    paginas = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"{self.huella[:12]} ({self.tamano} bytes)"
+
 class Documento(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
+    # Apunta al mismo archivo que contenido.archivo; los documentos anteriores al almacén
+    # (contenido vacío) siguen en 'resultados/' hasta pasar por deduplicar_documentos
     archivo = models.FileField(upload_to='resultados/')
+    contenido = models.ForeignKey(ContenidoArchivo, on_delete=models.PROTECT, null=True, blank=True, editable=False)
+    nombre_original = models.CharField(max_length=255, blank=True, editable=False)
     descripcion = models.CharField(max_length=200)
     fecha_subida = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # servir_medio busca el documento (y su permiso) por la ruta pedida
+            models.Index(fields=['archivo'], name='documento_archivo_idx'),
+            # Línea de tiempo del paciente (miapp/historia.py)
+            models.Index(fields=['paciente', '-fecha_subida', '-id'], name='documento_paciente_fecha_idx'),
+        ]
+
+class SubidaDocumento(models.Model):
+    """ Subida por partes en curso: lo recibido está en SUBIDAS_DIR/<id>.part hasta completar 'tamano' """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    descripcion = models.CharField(max_length=200)
+    nombre_original = models.CharField(max_length=255)
+    tamano = models.BigIntegerField()
+    recibidos = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Declarado por el cliente; se verifica al completar")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
 # ==========================================
 # 5. CMS (EXISTENTE)
 # ==========================================
@@ -142,8 +365,30 @@ class CarruselImagen(models.Model):
     overlay = models.CharField(max_length=5, choices=OPACIDAD_CHOICES, default='0.5')
     orden = models.IntegerField(default=1)
     activo = models.BooleanField(default=True)
+    # {'webp': [{'ancho': 480, 'archivo': 'carrusel/variantes/...'}, ...], 'jpg': [...]}
+    # Las llena miapp.imagenes en segundo plano; vacío mientras tanto se sirve el original.
+    variantes = models.JSONField(default=dict, blank=True, editable=False)
     class Meta: ordering = ['orden']
 
+    def _srcset(self, formato):
+        return ", ".join(f"{default_storage.url(v['archivo'])} {v['ancho']}w" for v in self.variantes.get(formato, []))
+
+    @property
+    def srcset_webp(self):
+        return self._srcset('webp')
+
+    @property
+    def srcset_jpg(self):
+        return self._srcset('jpg')
+
+    @property
+    def url_predeterminada(self):
+        """ Para navegadores sin srcset: la variante JPEG más cercana a 1440px, o el original """
+        jpgs = self.variantes.get('jpg')
+        if not jpgs:
+            return self.imagen.url
+        return default_storage.url(min(jpgs, key=lambda v: abs(v['ancho'] - 1440))['archivo'])
+
 class PreguntaFrecuente(models.Model):
     pregunta = models.CharField(max_length=255)
     respuesta = models.TextField()
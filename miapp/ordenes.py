@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+import time
+
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .asincrono import en_hilo
+from .cache_versiones import obtener_version, nombre_de_modelo
+from .models import OrdenMedica
+
+# ==========================================
+# FEED INCREMENTAL DE ÓRDENES (ENFERMERÍA)
+# ==========================================
+# El panel de enfermería ya no se recarga: pregunta al feed con la versión que
+# conoce y un cursor sobre fecha_modificacion. La versión sale de la base: cuántas
+# órdenes hay pendientes y su última modificación, leídas del índice parcial de
+# pendientes (pocas filas frente al histórico). Así un cambio hecho en otro worker,
+# o con update() sin señales, se nota igual. Cuando cambia, se devuelven los ids
+# pendientes (para quitar lo ejecutado o borrado) y el HTML de las filas modificadas
+# desde el cursor.
+# Bajo WSGI el feed responde enseguida (204 con Retry-After: el panel vuelve a
+# preguntar a los FEED_ORDENES_REINTENTO segundos) y no retiene un hilo por estación.
+# Bajo ASGI espera hasta FEED_ORDENES_ESPERA segundos sin ocupar hilos: relee la base
+# cada INTERVALO_BD segundos y, entre lecturas, mira la versión en caché de OrdenMedica
+# (la sube signals.py) solo como aviso para despertar antes.
+
+INTERVALO_CONSULTA = 0.5  # segundos entre lecturas de la versión en caché durante la espera
+INTERVALO_BD = 3          # segundos entre lecturas de la base durante la espera
+# Una transacción puede confirmar después de otra más nueva: releemos unos segundos
+# hacia atrás. El panel reemplaza filas por id, así que repetir una no la duplica.
+MARGEN_CURSOR = datetime.timedelta(seconds=5)
+
+
+def _version(cantidad, ultima):
+    return f"{cantidad}-{ultima.timestamp():.6f}" if ultima else "0"
+
+def version_ordenes():
+    """ Versión del feed: cuántas órdenes pendientes hay y su última modificación (solo lee el índice parcial) """
+    datos = OrdenMedica.objects.filter(ejecutada=False).aggregate(cantidad=Count('id'), ultima=Max('fecha_modificacion'))
+    return _version(datos['cantidad'], datos['ultima'])
+
+def version_de(ordenes):
+    """ La misma versión calculada sobre las órdenes pendientes ya cargadas """
+    return _version(len(ordenes), max((orden.fecha_modificacion for orden in ordenes), default=None))
+
+def _version_en_cache():
+    return obtener_version(nombre_de_modelo(OrdenMedica))
+
+async def esperar_cambios(cursor, version, espera):
+    """ cambios_desde() en cuanto la versión difiera de `version`; None si no cambió en `espera` segundos """
+    limite = time.monotonic() + espera
+    while True:
+        cambios = await en_hilo(cambios_desde, cursor, version)
+        if cambios is not None or time.monotonic() >= limite:
+            return cambios
+        proxima = min(limite, time.monotonic() + INTERVALO_BD)
+        aviso = await en_hilo(_version_en_cache)
+        while time.monotonic() < proxima:
+            await asyncio.sleep(min(INTERVALO_CONSULTA, max(proxima - time.monotonic(), 0)))
+            if await en_hilo(_version_en_cache) != aviso:
+                break
+
+def leer_cursor(valor):
+    """ datetime del cursor (ISO 8601), o None si falta o no es válido: entonces se envía todo """
+    try:
+        fecha = parse_datetime(valor or '')
+    except ValueError:
+        return None
+    if fecha and timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha, datetime.timezone.utc)
+    return fecha
+
+def cambios_desde(cursor, version=None):
+    """
+    Lo que el panel necesita para ponerse al día desde `cursor`, o None si la versión de la base
+    sigue siendo `version` (una consulta; tres si hubo cambios)
+    """
+    ahora = timezone.now()
+    actual = version_ordenes()
+    if version is not None and str(version) == actual:
+        return None
+    pendientes = OrdenMedica.objects.filter(ejecutada=False)
+    ids = list(pendientes.order_by('fecha_creacion', 'id').values_list('id', flat=True))
+
+    cambiadas = pendientes.select_related('medico', 'paciente').order_by('fecha_creacion', 'id')
+    if cursor:
+        cambiadas = cambiadas.filter(fecha_modificacion__gte=cursor - MARGEN_CURSOR)
+    return {
+        'version': actual,
+        'cursor': ahora.isoformat(),
+        'pendientes': ids,
+        'html': render_to_string('miapp/filas_ordenes.html', {'ordenes': cambiadas}) if ids else '',
+    }
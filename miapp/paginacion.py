@@ -0,0 +1,98 @@
+import datetime
+
+from django.db.models import Q
+
+# ==========================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ==========================================
+# En vez de OFFSET (que recorre todas las filas anteriores) filtramos por la
+# última clave vista: (fecha, id). Cada página cuesta lo mismo sin importar
+# cuántos registros tenga la tabla, siempre que exista un índice (fecha, id).
+
+def codificar_cursor(fecha, pk):
+    return f"{fecha.isoformat()}_{pk}"
+
+def decodificar_cursor(cursor):
+    """
+    '2025-03-01_154' -> (date(2025, 3, 1), 154). Con hora (campos DateTimeField) devuelve
+    un datetime. Devuelve None si el cursor no es válido
+    """
+    try:
+        fecha, pk = cursor.rsplit('_', 1)
+        convertir = datetime.datetime.fromisoformat if 'T' in fecha else datetime.date.fromisoformat
+        return convertir(fecha), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+def consulta_de_pagina(queryset, campo='fecha', despues=None, antes=None, tamano=50):
+    """
+    Las tamano + 1 filas que lee paginar_por_cursor (la de más dice si hay otra página), sin
+    evaluar. Con un 'antes' válido vienen de la más antigua a la más reciente.
+    """
+    clave_antes = decodificar_cursor(antes) if antes else None
+    if clave_antes:
+        fecha, pk = clave_antes
+        qs = queryset.filter(Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__gt': pk}))
+        return qs.order_by(campo, 'id')[:tamano + 1]
+    clave_despues = decodificar_cursor(despues) if despues else None
+    if clave_despues:
+        fecha, pk = clave_despues
+        queryset = queryset.filter(Q(**{f'{campo}__lt': fecha}) | Q(**{campo: fecha, 'id__lt': pk}))
+    return queryset.order_by(f'-{campo}', '-id')[:tamano + 1]
+
+def paginar_por_cursor(queryset, campo='fecha', despues=None, antes=None, tamano=50):
+    """
+    Devuelve una página ordenada de más reciente a más antiguo por (campo, id).
+    'despues' avanza a registros más antiguos; 'antes' retrocede a más recientes.
+    """
+    objetos = list(consulta_de_pagina(queryset, campo, despues, antes, tamano))
+    if antes and decodificar_cursor(antes):
+        hay_anterior, hay_siguiente = len(objetos) > tamano, True
+        objetos = objetos[:tamano][::-1]
+    else:
+        hay_anterior = bool(despues and decodificar_cursor(despues))
+        hay_siguiente = len(objetos) > tamano
+        objetos = objetos[:tamano]
+
+    primero, ultimo = (objetos[0], objetos[-1]) if objetos else (None, None)
+    return {
+        'objetos': objetos,
+        'siguiente': codificar_cursor(getattr(ultimo, campo), ultimo.id) if hay_siguiente and ultimo else None,
+        'anterior': codificar_cursor(getattr(primero, campo), primero.id) if hay_anterior and primero else None,
+    }
+
+
+# ==========================================
+# PÁGINA SIMPLE (SIN COUNT)
+# ==========================================
+
+class PaginaSimple:
+    """
+    Paginación por número de página que no calcula el total: pide un registro de más
+    para saber si hay página siguiente. Tiene la misma interfaz que usa la plantilla
+    con django.core.paginator.Page (has_next, next_page_number, ...).
+    """
+    def __init__(self, queryset, numero=1, por_pagina=25):
+        try:
+            self.number = max(int(numero or 1), 1)
+        except (TypeError, ValueError):
+            self.number = 1
+        inicio = (self.number - 1) * por_pagina
+        filas = list(queryset[inicio:inicio + por_pagina + 1])
+        self._hay_siguiente = len(filas) > por_pagina
+        self.object_list = filas[:por_pagina]
+
+    def has_next(self):
+        return self._hay_siguiente
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
@@ -0,0 +1,180 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as TiempoAgotado
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+
+from .medios import servir_archivo, INMUTABLE_PRIVADO
+
+# ==========================================
+# RENDERIZADO DE PDF FUERA DE LA PETICIÓN
+# ==========================================
+# xhtml2pdf tarda cientos de ms por documento y retiene el GIL, así que corre en un
+# pool de procesos. El PDF se guarda en disco con el nombre del hash del HTML ya
+# renderizado: el mismo contenido nunca se genera dos veces y la URL de descarga
+# es inmutable. Archivos por huella en PDF_CACHE_DIR:
+#   <huella>.pdf  listo      <huella>.err  falló (mensaje dentro)
+
+ESTADO_LISTO, ESTADO_PENDIENTE, ESTADO_ERROR = 'listo', 'pendiente', 'error'
+MAX_PDFS_EN_SESION = 50
+
+
+class ErrorPDF(Exception):
+    pass
+
+
+def huella_html(html):
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+def ruta_pdf(huella):
+    return Path(settings.PDF_CACHE_DIR) / huella[:2] / f"{huella}.pdf"
+
+def _ruta_error(huella):
+    return ruta_pdf(huella).with_suffix('.err')
+
+def html_a_pdf(html, destino):
+    """ Corre dentro del pool: solo xhtml2pdf y disco, nada de Django ni base de datos """
+    from xhtml2pdf import pisa
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as salida:
+            # UTF-8 para soportar acentos y caracteres especiales
+            resultado = pisa.pisaDocument(BytesIO(html.encode('UTF-8')), salida, encoding='UTF-8')
+        if resultado.err:
+            raise ErrorPDF(f"xhtml2pdf reportó {resultado.err} error(es)")
+        os.replace(temporal, destino)  # atómico: nadie lee un PDF a medias
+    except Exception as e:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+        destino.with_suffix('.err').write_text(str(e) or e.__class__.__name__, encoding='utf-8')
+        raise
+    return str(destino)
+
+
+# --- Pool de procesos (uno por proceso web, creado al primer uso) ---
+
+_pool = None
+_en_curso = {}  # huella -> Future, para no encolar dos veces el mismo documento
+_candado = threading.RLock()
+
+def _obtener_pool(reiniciar=False):
+    global _pool
+    if _pool is None or reiniciar:
+        # 'spawn' y no 'fork': el proceso web tiene hilos y conexiones abiertas
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PDF_PROCESOS, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pool
+
+def _terminado(huella):
+    with _candado:
+        _en_curso.pop(huella, None)
+
+def solicitar_pdf(html):
+    """ Encola el render si el PDF no está ya en disco. Devuelve la huella. """
+    huella = huella_html(html)
+    destino = ruta_pdf(huella)
+    if destino.exists():
+        os.utime(destino)  # la limpieza borra por antigüedad del último uso
+        return huella
+
+    with _candado:
+        if huella in _en_curso:
+            return huella
+        _ruta_error(huella).unlink(missing_ok=True)  # pedirlo otra vez es reintentar
+
+        if not settings.PDF_PROCESOS:
+            # Sin pool (pruebas o servidores de un solo proceso): en línea
+            try:
+                html_a_pdf(html, destino)
+            except Exception:
+                pass  # el .err ya quedó escrito
+            return huella
+
+        try:
+            futuro = _obtener_pool().submit(html_a_pdf, html, str(destino))
+        except BrokenProcessPool:
+            futuro = _obtener_pool(reiniciar=True).submit(html_a_pdf, html, str(destino))
+        _en_curso[huella] = futuro
+        futuro.add_done_callback(lambda _: _terminado(huella))
+    return huella
+
+def estado_pdf(huella):
+    if ruta_pdf(huella).exists():
+        return ESTADO_LISTO
+    if _ruta_error(huella).exists():
+        return ESTADO_ERROR
+    return ESTADO_PENDIENTE
+
+def esperar_pdf(huella, timeout):
+    """ Espera hasta `timeout` segundos a que el render termine; devuelve el estado """
+    futuro = _en_curso.get(huella)
+    if futuro is not None:
+        try:
+            futuro.result(timeout=timeout)
+        except TiempoAgotado:
+            return ESTADO_PENDIENTE
+        except Exception:
+            return ESTADO_ERROR
+    return estado_pdf(huella)
+
+def leer_pdf(html):
+    """ Versión síncrona para código que necesita los bytes (p. ej. exportaciones): usa la misma caché """
+    huella = huella_html(html)
+    destino = ruta_pdf(huella)
+    if not destino.exists():
+        html_a_pdf(html, destino)
+    return destino.read_bytes()
+
+
+# ==========================================
+# CAPA HTTP
+# ==========================================
+# La sesión guarda qué huellas pidió el usuario: solo quien generó el documento
+# (y pasó el control de permisos de la vista) puede consultarlo o descargarlo.
+
+def _autorizar(request, huella, nombre):
+    pdfs = request.session.get('pdfs', {})
+    pdfs.pop(huella, None)
+    pdfs[huella] = nombre
+    while len(pdfs) > MAX_PDFS_EN_SESION:
+        pdfs.pop(next(iter(pdfs)))
+    request.session['pdfs'] = pdfs
+
+def nombre_autorizado(request, huella):
+    nombre = request.session.get('pdfs', {}).get(huella)
+    if nombre is None:
+        raise Http404("Documento no encontrado")
+    return nombre
+
+def responder_pdf(request, html, nombre):
+    """ Sirve el PDF si está (o termina en PDF_ESPERA segundos); si no, una página que consulta su estado """
+    nombre = get_valid_filename(nombre)
+    huella = solicitar_pdf(html)
+    _autorizar(request, huella, nombre)
+
+    estado = esperar_pdf(huella, settings.PDF_ESPERA)
+    if estado == ESTADO_LISTO:
+        return servir_pdf(request, huella, nombre)
+    return render(request, 'miapp/pdf_generando.html', {
+        'nombre': nombre,
+        'estado': estado,
+        'url_estado': reverse('pdf_estado', args=[huella]),
+    }, status=202 if estado == ESTADO_PENDIENTE else 500)
+
+def servir_pdf(request, huella, nombre):
+    # Misma URL = mismo contenido, para siempre; privado porque son datos clínicos
+    return servir_archivo(request, ruta_pdf(huella), INMUTABLE_PRIVADO, 'application/pdf', nombre, etag=huella)
@@ -0,0 +1,262 @@
+import datetime
+import json
+import logging
+import re
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import mail
+from django.db.models import F, Q
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cita, Recordatorio
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# RECORDATORIOS DE CITAS
+# ==========================================
+# El comando enviar_recordatorios (cron cada pocos minutos, o --cada N) hace dos pasos:
+#  1. programar(): por cada ventana abierta (mañana, a partir de RECORDATORIOS_HORA_DIA_ANTERIOR;
+#     hoy, las próximas RECORDATORIOS_HORAS_ANTES horas) una consulta por rango sobre el índice
+#     (fecha, hora) de Cita, y un Recordatorio por canal con INSERT ... ON CONFLICT DO NOTHING.
+#     La restricción única (cita, ventana, canal) es la deduplicación: correr el comando
+#     dos veces, o en dos servidores, no duplica nada.
+#  2. despachar(): toma lotes de la cola con un UPDATE condicional (lote = uuid), así dos
+#     despachadores nunca toman el mismo aviso; los redacta con la plantilla ya compilada y
+#     los manda por el backend de cada canal, al ritmo de RECORDATORIOS_POR_SEGUNDO. Un fallo
+#     vuelve a la cola con espera exponencial hasta RECORDATORIOS_INTENTOS.
+# Si el proceso muere a mitad de un envío, el aviso vuelve a la cola al vencer su plazo con
+# la misma clave ('recordatorio-<id>'): los proveedores que deduplican por referencia no
+# lo repiten.
+
+LOTE = 200
+PLAZO_ENVIO = datetime.timedelta(minutes=10)  # un lote tomado y no resuelto vuelve a la cola
+
+Mensaje = namedtuple('Mensaje', 'clave canal destino asunto texto')
+
+
+# --- Backends (uno por canal en RECORDATORIOS_BACKENDS) ---
+
+class BackendRecordatorios:
+    """ enviar(mensajes) -> {clave: error} de los que fallaron; los demás se dan por enviados """
+
+    def enviar(self, mensajes):
+        raise NotImplementedError
+
+class ConsolaBackend(BackendRecordatorios):
+    """ Desarrollo: escribe cada mensaje en la salida estándar """
+
+    def __init__(self, flujo=None):
+        self.flujo = flujo or sys.stdout
+
+    def enviar(self, mensajes):
+        for mensaje in mensajes:
+            self.flujo.write(f"[{mensaje.canal} -> {mensaje.destino}] {mensaje.texto}\n")
+        self.flujo.flush()
+        return {}
+
+class ArchivoBackend(BackendRecordatorios):
+    """ Pruebas locales y auditoría: una línea JSON por mensaje en RECORDATORIOS_ARCHIVO """
+
+    def enviar(self, mensajes):
+        with open(settings.RECORDATORIOS_ARCHIVO, 'a', encoding='utf-8') as archivo:
+            for mensaje in mensajes:
+                archivo.write(json.dumps(mensaje._asdict(), ensure_ascii=False) + '\n')
+        return {}
+
+class CorreoBackend(BackendRecordatorios):
+    """ Con el EMAIL_BACKEND de Django: una sola conexión SMTP por lote """
+
+    def enviar(self, mensajes):
+        errores = {}
+        with mail.get_connection() as conexion:
+            for mensaje in mensajes:
+                correo = mail.EmailMessage(mensaje.asunto, mensaje.texto, to=[mensaje.destino],
+                                           headers={'X-Referencia': mensaje.clave})
+                try:
+                    conexion.send_messages([correo])
+                except Exception as e:
+                    errores[mensaje.clave] = str(e) or e.__class__.__name__
+        return errores
+
+class SmsHttpBackend(BackendRecordatorios):
+    """
+    Pasarela SMS por HTTP: un POST JSON por lote a RECORDATORIOS_SMS_URL
+    {"mensajes": [{"referencia", "telefono", "texto"}]} que responde {"rechazados": {referencia: motivo}}.
+    La referencia es la clave del recordatorio, para que la pasarela descarte repeticiones.
+    """
+
+    def enviar(self, mensajes):
+        cuerpo = json.dumps({'mensajes': [
+            {'referencia': m.clave, 'telefono': m.destino, 'texto': m.texto} for m in mensajes
+        ]}).encode('utf-8')
+        peticion = urllib.request.Request(settings.RECORDATORIOS_SMS_URL, data=cuerpo, method='POST', headers={
+            'Content-Type': 'application/json',
+            'Authorization': f"Bearer {settings.RECORDATORIOS_SMS_TOKEN}",
+        })
+        try:
+            with urllib.request.urlopen(peticion, timeout=30) as respuesta:
+                return json.load(respuesta).get('rechazados', {})
+        except (urllib.error.URLError, TimeoutError, ValueError) as e:
+            return {m.clave: f"Pasarela SMS: {e}" for m in mensajes}
+
+
+# ==========================================
+# 1. PROGRAMAR (VENTANAS)
+# ==========================================
+
+def ventanas_abiertas(ahora):
+    """ {ventana: (fecha, hora_desde, hora_hasta)} en hora local """
+    local = timezone.localtime(ahora)
+    abiertas = {}
+    if local.hour >= settings.RECORDATORIOS_HORA_DIA_ANTERIOR:
+        abiertas['dia_anterior'] = (local.date() + datetime.timedelta(days=1), datetime.time.min, datetime.time.max)
+    limite = local + datetime.timedelta(hours=settings.RECORDATORIOS_HORAS_ANTES)
+    hasta = limite.time() if limite.date() == local.date() else datetime.time.max
+    abiertas['mismo_dia'] = (local.date(), local.time(), hasta)
+    return abiertas
+
+def _telefono(numero):
+    """ '0414-123.45.67' -> '+584141234567' (los celulares se guardan en formato local) """
+    digitos = re.sub(r'\D', '', numero or '')
+    if len(digitos) < 10:
+        return None
+    if digitos.startswith('0'):
+        return f"+58{digitos[1:]}"
+    return f"+{digitos}"
+
+def programar(ahora=None):
+    """ Encola los avisos de las ventanas abiertas; devuelve {ventana: citas encontradas} """
+    ahora = ahora or timezone.now()
+    canales = settings.RECORDATORIOS_BACKENDS
+    encontradas = {}
+    for ventana, (fecha, desde, hasta) in ventanas_abiertas(ahora).items():
+        citas = (Cita.objects.filter(fecha=fecha, hora__gte=desde, hora__lte=hasta, realizada=False)
+                 .exclude(estado='cancelada')
+                 .values_list('id', 'paciente__telefono', 'paciente__correo'))
+        encontradas[ventana] = 0
+        nuevos = []
+        for cita_id, telefono, correo in citas.iterator(chunk_size=LOTE):
+            encontradas[ventana] += 1
+            for canal, destino in (('sms', _telefono(telefono)), ('correo', correo)):
+                if destino and canal in canales:
+                    nuevos.append(Recordatorio(cita_id=cita_id, ventana=ventana, canal=canal,
+                                               destino=destino, proximo_intento=ahora))
+            if len(nuevos) >= LOTE:
+                Recordatorio.objects.bulk_create(nuevos, ignore_conflicts=True)
+                nuevos = []
+        Recordatorio.objects.bulk_create(nuevos, ignore_conflicts=True)
+    return encontradas
+
+
+# ==========================================
+# 2. DESPACHAR (COLA)
+# ==========================================
+
+class _Limitador:
+    """ Como mucho por_segundo mensajes por segundo, parejo entre lotes (0: sin límite) """
+
+    def __init__(self, por_segundo, dormir=time.sleep):
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self.siguiente = time.monotonic()
+        self.dormir = dormir
+
+    def esperar(self, cantidad):
+        if not self.intervalo:
+            return
+        ahora = time.monotonic()
+        if self.siguiente > ahora:
+            self.dormir(self.siguiente - ahora)
+        self.siguiente = max(self.siguiente, ahora) + cantidad * self.intervalo
+
+def _tomar_lote(tamano):
+    """ Marca hasta 'tamano' avisos vencidos como de este despachador y los devuelve con su cita """
+    ahora = timezone.now()
+    # 'enviando' con el plazo vencido: el despachador que lo tomó murió a mitad de camino
+    vencidos = Q(estado='pendiente') | Q(estado='enviando')
+    ids = list(Recordatorio.objects.filter(vencidos, proximo_intento__lte=ahora)
+               .order_by('proximo_intento').values_list('id', flat=True)[:tamano])
+    if not ids:
+        return []
+    lote = uuid.uuid4()
+    Recordatorio.objects.filter(vencidos, id__in=ids, proximo_intento__lte=ahora).update(
+        estado='enviando', lote=lote, intentos=F('intentos') + 1, proximo_intento=ahora + PLAZO_ENVIO,
+    )
+    return list(Recordatorio.objects.filter(id__in=ids, lote=lote)
+                .select_related('cita__paciente', 'cita__medico').order_by('id'))
+
+def _vigente(cita, ahora):
+    if cita.estado == 'cancelada' or cita.realizada:
+        return False
+    inicio = datetime.datetime.combine(cita.fecha, cita.hora, tzinfo=timezone.get_current_timezone())
+    return inicio > ahora
+
+def despachar(lote=LOTE, por_segundo=None, dormir=time.sleep):
+    """ Envía la cola hasta vaciarla; devuelve el resumen """
+    limitador = _Limitador(settings.RECORDATORIOS_POR_SEGUNDO if por_segundo is None else por_segundo, dormir)
+    plantilla = get_template('miapp/recordatorio_cita.txt')
+    backends = {canal: import_string(ruta)() for canal, ruta in settings.RECORDATORIOS_BACKENDS.items()}
+    resumen = {'enviados': 0, 'reintentos': 0, 'fallidos': 0, 'descartados': 0}
+
+    while True:
+        tomados = _tomar_lote(lote)
+        if not tomados:
+            return resumen
+        ahora = timezone.now()
+        # Cita cancelada, atendida o ya pasada desde que se encoló, o canal que se quitó
+        descartados = {r.id for r in tomados if not _vigente(r.cita, ahora) or r.canal not in backends}
+        # Volvió por plazo vencido más veces de las permitidas: no se sabe si salió, no se insiste
+        agotados = {r.id for r in tomados if r.intentos > settings.RECORDATORIOS_INTENTOS} - descartados
+        if descartados:
+            Recordatorio.objects.filter(id__in=descartados).update(estado='descartado', lote=None)
+            resumen['descartados'] += len(descartados)
+        if agotados:
+            Recordatorio.objects.filter(id__in=agotados).update(
+                estado='fallido', lote=None, ultimo_error="Sin confirmación del envío tras varios intentos.")
+            resumen['fallidos'] += len(agotados)
+
+        por_canal = {}
+        for recordatorio in tomados:
+            if recordatorio.id in descartados or recordatorio.id in agotados:
+                continue
+            cita = recordatorio.cita
+            texto = plantilla.render({'cita': cita, 'paciente': cita.paciente, 'ventana': recordatorio.ventana}).strip()
+            por_canal.setdefault(recordatorio.canal, []).append((recordatorio, Mensaje(
+                f"recordatorio-{recordatorio.id}", recordatorio.canal, recordatorio.destino,
+                "Recordatorio de su cita - Clínica Renacer", texto,
+            )))
+
+        for canal, pares in por_canal.items():
+            limitador.esperar(len(pares))
+            try:
+                errores = backends[canal].enviar([mensaje for _, mensaje in pares])
+            except Exception as e:
+                logger.exception("El backend de %s falló con el lote completo", canal)
+                errores = {mensaje.clave: str(e) or e.__class__.__name__ for _, mensaje in pares}
+            _registrar(pares, errores, resumen)
+
+def _registrar(pares, errores, resumen):
+    ahora = timezone.now()
+    enviados = [recordatorio.id for recordatorio, mensaje in pares if mensaje.clave not in errores]
+    Recordatorio.objects.filter(id__in=enviados).update(estado='enviado', fecha_envio=ahora, ultimo_error='', lote=None)
+    resumen['enviados'] += len(enviados)
+    for recordatorio, mensaje in pares:
+        if mensaje.clave not in errores:
+            continue
+        recordatorio.ultimo_error, recordatorio.lote = str(errores[mensaje.clave])[:1000], None
+        if recordatorio.intentos >= settings.RECORDATORIOS_INTENTOS:
+            recordatorio.estado = 'fallido'
+            resumen['fallidos'] += 1
+        else:
+            recordatorio.estado = 'pendiente'
+            recordatorio.proximo_intento = ahora + datetime.timedelta(minutes=2 ** recordatorio.intentos)
+            resumen['reintentos'] += 1
+        recordatorio.save(update_fields=['estado', 'proximo_intento', 'ultimo_error', 'lote'])
@@ -0,0 +1,111 @@
+import datetime
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from .disponibilidad import ESTADOS_QUE_LIBERAN, validar_turno
+from .models import Cita, Paciente, SolicitudIdempotente
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# RESERVA DE CITAS SEGURA ANTE CONCURRENCIA
+# ==========================================
+# Tres defensas, de afuera hacia adentro:
+#  1. Clave de idempotencia del cliente: un doble clic / reenvío devuelve la misma cita.
+#  2. Dentro de la transacción: bloqueamos la fila del médico (PostgreSQL serializa así
+#     las reservas de ese médico), insertamos y recién entonces validamos solapes. En
+#     SQLite el INSERT toma el candado de escritura, con el mismo efecto.
+#  3. UniqueConstraint 'cita_turno_unico' en la base: la última palabra.
+# Los choques (cédula nueva registrada a la vez, SQLite ocupado) se reintentan.
+
+REINTENTOS = 8
+
+
+class TurnoOcupado(Exception):
+    pass
+
+
+def cita_de_clave(clave):
+    """ La cita ya creada con esa clave de idempotencia, o None """
+    if not clave:
+        return None
+    solicitud = SolicitudIdempotente.objects.filter(clave=clave, cita__isnull=False).select_related('cita').first()
+    return solicitud.cita if solicitud else None
+
+def purgar_claves_vencidas(horas=None):
+    """ Claves de más de IDEMPOTENCIA_VIGENCIA_HORAS: un reenvío tan tardío ya no es un doble clic. Devuelve cuántas """
+    limite = timezone.now() - datetime.timedelta(hours=horas or settings.IDEMPOTENCIA_VIGENCIA_HORAS)
+    return SolicitudIdempotente.objects.filter(fecha_creacion__lt=limite).delete()[0]
+
+def _paciente(datos):
+    if 'paciente' in datos:  # la API reserva para un paciente ya registrado
+        return datos['paciente']
+    paciente = Paciente.objects.filter(cedula=datos['cedula']).first()
+    if paciente is None:
+        return Paciente.objects.create(
+            cedula=datos['cedula'], nombre=datos['nombre'], apellido=datos['apellido'],
+            telefono=datos['telefono'], fecha_nacimiento=datos['fecha_nacimiento'], sexo=datos['sexo'],
+        )
+    if paciente.telefono != datos['telefono']:
+        paciente.telefono = datos['telefono']
+        paciente.save(update_fields=['telefono'])
+    return paciente
+
+def _turno_tomado(medico, fecha, hora):
+    return Cita.objects.filter(medico=medico, fecha=fecha, hora=hora).exclude(estado__in=ESTADOS_QUE_LIBERAN).exists()
+
+def _reservar(datos, clave):
+    with transaction.atomic():
+        solicitud = SolicitudIdempotente.objects.create(clave=clave) if clave else None
+        User.objects.select_for_update().filter(pk=datos['medico'].pk).first()
+
+        cita = Cita.objects.create(
+            paciente=_paciente(datos), medico=datos['medico'],
+            fecha=datos['fecha'], hora=datos['hora'],
+            motivo=datos['motivo'], estado='pendiente',
+        )
+        # Con la cita ya insertada (y el candado tomado) ninguna otra reserva puede colarse
+        motivo = validar_turno(datos['medico'], datos['fecha'], datos['hora'], excluir_cita_id=cita.pk)
+        if motivo:
+            raise TurnoOcupado(motivo)
+
+        if solicitud:
+            solicitud.cita = cita
+            solicitud.save(update_fields=['cita'])
+    return cita
+
+def reservar_cita(datos, clave=None):
+    """
+    datos: cleaned_data de CitaInvitadoForm (datos del paciente + medico/fecha/hora/motivo),
+    o con 'paciente' ya resuelto en vez de sus datos.
+    Devuelve (cita, creada). Lanza TurnoOcupado si el turno ya no está libre.
+    """
+    # Camino rápido sin escribir: reenvío ya atendido o turno que ya se llevó otro
+    previa = cita_de_clave(clave)
+    if previa:
+        return previa, False
+    if _turno_tomado(datos['medico'], datos['fecha'], datos['hora']):
+        raise TurnoOcupado("Ese turno ya está ocupado. Elija otro horario.")
+
+    for intento in range(REINTENTOS):
+        try:
+            return _reservar(datos, clave), True
+        except IntegrityError:
+            previa = cita_de_clave(clave)
+            if previa:
+                return previa, False
+            if _turno_tomado(datos['medico'], datos['fecha'], datos['hora']):
+                raise TurnoOcupado("Ese turno acaba de ser reservado. Elija otro horario.")
+            # Otro envío registró la misma cédula a la vez: en el reintento ya existe
+        except OperationalError as e:
+            if 'locked' not in str(e) or intento == REINTENTOS - 1:
+                raise
+        time.sleep(random.uniform(0, 0.02 * 2 ** intento))
+    logger.error("No se pudo reservar la cita tras %d intentos (clave=%s)", REINTENTOS, clave)
+    raise TurnoOcupado("No pudimos confirmar la cita. Intente de nuevo.")
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+# ==========================================
+# LECTURA / ESCRITURA EN CONEXIONES SEPARADAS
+# ==========================================
+# Con config/settings_produccion.py hay dos alias sobre el mismo archivo SQLite (WAL):
+#   'default'  escrituras, con BEGIN IMMEDIATE (pide el candado al empezar y espera
+#              busy_timeout en vez de fallar al querer escribir a mitad de transacción)
+#   'lectura'  solo consultas (PRAGMA query_only): en WAL nunca bloquea a un escritor
+# Solo las peticiones de lectura (GET/HEAD, ver LecturaSeparadaMiddleware) leen de
+# 'lectura'. El resto, y cualquier lectura dentro de una transacción abierta en
+# 'default', siguen en 'default' para ver sus propias escrituras sin confirmar.
+
+ALIAS_LECTURA = 'lectura'
+
+_solo_lectura = ContextVar('solo_lectura', default=False)
+
+
+@contextmanager
+def solo_lectura():
+    """ Las consultas de este bloque pueden ir a la conexión de lectura """
+    token = _solo_lectura.set(True)
+    try:
+        yield
+    finally:
+        _solo_lectura.reset(token)
+
+
+class RouterLecturaEscritura:
+
+    def db_for_read(self, model, **hints):
+        if (_solo_lectura.get() and ALIAS_LECTURA in connections
+                and not connections['default'].in_atomic_block):
+            return ALIAS_LECTURA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # es la misma base: los objetos de un alias valen en el otro
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class LecturaSeparadaMiddleware:
+    """ Marca las peticiones GET/HEAD como de solo lectura para RouterLecturaEscritura """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        with solo_lectura():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return await self.get_response(request)
+        # La marca viaja en el contexto: la heredan los hilos de sync_to_async
+        with solo_lectura():
+            return await self.get_response(request)
@@ -0,0 +1,118 @@
+from itertools import chain
+
+from django.contrib.auth.models import User
+from rest_framework import serializers
+
+from .models import Paciente, Cita, OrdenMedica, MovimientoContable
+
+# ==========================================
+# CAMPOS PARCIALES (?fields=)
+# ==========================================
+# El cliente pide solo los campos que va a mostrar y la vista solo trae de la base
+# las columnas de esos campos (only()). Meta.columnas dice qué columnas necesita cada
+# campo que no coincide con una columna del modelo; los anidados las piden con
+# 'relacion__columna' y la vista los une con select_related.
+
+class CamposParcialesMixin:
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+    @classmethod
+    def campos_legibles(cls):
+        return [nombre for nombre, campo in cls().fields.items() if not campo.write_only]
+
+    @classmethod
+    def columnas_para(cls, campos):
+        columnas = getattr(cls.Meta, 'columnas', {})
+        return list(dict.fromkeys(chain(['id'], *(columnas.get(campo, [campo]) for campo in campos))))
+
+
+# ==========================================
+# RESÚMENES ANIDADOS
+# ==========================================
+
+class PacienteResumenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Paciente
+        fields = ['id', 'cedula', 'nombre', 'apellido']
+
+class UsuarioResumenSerializer(serializers.ModelSerializer):
+    nombre = serializers.CharField(source='first_name')
+    apellido = serializers.CharField(source='last_name')
+
+    class Meta:
+        model = User
+        fields = ['id', 'nombre', 'apellido']
+
+def _columnas_resumen(relacion, serializer):
+    return [f"{relacion}__{campo.source}" for campo in serializer().fields.values()]
+
+
+# ==========================================
+# RECURSOS DE LA API
+# ==========================================
+
+class PacienteSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    edad = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Paciente
+        fields = ['id', 'cedula', 'nombre', 'apellido', 'fecha_nacimiento', 'edad', 'sexo', 'telefono',
+                  'correo', 'direccion', 'alergias', 'enfermedades_cronicas', 'fecha_registro']
+        columnas = {'edad': ['fecha_nacimiento']}
+
+class CitaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    paciente = PacienteResumenSerializer(read_only=True)
+    paciente_id = serializers.PrimaryKeyRelatedField(source='paciente', queryset=Paciente.objects.all(), write_only=True)
+    medico = UsuarioResumenSerializer(read_only=True)
+    medico_id = serializers.PrimaryKeyRelatedField(
+        source='medico', queryset=User.objects.filter(perfilusuario__rol='medico'), write_only=True
+    )
+
+    class Meta:
+        model = Cita
+        fields = ['id', 'paciente', 'paciente_id', 'medico', 'medico_id', 'fecha', 'hora', 'motivo',
+                  'estado', 'diagnostico', 'tratamiento', 'realizada']
+        read_only_fields = ['estado']
+        # Sin el validador de 'cita_turno_unico': el turno lo decide reservar_cita() (409 si
+        # está tomado) y un reenvío con la misma Idempotency-Key debe llegar hasta ella
+        validators = []
+        columnas = {
+            'paciente': _columnas_resumen('paciente', PacienteResumenSerializer),
+            'medico': _columnas_resumen('medico', UsuarioResumenSerializer),
+        }
+
+    def validate(self, datos):
+        # El turno se toma con miapp/reservas.py: moverlo sería otra reserva
+        if self.instance and {'paciente', 'medico', 'fecha', 'hora'} & set(datos):
+            raise serializers.ValidationError("Para cambiar el turno cancele la cita y reserve otra.")
+        return datos
+
+class OrdenMedicaSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    paciente = PacienteResumenSerializer(read_only=True)
+    paciente_id = serializers.PrimaryKeyRelatedField(source='paciente', queryset=Paciente.objects.all(), write_only=True)
+    medico = UsuarioResumenSerializer(read_only=True)
+    enfermera_responsable = UsuarioResumenSerializer(read_only=True)
+
+    class Meta:
+        model = OrdenMedica
+        fields = ['id', 'paciente', 'paciente_id', 'medico', 'indicacion', 'fecha_creacion', 'ejecutada',
+                  'nota_enfermeria', 'enfermera_responsable', 'fecha_ejecucion', 'fecha_modificacion']
+        read_only_fields = ['fecha_ejecucion']
+        columnas = {
+            'paciente': _columnas_resumen('paciente', PacienteResumenSerializer),
+            'medico': _columnas_resumen('medico', UsuarioResumenSerializer),
+            'enfermera_responsable': _columnas_resumen('enfermera_responsable', UsuarioResumenSerializer),
+        }
+
+class MovimientoContableSerializer(CamposParcialesMixin, serializers.ModelSerializer):
+    responsable = UsuarioResumenSerializer(read_only=True)
+
+    class Meta:
+        model = MovimientoContable
+        fields = ['id', 'tipo', 'monto', 'descripcion', 'fecha', 'referencia', 'responsable', 'es_divisa', 'tasa_cambio']
+        columnas = {'responsable': _columnas_resumen('responsable', UsuarioResumenSerializer)}
@@ -0,0 +1,152 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from .models import (
+    MovimientoContable, Paciente, Cita, PerfilUsuario, OrdenMedica,
+    CarruselImagen, PreguntaFrecuente, AvisoImportante, ContenidoArchivo, TasaCambio
+)
+from .contabilidad import aplicar_movimiento, tasa_del_dia, olvidar_tasas, reasignar_tasas
+from .busqueda import indexar_paciente
+from .cache_versiones import incrementar_al_confirmar, nombre_de_modelo
+from .cache_paginas import invalidar_cms
+from .imagenes import generar_variantes_carrusel, borrar_variantes, generar_vista_previa
+from .tareas import encolar
+
+# ==========================================
+# 1. RESUMEN CONTABLE (ROLLUP)
+# ==========================================
+
+@receiver(pre_save, sender=MovimientoContable)
+def recordar_movimiento_previo(sender, instance, raw=False, **kwargs):
+    # Guardamos los valores viejos para poder restarlos si el movimiento se edita
+    instance._resumen_previo = None
+    if raw:
+        return
+    if instance.pk:
+        instance._resumen_previo = MovimientoContable.objects.filter(pk=instance.pk).values(
+            'fecha', 'tipo', 'es_divisa', 'monto', 'tasa_cambio'
+        ).first()
+    previo = instance._resumen_previo
+    # Una tasa escrita (o cambiada) queda como manual; vacía, vuelve a ser la del BCV
+    if not instance.tasa_cambio:
+        instance.tasa_manual = False
+    elif previo is None or instance.tasa_cambio != previo['tasa_cambio']:
+        instance.tasa_manual = True
+    # Sin tasa manual: la del BCV vigente en su fecha (0 si todavía no está cargada)
+    if not instance.tasa_manual:
+        instance.tasa_cambio = tasa_del_dia(instance.fecha) or 0
+
+@receiver(post_save, sender=MovimientoContable)
+def sumar_movimiento_al_resumen(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previo = getattr(instance, '_resumen_previo', None)
+    if previo:
+        aplicar_movimiento(previo['fecha'], previo['tipo'], previo['es_divisa'], previo['monto'],
+                           previo['tasa_cambio'], signo=-1)
+    aplicar_movimiento(instance.fecha, instance.tipo, instance.es_divisa, instance.monto, instance.tasa_cambio)
+
+@receiver(post_delete, sender=MovimientoContable)
+def restar_movimiento_del_resumen(sender, instance, **kwargs):
+    aplicar_movimiento(instance.fecha, instance.tipo, instance.es_divisa, instance.monto, instance.tasa_cambio, signo=-1)
+
+@receiver(pre_save, sender=TasaCambio)
+def recordar_fecha_de_la_tasa(sender, instance, raw=False, **kwargs):
+    # Si la tasa cambia de fecha, los movimientos de la fecha vieja también se recalculan
+    instance._fecha_previa = None
+    if instance.pk and not raw:
+        instance._fecha_previa = TasaCambio.objects.filter(pk=instance.pk).values_list('fecha', flat=True).first()
+
+@receiver(post_save, sender=TasaCambio)
+@receiver(post_delete, sender=TasaCambio)
+def tasa_de_cambio_modificada(sender, instance, raw=False, **kwargs):
+    transaction.on_commit(olvidar_tasas)  # en este proceso; los demás lo notan por la versión del modelo
+    if raw:
+        return
+    # Cargada, corregida o borrada: lo que tomó la tasa solo la recalcula (hasta la siguiente tasa publicada)
+    fechas = [instance.fecha, getattr(instance, '_fecha_previa', None) or instance.fecha]
+    siguiente = TasaCambio.objects.filter(fecha__gt=max(fechas)).exclude(pk=instance.pk).order_by('fecha').values_list(
+        'fecha', flat=True).first()
+    encolar(reasignar_tasas, min(fechas), siguiente)
+
+# ==========================================
+# 2. ÍNDICE DE BÚSQUEDA DE PACIENTES
+# ==========================================
+
+@receiver(post_save, sender=Paciente)
+def indexar_paciente_guardado(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'nombre', 'apellido', 'cedula'} & set(update_fields):
+        return
+    indexar_paciente(instance)
+
+# ==========================================
+# 3. VERSIONES DE CACHÉ POR MODELO
+# ==========================================
+# Cualquier cambio en estos modelos invalida lo que se cacheó con su versión
+# (estadísticas del dashboard de dirección) y despierta a quien la espera
+# (feed de órdenes de enfermería, miapp/ordenes.py).
+
+MODELOS_VERSIONADOS = [Paciente, Cita, PerfilUsuario, MovimientoContable, OrdenMedica, TasaCambio]
+
+def subir_version_del_modelo(sender, **kwargs):
+    incrementar_al_confirmar(nombre_de_modelo(sender))
+
+for _modelo in MODELOS_VERSIONADOS:
+    post_save.connect(subir_version_del_modelo, sender=_modelo, dispatch_uid=f"version_{_modelo.__name__}_save")
+    post_delete.connect(subir_version_del_modelo, sender=_modelo, dispatch_uid=f"version_{_modelo.__name__}_delete")
+
+# ==========================================
+# 4. CONTENIDO CMS (CACHÉ DE LA PORTADA)
+# ==========================================
+
+def invalidar_portada(sender, **kwargs):
+    invalidar_cms()
+
+for _modelo in [CarruselImagen, PreguntaFrecuente, AvisoImportante]:
+    post_save.connect(invalidar_portada, sender=_modelo, dispatch_uid=f"cms_{_modelo.__name__}_save")
+    post_delete.connect(invalidar_portada, sender=_modelo, dispatch_uid=f"cms_{_modelo.__name__}_delete")
+
+
+# ==========================================
+# 5. VARIANTES RESPONSIVAS DEL CARRUSEL
+# ==========================================
+
+@receiver(pre_save, sender=CarruselImagen)
+def detectar_imagen_nueva(sender, instance, raw=False, **kwargs):
+    instance._imagen_nueva = False
+    instance._variantes_viejas = None
+    if raw:
+        return
+    previo = CarruselImagen.objects.filter(pk=instance.pk).values('imagen', 'variantes').first() if instance.pk else None
+    if previo is None or previo['imagen'] != instance.imagen.name:
+        instance._imagen_nueva = True
+        instance._variantes_viejas = previo['variantes'] if previo else None
+        # Hasta que termine la tarea se sirve el original, nunca variantes de la foto anterior
+        instance.variantes = {}
+
+@receiver(post_save, sender=CarruselImagen)
+def encolar_variantes(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, '_imagen_nueva', False):
+        return
+    if instance._variantes_viejas:
+        encolar(borrar_variantes, instance._variantes_viejas)
+    if instance.imagen:
+        encolar(generar_variantes_carrusel, instance.pk)
+
+@receiver(post_delete, sender=CarruselImagen)
+def borrar_variantes_del_slide(sender, instance, **kwargs):
+    if instance.variantes:
+        encolar(borrar_variantes, instance.variantes)
+
+# ==========================================
+# 6. VISTAS PREVIAS DE DOCUMENTOS
+# ==========================================
+
+@receiver(post_save, sender=ContenidoArchivo)
+def encolar_vista_previa(sender, instance, created=False, raw=False, **kwargs):
+    # Una vez por contenido: los documentos duplicados reutilizan la del primero
+    if created and not raw:
+        encolar(generar_vista_previa, instance.pk)
@@ -0,0 +1,44 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# TAREAS EN SEGUNDO PLANO
+# ==========================================
+# Cola mínima en hilos del mismo proceso para sacar trabajo pesado (redimensionar
+# imágenes, generar vistas previas...) fuera de la petición. Las tareas se envían
+# al confirmarse la transacción, así el hilo siempre ve los datos guardados.
+# Con TAREAS_SINCRONAS = True (pruebas) se ejecutan en línea.
+
+_ejecutor = None
+_candado = threading.Lock()
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _candado:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TAREAS_HILOS', 2), thread_name_prefix='tareas'
+            )
+        return _ejecutor
+
+def _ejecutar(funcion, args, kwargs):
+    try:
+        funcion(*args, **kwargs)
+    except Exception:
+        logger.exception("Falló la tarea en segundo plano %s", funcion.__name__)
+    finally:
+        # Cada hilo abre su propia conexión; la cerramos para no dejarla colgada
+        connection.close()
+
+def encolar(funcion, *args, **kwargs):
+    """ Ejecuta funcion(*args, **kwargs) en segundo plano cuando termine la transacción actual """
+    if getattr(settings, 'TAREAS_SINCRONAS', False):
+        transaction.on_commit(lambda: funcion(*args, **kwargs))
+        return
+    transaction.on_commit(lambda: _obtener_ejecutor().submit(_ejecutar, funcion, args, kwargs))
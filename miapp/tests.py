@@ -1,3 +1,2040 @@
-from django.test import TestCase
+import csv
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import shutil
+import tempfile
+import zipfile
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Paciente, Cita, PerfilUsuario, Especialidad, PersonalAutorizado,
+    MovimientoContable, OrdenMedica, CarruselImagen, PreguntaFrecuente, AvisoImportante,
+    HorarioMedico, ExcepcionHorario, SolicitudIdempotente, Documento, ContenidoArchivo, SubidaDocumento,
+    Recordatorio, TasaCambio, ResumenContable, TokenBusquedaPaciente
+)
+from .urls import PRESUPUESTOS_CONSULTAS
+from .estadisticas import estadisticas_admin
+from .imagenes import ANCHOS_CARRUSEL
+from .routers import RouterLecturaEscritura, LecturaSeparadaMiddleware, solo_lectura
+from .asincrono import consultas_concurrentes
+from .views import dashboard_async
+
+
+# ==========================================
+# AYUDANTES
+# ==========================================
+
+class PresupuestoConsultasMixin:
+    """ Falla la prueba si la vista supera su presupuesto declarado en miapp/urls.py """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Para listar el SQL cuando se pasa del presupuesto (fuera de DEBUG solo se cuenta)
+        cls.enterClassContext(override_settings(CONSULTAS_REGISTRAR_SQL=True))
+
+    def assertDentroDelPresupuesto(self, response, nombre_url=None):
+        nombre = nombre_url or response.wsgi_request.resolver_match.url_name
+        self.assertIn(nombre, PRESUPUESTOS_CONSULTAS, f"La vista '{nombre}' no tiene presupuesto declarado.")
+        registro = response.wsgi_request.consultas_sql
+        presupuesto = PRESUPUESTOS_CONSULTAS[nombre]
+        if registro.cantidad > presupuesto:
+            detalle = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(registro.sql, 1))
+            self.fail(f"'{nombre}' hizo {registro.cantidad} consultas ({registro.tiempo_ms:.1f} ms), "
+                      f"presupuesto {presupuesto}:\n{detalle}")
+        return registro
+
+
+def crear_personal(username, rol, especialidad=None):
+    user = User.objects.create_user(username=username, password='clave-segura-123', first_name=username.title(), last_name='Prueba')
+    PerfilUsuario.objects.create(usuario=user, cedula=f"V-{username}", rol=rol, especialidad=especialidad)
+    return user
+
+
+def crear_datos_clinica(n):
+    """ n pacientes, cada uno con citas de hoy, órdenes pendientes y movimientos contables """
+    cardio = Especialidad.objects.get_or_create(nombre='Cardiología')[0]
+    medicos = [crear_personal(f"medico{n}_{i}", 'medico', cardio) for i in range(2)]
+    hoy = datetime.date.today()
+    for i in range(n):
+        paciente = Paciente.objects.create(
+            cedula=f"V-{n}{i:05d}", nombre=f"Paciente{i}", apellido="Pérez",
+            fecha_nacimiento=datetime.date(1990, 1, 1), sexo='F', telefono='0414'
+        )
+        medico = medicos[i % 2]
+        Cita.objects.create(paciente=paciente, medico=medico, fecha=hoy, hora=datetime.time(8 + i // 60 % 10, i % 60), motivo="Control")
+        OrdenMedica.objects.create(paciente=paciente, medico=medico, indicacion="Reposo")
+        MovimientoContable.objects.create(tipo='ingreso', monto=Decimal('10.00'), descripcion=f"Consulta {i}", fecha=hoy)
+        PersonalAutorizado.objects.create(cedula=f"A-{n}{i}", nombre_completo=f"Autorizado {i}", rol='medico', especialidad_asignada=cardio)
+        CarruselImagen.objects.create(titulo=f"Slide {i}", imagen='carrusel/x.jpg', orden=i)
+        PreguntaFrecuente.objects.create(pregunta=f"¿Pregunta {i}?", respuesta="Sí", orden=i)
+    AvisoImportante.objects.create(mensaje="Aviso")
+    return medicos
+
+
+# ==========================================
+# 1. RESUMEN CONTABLE INCREMENTAL
+# ==========================================
+
+class ResumenContableTests(TestCase):
+    MARZO, ABRIL = datetime.date(2026, 3, 10), datetime.date(2026, 4, 2)
+
+    def fila(self, periodo, fecha, tipo, es_divisa=False):
+        return ResumenContable.objects.filter(periodo=periodo, fecha=fecha, tipo=tipo, es_divisa=es_divisa).values_list(
+            'total', 'total_ves', 'total_usd', 'sin_tasa', 'cantidad').first()
+
+    def filas_no_vacias(self):
+        return set(ResumenContable.objects.filter(cantidad__gt=0).values_list(
+            'periodo', 'fecha', 'tipo', 'es_divisa', 'total', 'total_ves', 'total_usd', 'sin_tasa', 'cantidad'))
+
+    def test_crear_editar_y_borrar_mueven_las_filas(self):
+        movimiento = MovimientoContable.objects.create(tipo='ingreso', monto=Decimal('400'), fecha=self.MARZO,
+                                                       tasa_cambio=Decimal('40'), descripcion="Consulta")
+        MovimientoContable.objects.create(tipo='ingreso', monto=Decimal('80'), fecha=self.MARZO,
+                                          tasa_cambio=Decimal('40'), descripcion="Control")
+        self.assertEqual(self.fila('dia', self.MARZO, 'ingreso'), (Decimal('480'), Decimal('480'), Decimal('12'), 0, 2))
+        self.assertEqual(self.fila('mes', self.MARZO.replace(day=1), 'ingreso'), self.fila('dia', self.MARZO, 'ingreso'))
+
+        # Cambiar fecha, tipo y moneda a la vez: sale de sus filas viejas y entra en las nuevas
+        movimiento.fecha, movimiento.tipo, movimiento.es_divisa, movimiento.monto = self.ABRIL, 'egreso', True, Decimal('10')
+        movimiento.save()
+        self.assertEqual(self.fila('mes', self.MARZO.replace(day=1), 'ingreso'), (Decimal('80'), Decimal('80'), Decimal('2'), 0, 1))
+        self.assertEqual(self.fila('mes', self.ABRIL.replace(day=1), 'egreso', True), (Decimal('10'), Decimal('400'), Decimal('10'), 0, 1))
+
+        movimiento.delete()
+        self.assertEqual(self.fila('dia', self.ABRIL, 'egreso', True), (0, 0, 0, 0, 0))
+
+    def test_incremental_coincide_con_la_reconstruccion(self):
+        from .contabilidad import reconstruir_resumen
+        movimientos = [
+            MovimientoContable.objects.create(tipo=tipo, monto=Decimal(monto), fecha=self.MARZO + datetime.timedelta(days=dias),
+                                              es_divisa=divisa, tasa_cambio=Decimal(tasa), descripcion="Mezcla")
+            for tipo, monto, dias, divisa, tasa in [
+                ('ingreso', '100.10', 0, False, '36.5'), ('egreso', '12.30', 1, True, '0'), ('nomina', '900', 25, False, '37'),
+                ('impuesto', '33.33', 40, True, '38.25'), ('ingreso', '7.77', 40, True, '0'),
+            ]
+        ]
+        movimientos[0].monto = Decimal('150.55')
+        movimientos[0].save()
+        movimientos[1].tasa_cambio = Decimal('36.75')
+        movimientos[1].save()
+        movimientos[2].fecha = self.ABRIL
+        movimientos[2].save()
+        movimientos[3].delete()
+        incremental = self.filas_no_vacias()
+
+        reconstruir_resumen()
+        self.assertEqual(self.filas_no_vacias(), incremental)
+
+    def test_comando_reconstruye_tras_bulk_create(self):
+        MovimientoContable.objects.bulk_create([
+            MovimientoContable(tipo='ingreso', monto=Decimal('25'), fecha=self.MARZO, es_divisa=True,
+                               tasa_cambio=Decimal('40'), descripcion="Sin señales") for _ in range(4)
+        ])
+        self.assertFalse(ResumenContable.objects.exists())
+        salida = StringIO()
+        call_command('reconstruir_resumen_contable', stdout=salida)
+        self.assertIn("2 filas", salida.getvalue())
+        self.assertEqual(self.fila('mes', self.MARZO.replace(day=1), 'ingreso', True),
+                         (Decimal('100'), Decimal('4000'), Decimal('100'), 0, 4))
+
+
+# ==========================================
+# 2. LIBRO CONTABLE: PAGINACIÓN POR CURSOR Y FILTROS
+# ==========================================
+
+class PaginacionLibroTests(TestCase):
+    DIA = datetime.date(2026, 5, 4)
+
+    def setUp(self):
+        # Siete en la misma fecha (el id desempata) y tres días antes
+        self.movimientos = MovimientoContable.objects.bulk_create([
+            MovimientoContable(tipo='ingreso' if i % 2 else 'egreso', monto=Decimal(10 + i), es_divisa=i < 3,
+                               fecha=self.DIA - datetime.timedelta(days=0 if i < 7 else i - 6),
+                               referencia=f"REF-{i}", descripcion=f"Movimiento {i}")
+            for i in range(10)
+        ])
+        self.orden = [m.id for m in sorted(self.movimientos, key=lambda m: (m.fecha, m.id), reverse=True)]
+
+    def test_paginas_con_fechas_iguales_sin_saltos_ni_repetidos(self):
+        from .paginacion import paginar_por_cursor
+        vistos, paginas, cursor = [], [], None
+        while True:
+            pagina = paginar_por_cursor(MovimientoContable.objects.all(), 'fecha', despues=cursor, tamano=3)
+            paginas.append(pagina)
+            vistos += [m.id for m in pagina['objetos']]
+            cursor = pagina['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(vistos, self.orden)
+        self.assertEqual(len(paginas), 4)
+        self.assertIsNone(paginas[0]['anterior'])
+
+        # Volver atrás desde la tercera página da exactamente la segunda
+        atras = paginar_por_cursor(MovimientoContable.objects.all(), 'fecha', antes=paginas[2]['anterior'], tamano=3)
+        self.assertEqual([m.id for m in atras['objetos']], [m.id for m in paginas[1]['objetos']])
+        self.assertEqual((atras['anterior'], atras['siguiente']), (paginas[1]['anterior'], paginas[1]['siguiente']))
+
+    def test_cursor_alterado_vuelve_a_la_primera_pagina(self):
+        from .paginacion import paginar_por_cursor
+        primera = [m.id for m in paginar_por_cursor(MovimientoContable.objects.all(), tamano=3)['objetos']]
+        for cursor in ['basura', '2026-13-01_5', '2026-05-04_x', '_', '2026-05-04']:
+            pagina = paginar_por_cursor(MovimientoContable.objects.all(), despues=cursor, antes=cursor, tamano=3)
+            self.assertEqual([m.id for m in pagina['objetos']], primera, cursor)
+
+    def test_filtros_del_panel(self):
+        self.client.force_login(crear_personal('contadora', 'contador'))
+        response = self.client.get(reverse('dashboard'), {'tipo': 'ingreso', 'moneda': 'bs', 'referencia': 'REF-'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({m.descripcion for m in response.context['movimientos']},
+                         {"Movimiento 3", "Movimiento 5", "Movimiento 7", "Movimiento 9"})
+
+        response = self.client.get(reverse('dashboard'), {'desde': self.DIA - datetime.timedelta(days=2), 'hasta': self.DIA - datetime.timedelta(days=1)})
+        self.assertEqual([m.descripcion for m in response.context['movimientos']], ["Movimiento 7", "Movimiento 8"])
+
+    def test_filtro_invalido_no_muestra_el_libro_completo(self):
+        admin = User.objects.create_user('direccion', password='x', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('panel_finanzas'), {'desde': '31/31/2026', 'tipo': 'regalo'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.context['movimientos'], [])
+        self.assertContains(response, "Filtros inválidos", status_code=400)
+
+
+# ==========================================
+# 3. BÚSQUEDA DE PACIENTES (ÍNDICE DE TOKENS)
+# ==========================================
+
+class BusquedaPacientesTests(PresupuestoConsultasMixin, TestCase):
+
+    def paciente(self, nombre, apellido, cedula):
+        return Paciente.objects.create(nombre=nombre, apellido=apellido, cedula=cedula,
+                                       fecha_nacimiento=datetime.date(1980, 1, 1), sexo='M', telefono='0')
+
+    def setUp(self):
+        self.jose = self.paciente("José", "Pérez", "V-12.345.678")
+        self.josefina = self.paciente("Josefina", "Peralta", "V-9.876.543")
+        self.ana = self.paciente("Ana", "Perez", "E-84.000.111")
+        self.pedro = self.paciente("Pedro", "Josué Díaz", "V-12.399.000")
+
+    def buscar(self, consulta):
+        from .busqueda import buscar_pacientes
+        return list(buscar_pacientes(consulta))
+
+    def test_prefijos_sin_acentos_ni_mayusculas(self):
+        self.assertEqual(set(self.buscar("PEREZ")), {self.jose.id, self.ana.id})
+        self.assertEqual(set(self.buscar("pér")), {self.jose.id, self.ana.id, self.josefina.id})
+        self.assertEqual(self.buscar("pér jos"), [self.josefina.id, self.jose.id])
+        self.assertEqual(self.buscar("pérez jos"), [self.jose.id])
+        self.assertEqual(self.buscar("diaz josue"), [self.pedro.id])
+        self.assertEqual(self.buscar("xyz"), [])
+        self.assertEqual(self.buscar("  ¿? "), [])
+
+    def test_cedula_por_sus_digitos(self):
+        self.assertEqual(self.buscar("V-12.345.678"), [self.jose.id])
+        self.assertEqual(set(self.buscar("123")), {self.jose.id, self.pedro.id})
+        self.assertEqual(self.buscar("V 84000"), [self.ana.id])
+
+    def test_ranking_palabra_exacta_luego_prefijo_y_luego_los_recientes(self):
+        # 'jose' exacta, luego 'josefina' y 'josue' (el prefijo más cercano primero)
+        self.assertEqual(self.buscar("jose"), [self.jose.id, self.josefina.id])
+        self.assertEqual(self.buscar("jos"), [self.jose.id, self.josefina.id, self.pedro.id])
+        # A igual palabra, el paciente más reciente primero
+        self.assertEqual(self.buscar("perez"), [self.ana.id, self.jose.id])
+
+    def test_guardar_reindexa_solo_si_cambia_el_nombre(self):
+        self.jose.apellido = "Rodríguez"
+        self.jose.save()
+        self.assertEqual(self.buscar("perez"), [self.ana.id])
+        self.assertEqual(self.buscar("rodriguez"), [self.jose.id])
+
+        tokens = list(TokenBusquedaPaciente.objects.filter(paciente=self.jose).values_list('id', flat=True))
+        self.jose.telefono = '0414'
+        self.jose.save(update_fields=['telefono'])
+        self.assertEqual(list(TokenBusquedaPaciente.objects.filter(paciente=self.jose).values_list('id', flat=True)), tokens)
+
+    def test_reindexar_tras_carga_masiva_y_vista(self):
+        from .busqueda import reindexar_pacientes
+        Paciente.objects.bulk_create([
+            Paciente(nombre="Ñoño", apellido=f"Muñoz {i}", cedula=f"V-5{i}", fecha_nacimiento=datetime.date(1990, 1, 1), sexo='F', telefono='0')
+            for i in range(3)
+        ])
+        self.assertEqual(self.buscar("munoz"), [])
+        self.assertEqual(reindexar_pacientes(Paciente.objects.filter(nombre="Ñoño"), lote=2), 3)
+        self.assertEqual(len(self.buscar("nono munoz")), 3)
+
+        self.client.force_login(crear_personal('recepcion', 'secretaria'))
+        response = self.client.get(reverse('lista_pacientes'), {'q': 'jos'})
+        self.assertDentroDelPresupuesto(response, 'lista_pacientes')
+        self.assertEqual([p.id for p in response.context['pacientes']], [self.jose.id, self.josefina.id, self.pedro.id])
+
+
+# ==========================================
+# 4. PRESUPUESTO DE CONSULTAS POR VISTA
+# ==========================================
+
+class PresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_datos_clinica(15)[0]
+        cls.enfermera = crear_personal('enfermera', 'enfermera')
+        cls.contador = crear_personal('contador', 'contador')
+        cls.secretaria = crear_personal('secretaria', 'secretaria')
+        cls.admin = User.objects.create_superuser('admin', 'admin@clinica.com', 'clave-segura-123')
+        cls.paciente = Paciente.objects.first()
+        cls.paciente.usuario = User.objects.create_user('paciente', password='clave-segura-123')
+        cls.paciente.save()
+
+    def get(self, usuario, nombre_url, *args):
+        if usuario:
+            self.client.force_login(usuario)
+        response = self.client.get(reverse(nombre_url, args=args))
+        self.assertEqual(response.status_code, 200)
+        return self.assertDentroDelPresupuesto(response, nombre_url)
+
+    def test_vistas_publicas(self):
+        self.client.get(reverse('inicio'))  # la primera visita llena la caché de la portada
+        for nombre in ['inicio', 'cita_invitado', 'registro_paciente', 'registro_personal']:
+            with self.subTest(nombre):
+                self.get(None, nombre)
+
+    def test_dashboard_de_cada_rol(self):
+        usuarios = [self.medico, self.enfermera, self.contador, self.secretaria, self.admin, self.paciente.usuario]
+        for usuario in usuarios:
+            with self.subTest(usuario.username):
+                self.get(usuario, 'dashboard')
+
+    def test_vistas_administrativas(self):
+        for nombre in ['panel_finanzas', 'gestion_staff', 'gestion_autorizaciones', 'lista_pacientes',
+                       'crear_paciente', 'gestion_cms', 'editar_aviso']:
+            with self.subTest(nombre):
+                self.get(self.admin, nombre)
+
+    def test_vistas_con_parametros(self):
+        self.get(self.medico, 'detalle_paciente', self.paciente.id)
+        self.get(self.medico, 'historia_paciente', self.paciente.id)
+        self.get(self.admin, 'editar_slide', CarruselImagen.objects.first().id)
+        self.get(self.admin, 'editar_faq', PreguntaFrecuente.objects.first().id)
+        self.get(self.enfermera, 'ejecutar_orden', OrdenMedica.objects.first().id)
+
+    def test_consultas_no_crecen_con_los_datos(self):
+        """ Con el triple de filas la vista debe hacer exactamente las mismas consultas """
+        vistas = [(self.enfermera, 'dashboard'), (self.admin, 'gestion_staff'),
+                  (self.admin, 'gestion_autorizaciones'), (self.medico, 'detalle_paciente', self.paciente.id)]
+        antes = [self.get(u, nombre, *args).cantidad for u, nombre, *args in vistas]
+        crear_datos_clinica(45)
+        Cita.objects.bulk_create([
+            Cita(paciente=self.paciente, medico=medico, fecha=datetime.date(2024, 1, 1), hora=datetime.time(9), motivo="Control")
+            for medico in User.objects.filter(perfilusuario__rol='medico')
+        ])
+        despues = [self.get(u, nombre, *args).cantidad for u, nombre, *args in vistas]
+        self.assertEqual(antes, despues)
+
+    def test_sin_debug_solo_cuenta_consultas_y_tiempo(self):
+        """ En producción el registro no guarda el SQL ni los parámetros (datos de pacientes) """
+        with override_settings(CONSULTAS_REGISTRAR_SQL=False, DEBUG=False):
+            registro = self.get(self.medico, 'detalle_paciente', self.paciente.id)
+        self.assertGreater(registro.cantidad, 0)
+        self.assertGreater(registro.tiempo, 0)
+        self.assertEqual((registro.sql, registro.parametros), ([], []))
+
+        with override_settings(CONSULTAS_REGISTRAR_SQL=False, DEBUG=True):
+            registro = self.get(self.medico, 'detalle_paciente', self.paciente.id)
+        self.assertEqual(len(registro.sql), registro.cantidad)
+        self.assertIn(self.paciente.id, [p for parametros in registro.parametros for p in parametros])
+
+
+# ==========================================
+# 5. CACHÉ DE ESTADÍSTICAS DE DIRECCIÓN
+# ==========================================
+
+class EstadisticasAdminTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        crear_datos_clinica(3)
+
+    def test_segunda_lectura_no_consulta_la_base(self):
+        primera = estadisticas_admin()
+        with self.assertNumQueries(0):
+            self.assertEqual(estadisticas_admin(), primera)
+
+    def test_guardar_paciente_invalida_solo_su_conteo(self):
+        antes = estadisticas_admin()
+        with self.captureOnCommitCallbacks(execute=True):
+            Paciente.objects.create(cedula="V-999", nombre="Nuevo", apellido="Paciente",
+                                    fecha_nacimiento=datetime.date(2000, 1, 1), sexo='M', telefono='0')
+        with self.assertNumQueries(1):
+            despues = estadisticas_admin()
+        self.assertEqual(despues['total_pacientes'], antes['total_pacientes'] + 1)
+
+    def test_movimiento_actualiza_finanzas(self):
+        antes = estadisticas_admin()['finanzas']
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoContable.objects.create(tipo='egreso', monto=Decimal('4.00'), descripcion="Gasas", es_divisa=True)
+        despues = estadisticas_admin()['finanzas']
+        self.assertEqual(despues['egresos'], antes['egresos'] + 4)
+        self.assertEqual(despues['balance'], antes['balance'] - 4)
+
+
+# ==========================================
+# 6. CACHÉ DE LA PORTADA (CMS)
+# ==========================================
+
+class PortadaCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.faq = PreguntaFrecuente.objects.create(pregunta="¿Atienden sábados?", respuesta="Sí", orden=1)
+
+    def test_visitas_repetidas_no_consultan_la_base(self):
+        self.client.get(reverse('inicio'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('inicio'))
+        self.assertContains(response, "¿Atienden sábados?")
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_if_none_match_devuelve_304(self):
+        etag = self.client.get(reverse('inicio'))['ETag']
+        response = self.client.get(reverse('inicio'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_editar_faq_cambia_la_version(self):
+        etag = self.client.get(reverse('inicio'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.pregunta = "¿Atienden domingos?"
+            self.faq.save()
+        response = self.client.get(reverse('inicio'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "¿Atienden domingos?")
+
+    def test_usuario_autenticado_no_usa_la_cache(self):
+        self.client.get(reverse('inicio'))
+        self.client.force_login(User.objects.create_user('visitante', password='clave-segura-123'))
+        response = self.client.get(reverse('inicio'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, "Salir")
+
+
+# ==========================================
+# 7. VARIANTES RESPONSIVAS DEL CARRUSEL
+# ==========================================
+
+def imagen_de_prueba(ancho, alto, color='red'):
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new('RGB', (ancho, alto), color).save(buffer, 'PNG')
+    return SimpleUploadedFile('slide.png', buffer.getvalue(), content_type='image/png')
+
+
+MEDIA_PRUEBAS = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_PRUEBAS, TAREAS_SINCRONAS=True)
+class VariantesCarruselTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_PRUEBAS, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def crear_slide(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CarruselImagen.objects.create(titulo="Fachada", imagen=imagen_de_prueba(1600, 500))
+
+    def test_subir_imagen_genera_variantes_sin_agrandar(self):
+        slide = self.crear_slide()
+        slide.refresh_from_db()
+        anchos = [v['ancho'] for v in slide.variantes['webp']]
+        self.assertEqual(anchos, [a for a in ANCHOS_CARRUSEL if a < 1600] + [1600])  # el original es la mayor
+        for variante in slide.variantes['webp'] + slide.variantes['jpg']:
+            self.assertTrue(default_storage.exists(variante['archivo']))
+
+        response = self.client.get(reverse('inicio'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f"{slide.variantes['jpg'][0]['ancho']}w")
+
+    def test_reemplazar_imagen_regenera_y_borra_las_viejas(self):
+        slide = self.crear_slide()
+        slide.refresh_from_db()
+        viejas = [v['archivo'] for v in slide.variantes['jpg']]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            slide.imagen = imagen_de_prueba(800, 300, 'blue')
+            slide.save()
+        slide.refresh_from_db()
+        self.assertEqual([v['ancho'] for v in slide.variantes['jpg']], [480, 800])
+        self.assertFalse(any(default_storage.exists(ruta) for ruta in viejas))
+
+    def test_editar_titulo_no_regenera(self):
+        slide = self.crear_slide()
+        with self.captureOnCommitCallbacks() as callbacks:
+            slide.titulo = "Nueva fachada"
+            slide.save()
+        # Solo la invalidación de la portada, ninguna tarea de imágenes
+        self.assertEqual(len(callbacks), 1)
+
+
+# ==========================================
+# 8. RECETAS EN PDF (CACHÉ POR HASH + POOL)
+# ==========================================
+
+CACHE_PDF_PRUEBAS = tempfile.mkdtemp()
+
+@override_settings(PDF_CACHE_DIR=CACHE_PDF_PRUEBAS, PDF_PROCESOS=0, PDF_ESPERA=5)
+class RecetaPDFTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_datos_clinica(1)[0]
+        cls.cita = Cita.objects.get()
+        cls.cita.diagnostico, cls.cita.tratamiento, cls.cita.realizada = "Gripe", "Reposo", True
+        cls.cita.save()
+        cls.paciente = cls.cita.paciente
+        cls.paciente.usuario = User.objects.create_user('paciente', password='clave-segura-123')
+        cls.paciente.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(CACHE_PDF_PRUEBAS, ignore_errors=True)
+
+    def test_receta_se_genera_una_vez_y_se_reutiliza(self):
+        from .pdf import ruta_pdf
+        self.client.force_login(self.paciente.usuario)
+        response = self.client.get(reverse('receta_pdf', args=[self.cita.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertDentroDelPresupuesto(response, 'receta_pdf')
+
+        etag = response['ETag']
+        self.assertTrue(ruta_pdf(etag.strip('"')).exists())
+        with mock.patch('miapp.pdf.html_a_pdf') as renderizar:
+            segunda = self.client.get(reverse('receta_pdf', args=[self.cita.id]))
+        renderizar.assert_not_called()
+        self.assertEqual(segunda['ETag'], etag)
+        self.assertEqual(self.client.get(reverse('receta_pdf', args=[self.cita.id]), headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_otro_paciente_no_puede_verla(self):
+        self.client.force_login(User.objects.create_user('intruso', password='clave-segura-123'))
+        response = self.client.get(reverse('receta_pdf', args=[self.cita.id]))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('pdf_estado', args=['0' * 64])).status_code, 404)
+
+    @override_settings(PDF_PROCESOS=1, PDF_ESPERA=0)
+    def test_pool_de_procesos_y_consulta_de_estado(self):
+        self.client.force_login(self.medico)
+        self.cita.tratamiento = "Reposo y líquidos"  # contenido distinto = huella distinta
+        self.cita.save()
+        response = self.client.get(reverse('receta_pdf', args=[self.cita.id]))
+        self.assertEqual(response.status_code, 202)
+        url_estado = response.context['url_estado']
+
+        for _ in range(120):
+            estado = self.client.get(url_estado)
+            self.assertDentroDelPresupuesto(estado, 'pdf_estado')
+            if estado.json()['estado'] != 'pendiente':
+                break
+            time.sleep(0.5)
+        self.assertEqual(estado.json()['estado'], 'listo')
+        descarga = self.client.get(estado.json()['url'])
+        self.assertEqual(descarga.status_code, 200)
+        self.assertDentroDelPresupuesto(descarga, 'pdf_descargar')
+
+
+# ==========================================
+# 9. EXPORTACIÓN MASIVA DE HISTORIAS
+# ==========================================
+
+@override_settings(PDF_CACHE_DIR=CACHE_PDF_PRUEBAS, PDF_PROCESOS=0)
+class ExportacionHistorialesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_datos_clinica(3)
+        cls.admin = User.objects.create_superuser('admin', 'admin@clinica.com', 'clave-segura-123')
+
+    def test_comando_escribe_un_pdf_por_paciente(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = f"{carpeta}/historias.zip"
+            call_command('exportar_historiales', ruta, stdout=StringIO())
+            with zipfile.ZipFile(ruta) as archivo_zip:
+                nombres = archivo_zip.namelist()
+                self.assertEqual(len(nombres), 3)
+                self.assertTrue(all(archivo_zip.read(n).startswith(b'%PDF') for n in nombres))
+
+    def test_accion_del_admin_envia_el_zip_en_streaming(self):
+        self.client.force_login(self.admin)
+        ids = list(Paciente.objects.values_list('id', flat=True))
+        response = self.client.post(reverse('admin:miapp_paciente_changelist'), {
+            'action': 'exportar_historiales_pdf', '_selected_action': ids,
+        })
+        self.assertTrue(response.streaming)
+        partes = list(response.streaming_content)
+        self.assertGreater(len(partes), len(ids))  # un trozo por paciente + el directorio final
+        with zipfile.ZipFile(BytesIO(b''.join(partes))) as archivo_zip:
+            self.assertEqual(len(archivo_zip.namelist()), 3)
+            self.assertIsNone(archivo_zip.testzip())
+
+    def test_consultas_por_lote_y_no_por_paciente(self):
+        from .exportacion import _pacientes_con_historial, html_historial
+        crear_datos_clinica(10)
+        ids = list(Paciente.objects.values_list('id', flat=True))
+        # paciente + citas + órdenes + documentos, una vez por lote de 200
+        with self.assertNumQueries(4):
+            for paciente in _pacientes_con_historial(ids):
+                html_historial(paciente)
+
+
+# ==========================================
+# 10. DISPONIBILIDAD DE MÉDICOS
+# ==========================================
+
+class DisponibilidadTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cardio = Especialidad.objects.create(nombre='Cardiología')
+        cls.pediatria = Especialidad.objects.create(nombre='Pediatría')
+        cls.ana = crear_personal('ana', 'medico', cls.cardio)
+        cls.beto = crear_personal('beto', 'medico', cls.pediatria)
+        # Próximo lunes, para que los turnos siempre sean futuros
+        hoy = datetime.date.today()
+        cls.lunes = hoy + datetime.timedelta(days=7 - hoy.weekday())
+        for medico, inicio in [(cls.ana, 8), (cls.beto, 9)]:
+            HorarioMedico.objects.create(medico=medico, dia_semana=0, hora_inicio=datetime.time(inicio),
+                                         hora_fin=datetime.time(inicio + 1), duracion_turno=20)
+        cls.paciente = Paciente.objects.create(cedula="V-1", nombre="Luis", apellido="Mora",
+                                               fecha_nacimiento=datetime.date(1990, 1, 1), sexo='M', telefono='0')
+
+    def test_indice_fusiona_y_detecta_solapes(self):
+        from .disponibilidad import IndiceIntervalos
+        indice = IndiceIntervalos([(60, 90), (80, 120), (200, 220)])
+        self.assertEqual(len(indice), 2)
+        self.assertFalse(indice.libre(100, 130))
+        self.assertTrue(indice.libre(120, 200))
+        self.assertFalse(indice.libre(190, 201))
+        self.assertTrue(indice.libre(0, 60))
+
+    def test_turnos_libres_salta_citas_y_excepciones(self):
+        from .disponibilidad import turnos_libres
+        Cita.objects.create(paciente=self.paciente, medico=self.ana, fecha=self.lunes, hora=datetime.time(8, 20), motivo="x")
+        ExcepcionHorario.objects.create(medico=self.beto, fecha=self.lunes, hora_inicio=datetime.time(9), hora_fin=datetime.time(9, 30))
+        with self.assertNumQueries(3):
+            turnos = turnos_libres(desde=self.lunes, cantidad=4, dias=0)
+        self.assertEqual([(t.medico_id, t.hora) for t in turnos], [
+            (self.ana.id, datetime.time(8)), (self.ana.id, datetime.time(8, 40)),
+            (self.beto.id, datetime.time(9, 40)),
+        ])
+        self.assertEqual({t.especialidad for t in turnos_libres(especialidad=self.pediatria, desde=self.lunes)}, {'Pediatría'})
+
+    def test_formulario_de_invitado_rechaza_turnos_invalidos(self):
+        from .forms import CitaInvitadoForm
+        Cita.objects.create(paciente=self.paciente, medico=self.ana, fecha=self.lunes, hora=datetime.time(8), motivo="x")
+        base = {'cedula': 'V-2', 'nombre': 'Eva', 'apellido': 'Gil', 'telefono': '0', 'fecha_nacimiento': '1990-01-01',
+                'sexo': 'F', 'medico': self.ana.id, 'fecha': self.lunes.isoformat(), 'motivo': 'Control'}
+        for hora, valida in [('08:00', False), ('08:10', False), ('12:00', False), ('08:20', True)]:
+            with self.subTest(hora):
+                self.assertEqual(CitaInvitadoForm({**base, 'hora': hora}).is_valid(), valida)
+
+    def test_endpoint_json(self):
+        response = self.client.get(reverse('turnos_disponibles'), {'medico': self.beto.id, 'cantidad': 2})
+        self.assertDentroDelPresupuesto(response)
+        turnos = response.json()['turnos']
+        self.assertEqual(len(turnos), 2)
+        self.assertEqual(turnos[0]['especialidad'], 'Pediatría')
+        self.assertEqual(self.client.get(reverse('turnos_disponibles'), {'cantidad': 'mil'}).status_code, 400)
+
+
+# ==========================================
+# 11. RESERVAS CONCURRENTES
+# ==========================================
+
+class BaseEnArchivoMixin:
+    """
+    La base de pruebas de SQLite vive en memoria compartida, y ahí un hilo que choca con otro
+    falla al instante con "table is locked" en vez de esperar su turno. Las clases con hilos
+    de verdad la copian a un archivo mientras corren (el resto sigue en memoria).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from django.db import connection
+        cls._base_en_memoria = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            import sqlite3
+            cls._base_en_memoria = connection.settings_dict['NAME']
+            # Mientras esta conexión siga abierta la base en memoria no se pierde
+            cls._memoria = sqlite3.connect(cls._base_en_memoria, uri=True)
+            descriptor, cls._archivo = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(descriptor)
+            destino = sqlite3.connect(cls._archivo)
+            cls._memoria.backup(destino)
+            destino.close()
+            connection.close()
+            connection.settings_dict['NAME'] = cls._archivo
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls._base_en_memoria:
+            from django.db import connection
+            connection.close()
+            connection.settings_dict['NAME'] = cls._base_en_memoria
+            connection.ensure_connection()
+            cls._memoria.close()
+            os.remove(cls._archivo)
+
+
+class ReservaConcurrenteTests(BaseEnArchivoMixin, TransactionTestCase):
+    """ Muchos hilos reservando a la vez los mismos turnos: ni turnos duplicados ni errores 500 """
+
+    HILOS = 8
+
+    def setUp(self):
+        cache.clear()
+        cardio = Especialidad.objects.create(nombre='Cardiología')
+        self.medicos = [crear_personal(f"medico{i}", 'medico', cardio) for i in range(3)]
+        hoy = datetime.date.today()
+        self.lunes = hoy + datetime.timedelta(days=7 - hoy.weekday())
+        for medico in self.medicos:
+            HorarioMedico.objects.create(medico=medico, dia_semana=0, hora_inicio=datetime.time(8),
+                                         hora_fin=datetime.time(12), duracion_turno=10)
+        # 3 médicos × 24 turnos = 72 turnos para miles de intentos: mucha contención
+        self.turnos = [(m.id, datetime.time(8 + k // 6, k % 6 * 10)) for m in self.medicos for k in range(24)]
+
+    def datos(self, n, medico, hora):
+        return {
+            'cedula': f"V-{n % 300}", 'nombre': 'Carga', 'apellido': f"Prueba{n}", 'telefono': f"0414{n}",
+            'fecha_nacimiento': datetime.date(1990, 1, 1), 'sexo': 'F', 'medico': medico,
+            'fecha': self.lunes, 'hora': hora, 'motivo': 'Control',
+        }
+
+    def en_paralelo(self, trabajo):
+        """ Lanza HILOS hilos que arrancan juntos; devuelve las excepciones inesperadas """
+        from django.db import connection
+        errores, salida = [], threading.Barrier(self.HILOS)
+
+        def envoltura(numero):
+            try:
+                salida.wait()
+                trabajo(numero, random.Random(numero))
+            except Exception as e:
+                errores.append(repr(e))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=envoltura, args=(n,)) for n in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return errores
+
+    def assertSinTurnosRepetidos(self):
+        repetidos = Cita.objects.values('medico', 'fecha', 'hora').annotate(n=Count('id')).filter(n__gt=1)
+        self.assertFalse(repetidos.exists())
+        self.assertEqual(Cita.objects.count(), len(self.turnos))
+
+    def test_miles_de_reservas_concurrentes(self):
+        from .reservas import reservar_cita, TurnoOcupado
+        medicos = {m.id: m for m in self.medicos}
+        creadas, rechazadas = [], []
+
+        def trabajo(numero, rnd):
+            for i in range(400):
+                n = numero * 400 + i
+                medico_id, hora = rnd.choice(self.turnos)
+                clave = f"clave-{n // 2}"  # cada clave se manda dos veces (doble envío)
+                try:
+                    cita, nueva = reservar_cita(self.datos(n // 2, medicos[medico_id], hora), clave)
+                    if nueva:
+                        creadas.append(cita.pk)
+                except TurnoOcupado:
+                    rechazadas.append(n)
+
+        self.assertEqual(self.en_paralelo(trabajo), [])
+        self.assertGreater(len(creadas) + len(rechazadas), 3000)  # el resto: reenvíos de una clave ya atendida
+        self.assertSinTurnosRepetidos()
+        self.assertEqual(sorted(creadas), sorted(Cita.objects.values_list('pk', flat=True)))
+        self.assertFalse(SolicitudIdempotente.objects.filter(cita__isnull=True).exists())
+
+    def test_envios_http_concurrentes_sin_errores_500(self):
+        estados = []
+
+        def trabajo(numero, rnd):
+            cliente = self.client_class()
+            for i in range(25):
+                n = numero * 25 + i
+                medico_id, hora = rnd.choice(self.turnos)
+                datos = {**self.datos(n, medico_id, hora.strftime('%H:%M')), 'clave_idempotencia': f"http-{n}"}
+                for _ in range(2 if i % 4 == 0 else 1):  # 25 %: doble clic
+                    estados.append(cliente.post(reverse('cita_invitado'), datos).status_code)
+
+        self.assertEqual(self.en_paralelo(trabajo), [])
+        self.assertEqual(set(estados) - {200, 302}, set())
+        repetidos = Cita.objects.values('medico', 'fecha', 'hora').annotate(n=Count('id')).filter(n__gt=1)
+        self.assertFalse(repetidos.exists())
+        self.assertEqual(SolicitudIdempotente.objects.filter(cita__isnull=False).count(), Cita.objects.count())
+
+
+class ClavesIdempotenciaTests(TestCase):
+
+    def test_limpieza_borra_solo_las_claves_vencidas(self):
+        vieja = SolicitudIdempotente.objects.create(clave="vieja")
+        SolicitudIdempotente.objects.filter(pk=vieja.pk).update(fecha_creacion=timezone.now() - datetime.timedelta(hours=25))
+        SolicitudIdempotente.objects.create(clave="reciente")
+        salida = StringIO()
+        call_command('limpiar_subidas', stdout=salida)
+        self.assertIn("1 claves de reserva vencidas", salida.getvalue())
+        self.assertEqual(list(SolicitudIdempotente.objects.values_list('clave', flat=True)), ["reciente"])
+
+
+# ==========================================
+# 12. FEED DE ÓRDENES DE ENFERMERÍA
+# ==========================================
+
+@override_settings(FEED_ORDENES_ESPERA=0)
+class FeedOrdenesTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_datos_clinica(5)[0]
+        cls.enfermera = crear_personal('enfermera', 'enfermera')
+        cls.paciente = Paciente.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.enfermera)
+
+    def feed(self, **params):
+        response = self.client.get(reverse('feed_ordenes'), params)
+        self.assertDentroDelPresupuesto(response)
+        return response
+
+    def test_sin_version_envia_todas_las_pendientes(self):
+        datos = self.feed().json()
+        pendientes = list(OrdenMedica.objects.filter(ejecutada=False).order_by('fecha_creacion', 'id').values_list('id', flat=True))
+        self.assertEqual(datos['pendientes'], pendientes)
+        self.assertEqual(datos['html'].count('data-orden='), len(pendientes))
+
+    def test_sin_cambios_responde_204_enseguida(self):
+        datos = self.feed().json()
+        response = self.feed(version=datos['version'], cursor=datos['cursor'])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Retry-After'], str(settings.FEED_ORDENES_REINTENTO))
+        # Una sola lectura de las órdenes: la versión, del índice de pendientes
+        self.assertEqual(sum('miapp_ordenmedica' in sql for sql in response.wsgi_request.consultas_sql.sql), 1)
+
+    def test_nota_cambios_hechos_sin_senales_u_otro_worker(self):
+        # update() no dispara señales: la versión en caché de este proceso no se entera
+        datos = self.feed().json()
+        orden = OrdenMedica.objects.filter(ejecutada=False).first()
+        OrdenMedica.objects.filter(pk=orden.pk).update(ejecutada=True, fecha_modificacion=timezone.now())
+        cambios = self.feed(version=datos['version'], cursor=datos['cursor']).json()
+        self.assertNotIn(orden.id, cambios['pendientes'])
+        self.assertEqual(self.feed(version=cambios['version'], cursor=cambios['cursor']).status_code, 204)
+
+    def test_solo_envia_lo_modificado_desde_el_cursor(self):
+        datos = self.feed().json()
+        ejecutada = OrdenMedica.objects.first()
+        with mock.patch('miapp.ordenes.MARGEN_CURSOR', datetime.timedelta(0)):
+            time.sleep(0.01)
+            with self.captureOnCommitCallbacks(execute=True):
+                nueva = OrdenMedica.objects.create(paciente=self.paciente, medico=self.medico, indicacion="Curar herida")
+                ejecutada.ejecutada = True
+                ejecutada.save()
+            cambios = self.feed(version=datos['version'], cursor=datos['cursor']).json()
+
+        self.assertNotEqual(cambios['version'], datos['version'])
+        self.assertIn(nueva.id, cambios['pendientes'])
+        self.assertNotIn(ejecutada.id, cambios['pendientes'])
+        self.assertEqual(cambios['html'].count('data-orden='), 1)
+        self.assertIn("Curar herida", cambios['html'])
+
+    def test_solo_enfermeria(self):
+        self.client.force_login(self.medico)
+        self.assertEqual(self.client.get(reverse('feed_ordenes')).status_code, 403)
+
+    def test_panel_trae_version_y_cursor_del_feed(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, reverse('feed_ordenes'))
+        self.assertContains(response, 'data-orden=', count=OrdenMedica.objects.filter(ejecutada=False).count())
+
+
+@override_settings(FEED_ORDENES_ESPERA=5)
+class FeedOrdenesAsyncTests(TransactionTestCase):
+    """ Bajo ASGI el feed espera (sin hilo) hasta que cambie la versión de la base """
+
+    def setUp(self):
+        cache.clear()
+        self.medico = crear_personal('medico', 'medico')
+        self.enfermera = crear_personal('enfermera', 'enfermera')
+        self.paciente = Paciente.objects.create(cedula="V-1", nombre="Ana", apellido="Ruiz", telefono='0',
+                                                fecha_nacimiento=datetime.date(1990, 1, 1), sexo='F')
+
+    async def feed(self, **params):
+        cliente = AsyncClient()
+        await cliente.aforce_login(self.enfermera)
+        return await cliente.get(reverse('feed_ordenes'), params)
+
+    def nueva_orden(self):
+        # Sin señales ni caché: como si la guardara otro worker
+        OrdenMedica.objects.bulk_create([OrdenMedica(paciente=self.paciente, medico=self.medico, indicacion="Control de glicemia")])
+
+    def test_la_espera_termina_en_cuanto_cambia_la_base(self):
+        datos = async_to_sync(self.feed)().json()
+        threading.Timer(0.3, self.nueva_orden).start()
+        inicio = time.monotonic()
+        with mock.patch('miapp.ordenes.INTERVALO_BD', 0.5):
+            response = async_to_sync(self.feed)(version=datos['version'], cursor=datos['cursor'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Control de glicemia", response.json()['html'])
+        self.assertLess(time.monotonic() - inicio, 3)
+
+    @override_settings(FEED_ORDENES_ESPERA=1)
+    def test_sin_cambios_responde_204_al_vencer_la_espera(self):
+        datos = async_to_sync(self.feed)().json()
+        response = async_to_sync(self.feed)(version=datos['version'], cursor=datos['cursor'])
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.has_header('Retry-After'))
+
+
+# ==========================================
+# 13. ÍNDICES (ASESOR CON EXPLAIN)
+# ==========================================
+
+class AsesorIndicesTests(TestCase):
+
+    def setUp(self):
+        from .management.commands.asesor_indices import Command
+        self.asesor = Command(stdout=StringIO())
+
+    def problemas(self, queryset):
+        return self.asesor.problemas(*queryset.query.sql_with_params())
+
+    def test_detecta_escaneo_completo(self):
+        self.assertIn(('escaneo completo', 'miapp_paciente'), self.problemas(Paciente.objects.filter(telefono='0414')))
+
+    def test_consultas_frecuentes_usan_indice(self):
+        for queryset in [
+            OrdenMedica.objects.filter(ejecutada=False).order_by('fecha_creacion', 'id'),
+            OrdenMedica.objects.filter(medico_id=1).order_by('-fecha_creacion')[:10],
+            Cita.objects.filter(paciente_id=1).order_by('-fecha'),
+            MovimientoContable.objects.filter(tipo='ingreso').order_by('-fecha', '-id')[:50],
+        ]:
+            with self.subTest(str(queryset.query)[:60]):
+                self.assertEqual(self.problemas(queryset), [])
+
+    def test_sugiere_columnas_del_where_y_del_order_by(self):
+        sql = str(OrdenMedica.objects.filter(medico_id=1).order_by('-fecha_creacion').query)
+        self.assertEqual(self.asesor.columnas_sugeridas(sql, 'miapp_ordenmedica'), ['medico_id', '-fecha_creacion'])
+
+    def test_comando_recorre_las_vistas(self):
+        salida = StringIO()
+        call_command('asesor_indices', roles=['anonimo'], min_filas=0, stdout=salida, stderr=StringIO())
+        self.assertIn("consultas distintas analizadas", salida.getvalue())
+
+
+# ==========================================
+# 14. CONEXIÓN DE LECTURA SEPARADA (PERFIL DE PRODUCCIÓN)
+# ==========================================
+
+class RouterLecturaEscrituraTests(TestCase):
+    """ El router solo manda a 'lectura' consultas de peticiones GET/HEAD fuera de una transacción """
+
+    def setUp(self):
+        self.router = RouterLecturaEscritura()
+        self.default = mock.Mock(in_atomic_block=False)
+        patcher = mock.patch('miapp.routers.connections', {'default': self.default, 'lectura': mock.Mock()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lecturas_de_peticiones_de_solo_lectura(self):
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+        with solo_lectura():
+            self.assertEqual(self.router.db_for_read(Paciente), 'lectura')
+            self.assertEqual(self.router.db_for_write(Paciente), 'default')
+        self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    def test_dentro_de_una_transaccion_lee_de_la_conexion_que_escribe(self):
+        self.default.in_atomic_block = True
+        with solo_lectura():
+            self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    def test_middleware_marca_solo_get_y_head(self):
+        vistos = []
+        middleware = LecturaSeparadaMiddleware(lambda request: vistos.append(self.router.db_for_read(Paciente)))
+        for metodo in ['GET', 'HEAD', 'POST']:
+            middleware(mock.Mock(method=metodo))
+        self.assertEqual(vistos, ['lectura', 'lectura', 'default'])
+
+    def test_sin_alias_de_lectura_todo_va_a_default(self):
+        with mock.patch('miapp.routers.connections', {'default': self.default}), solo_lectura():
+            self.assertEqual(self.router.db_for_read(Paciente), 'default')
+
+    def test_solo_se_migra_default(self):
+        self.assertTrue(self.router.allow_migrate('default', 'miapp'))
+        self.assertFalse(self.router.allow_migrate('lectura', 'miapp'))
+
+
+# ==========================================
+# 15. DASHBOARD ASYNC (ASGI)
+# ==========================================
+
+class DashboardAsyncTests(TransactionTestCase):
+    """ Bajo ASGI el dashboard es la vista async y muestra lo mismo que la síncrona """
+
+    def setUp(self):
+        cache.clear()
+        with mock.patch('miapp.signals.encolar'):  # las imágenes de prueba no existen en disco
+            self.medico = crear_datos_clinica(3)[0]
+        self.paciente = Paciente.objects.first()
+        self.paciente.usuario = User.objects.create_user('paciente_async', password='clave-segura-123')
+        self.paciente.save()
+        self.usuarios = {
+            'medico': self.medico,
+            'secretaria': crear_personal('secretaria', 'secretaria'),
+            'enfermera': crear_personal('enfermera', 'enfermera'),
+            'contador': crear_personal('contador', 'contador'),
+            'paciente': self.paciente.usuario,
+        }
+
+    async def pedir(self, usuario, metodo='get', **datos):
+        cliente = AsyncClient()
+        await cliente.aforce_login(usuario)
+        return await getattr(cliente, metodo)(reverse('dashboard'), datos)
+
+    def test_cada_rol_ve_su_panel_con_el_mismo_contexto(self):
+        for rol, usuario in self.usuarios.items():
+            with self.subTest(rol=rol):
+                response = async_to_sync(self.pedir)(usuario)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.resolver_match.func, dashboard_async)
+                self.client.force_login(usuario)
+                sincrona = self.client.get(reverse('dashboard'))
+                self.assertEqual([t.name for t in response.templates], [t.name for t in sincrona.templates])
+                self.assertEqual(response.context.keys(), sincrona.context.keys())
+
+    def test_post_delega_en_la_vista_sincrona(self):
+        response = async_to_sync(self.pedir)(self.medico, 'post', paciente=self.paciente.id, indicacion="Hidratación")
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertTrue(OrdenMedica.objects.filter(medico=self.medico, indicacion="Hidratación").exists())
+
+    def test_los_hilos_del_pool_renuevan_sus_conexiones(self):
+        from .asincrono import en_hilo
+        with mock.patch('miapp.asincrono.close_old_connections') as renovar:
+            hilo = async_to_sync(en_hilo)(lambda: threading.current_thread().name)
+        self.assertTrue(hilo.startswith('consultas'))
+        self.assertEqual(renovar.call_count, 2)  # antes y después, como una petición
+
+    def test_consultas_concurrentes_devuelve_cada_resultado_con_su_nombre(self):
+        datos = async_to_sync(consultas_concurrentes)(
+            pacientes=Paciente.objects.count,
+            citas=lambda: list(Cita.objects.values_list('id', flat=True)),
+        )
+        self.assertEqual(datos, {'pacientes': 3, 'citas': list(Cita.objects.values_list('id', flat=True))})
+
+
+# ==========================================
+# 16. API REST
+# ==========================================
+
+class ApiTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_datos_clinica(12)[0]
+        cls.enfermera = crear_personal('enfermera', 'enfermera')
+        cls.secretaria = crear_personal('secretaria', 'secretaria')
+        cls.contador = crear_personal('contador', 'contador')
+        cls.paciente = Paciente.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.secretaria)
+
+    def get(self, url, **cabeceras):
+        response = self.client.get(url, **cabeceras)
+        self.assertDentroDelPresupuesto(response)
+        return response
+
+    def test_recorre_todas_las_paginas_por_cursor(self):
+        url, vistos = reverse('api-citas-list') + '?tamano=5', []
+        while url:
+            datos = self.get(url).json()
+            vistos += [cita['id'] for cita in datos['resultados']]
+            url = datos['siguiente']
+        self.assertEqual(vistos, list(Cita.objects.order_by('-fecha', '-id').values_list('id', flat=True)))
+        # Y hacia atrás desde la última página
+        atras = self.get(datos['anterior']).json()['resultados']
+        self.assertEqual([cita['id'] for cita in atras], vistos[-7:-2])
+
+    def test_fields_reduce_la_respuesta_y_el_select(self):
+        response = self.get(reverse('api-citas-list'), QUERY_STRING='fields=id,paciente')
+        self.assertEqual(set(response.json()['resultados'][0]), {'id', 'paciente'})
+        self.assertEqual(set(response.json()['resultados'][0]['paciente']), {'id', 'cedula', 'nombre', 'apellido'})
+        sql = response.wsgi_request.consultas_sql.sql[-1]
+        self.assertIn('JOIN "miapp_paciente"', sql)
+        self.assertNotIn('motivo', sql)
+        self.assertNotIn('fecha_nacimiento', sql)
+
+        self.assertEqual(self.client.get(reverse('api-citas-list'), {'fields': 'id,clave'}).status_code, 400)
+
+    def test_etag_responde_304_sin_cuerpo_y_sigue_a_los_datos(self):
+        url = reverse('api-citas-list')
+        etag = self.get(url)['ETag']
+        # El 304 sale de la huella: ni la página de modelos ni el serializador
+        with mock.patch('miapp.serializers.CitaSerializer.to_representation') as serializar:
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        serializar.assert_not_called()
+        self.assertEqual(response.wsgi_request.consultas_sql.cantidad, PRESUPUESTOS_CONSULTAS['api-citas-list'] - 1)
+        detalle = reverse('api-citas-detail', args=[Cita.objects.first().id])
+        self.assertEqual(self.get(detalle, HTTP_IF_NONE_MATCH=self.get(detalle)['ETag']).status_code, 304)
+        self.assertEqual(self.get(url, QUERY_STRING='fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Cambios que no pasan por las señales (update(), otro worker) ni por modelos versionados
+        # (el nombre del médico, de User): el ETag igual deja de valer
+        for cambio in [lambda: Paciente.objects.filter(pk=self.paciente.pk).update(nombre="Renombrado"),
+                       lambda: User.objects.filter(pk=self.medico.pk).update(last_name="Otro")]:
+            cambio()
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+    def test_permisos_por_rol(self):
+        self.assertEqual(self.client.get(reverse('api-movimientos-list')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api-ordenes-list')).status_code, 403)
+        self.client.force_login(self.contador)
+        self.assertEqual(self.get(reverse('api-movimientos-list')).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api-pacientes-list')).status_code, 403)
+
+    def test_reserva_idempotente_por_la_api(self):
+        hoy = datetime.date.today()
+        lunes = hoy + datetime.timedelta(days=7 - hoy.weekday())
+        HorarioMedico.objects.create(medico=self.medico, dia_semana=0, hora_inicio=datetime.time(8),
+                                     hora_fin=datetime.time(9), duracion_turno=30)
+        datos = {'paciente_id': self.paciente.id, 'medico_id': self.medico.id,
+                 'fecha': lunes.isoformat(), 'hora': '08:30', 'motivo': "Control"}
+        url = reverse('api-citas-list')
+        primera = self.client.post(url, datos, content_type='application/json', HTTP_IDEMPOTENCY_KEY='reserva-1')
+        repetida = self.client.post(url, datos, content_type='application/json', HTTP_IDEMPOTENCY_KEY='reserva-1')
+        self.assertEqual((primera.status_code, repetida.status_code), (201, 200))
+        self.assertEqual(primera.json()['id'], repetida.json()['id'])
+        otra = self.client.post(url, datos, content_type='application/json')
+        self.assertEqual(otra.status_code, 409)
+
+        movida = self.client.patch(reverse('api-citas-detail', args=[primera.json()['id']]), {'hora': '08:00'},
+                                   content_type='application/json')
+        self.assertEqual(movida.status_code, 400)
+
+    def test_enfermera_ejecuta_una_orden(self):
+        orden = OrdenMedica.objects.filter(ejecutada=False).first()
+        self.client.force_login(self.enfermera)
+        response = self.client.patch(reverse('api-ordenes-detail', args=[orden.id]),
+                                     {'ejecutada': True, 'nota_enfermeria': "Sin novedad"}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['enfermera_responsable']['id'], self.enfermera.id)
+        orden.refresh_from_db()
+        self.assertIsNotNone(orden.fecha_ejecucion)
+        self.assertEqual(self.get(reverse('api-ordenes-list') + '?ejecutada=true').json()['resultados'][0]['id'], orden.id)
+
+
+# ==========================================
+# 17. IMPORTACIÓN MASIVA DE PACIENTES
+# ==========================================
+
+IMPORTACIONES_PRUEBAS = tempfile.mkdtemp()
+
+def xlsx_de(filas):
+    """ Un XLSX mínimo (una hoja, textos en línea) como lo leería miapp/importacion.py """
+    def celda(columna, fila, valor):
+        ref = f"{chr(ord('A') + columna)}{fila}"
+        if isinstance(valor, (int, float)):
+            return f'<c r="{ref}"><v>{valor}</v></c>'
+        return f'<c r="{ref}" t="inlineStr"><is><t>{valor}</t></is></c>'
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    hoja = "".join(f'<row r="{i}">{"".join(celda(c, i, v) for c, v in enumerate(fila))}</row>' for i, fila in enumerate(filas, 1))
+    salida = BytesIO()
+    with zipfile.ZipFile(salida, 'w') as libro:
+        libro.writestr('xl/workbook.xml', f'<workbook {ns} {rel}><sheets><sheet name="Hoja1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        libro.writestr('xl/_rels/workbook.xml.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                       '<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="worksheet"/></Relationships>')
+        libro.writestr('xl/worksheets/sheet1.xml', f'<worksheet {ns}><sheetData>{hoja}</sheetData></worksheet>')
+    return salida.getvalue()
+
+
+@override_settings(IMPORTACION_DIR=IMPORTACIONES_PRUEBAS)
+class ImportacionPacientesTests(TestCase):
+
+    CSV = (
+        "Cédula;Nombres;Apellidos;Fecha de nacimiento;Sexo;Teléfono;Email\n"
+        "V-100;Ana;Pérez;05/03/1990;F;0414;ana@correo.com\n"
+        "V-200;Beto;Mora;1985-12-01;M;0412;\n"
+        "V-300;Caro;Ruiz;31/02/1990;F;0416;caro@\n"
+        ";;;;;;\n"
+        "V-100;Ana María;Pérez;05/03/1990;F;0424;ana@correo.com\n"
+    )
+
+    def setUp(self):
+        cache.clear()
+        Paciente.objects.create(cedula="V-200", nombre="Beto", apellido="Viejo", fecha_nacimiento=datetime.date(1985, 12, 1),
+                                sexo='M', telefono='000', alergias="Penicilina")
+
+    def importar(self, contenido, nombre='pacientes.csv', **kwargs):
+        from .importacion import leer_archivo, importar_pacientes
+        reporte = StringIO()
+        columnas, filas = leer_archivo(BytesIO(contenido), nombre)
+        with self.captureOnCommitCallbacks(execute=True):
+            resumen = importar_pacientes(columnas, filas, reporte=reporte, **kwargs)
+        return resumen, reporte.getvalue().splitlines()
+
+    def test_crea_actualiza_por_cedula_y_reporta_las_filas_invalidas(self):
+        from .busqueda import buscar_pacientes
+        from .cache_versiones import obtener_version, nombre_de_modelo
+        version = obtener_version(nombre_de_modelo(Paciente))
+        resumen, reporte = self.importar(self.CSV.encode('utf-8'), lote=2)
+
+        self.assertEqual((resumen['leidas'], resumen['creadas'], resumen['actualizadas'], resumen['rechazadas']), (4, 1, 2, 1))
+        ana = Paciente.objects.get(cedula="V-100")
+        self.assertEqual((ana.nombre, ana.telefono, ana.fecha_nacimiento), ("Ana María", "0424", datetime.date(1990, 3, 5)))
+        self.assertEqual(ana.alergias, "Ninguna")  # columna ausente: valor por defecto del modelo
+        beto = Paciente.objects.get(cedula="V-200")
+        self.assertEqual((beto.apellido, beto.telefono, beto.alergias), ("Mora", "0412", "Penicilina"))
+        self.assertFalse(Paciente.objects.filter(cedula="V-300").exists())
+
+        self.assertEqual(reporte[0].split(',')[:3], ['fila', 'errores', 'cedula'])
+        self.assertEqual(len(reporte), 2)
+        self.assertTrue(reporte[1].startswith('4,'))
+        self.assertIn('fecha_nacimiento', reporte[1])
+        self.assertIn('correo', reporte[1])
+        # bulk_create no dispara señales: el índice de búsqueda y la versión de caché se actualizan igual
+        self.assertEqual(list(buscar_pacientes("ana maria")), [ana.id])
+        self.assertNotEqual(obtener_version(nombre_de_modelo(Paciente)), version)
+
+    def test_xlsx_con_fechas_de_excel(self):
+        contenido = xlsx_de([
+            ["CI", "Nombre", "Apellido", "Fecha de Nacimiento", "Sexo", "Telefono"],
+            ["V-500", "Elena", "Soto", 32874, "F", "0414"],
+            [],
+            ["V-501", "Félix", "Soto", "01/02/2000", "M", 4141234567],
+        ])
+        resumen, reporte = self.importar(contenido, 'migracion.XLSX')
+        self.assertEqual((resumen['creadas'], resumen['rechazadas']), (2, 0), reporte)
+        self.assertEqual(Paciente.objects.get(cedula="V-500").fecha_nacimiento, datetime.date(1990, 1, 1))
+        self.assertEqual(Paciente.objects.get(cedula="V-501").telefono, "4141234567")
+
+    def test_un_anio_suelto_no_es_una_fecha_de_excel(self):
+        # Solo las celdas numéricas del XLSX son días de Excel; '1990' en un CSV o en texto se rechaza
+        csv_ = "Cédula;Nombres;Apellidos;Fecha de nacimiento;Sexo;Teléfono\nV-600;Iris;Paz;1990;F;0414\n"
+        xlsx = xlsx_de([["CI", "Nombre", "Apellido", "Nacimiento", "Sexo", "Telefono"], ["V-601", "Iván", "Paz", "32874", "M", "0414"]])
+        for contenido, nombre in [(csv_.encode('utf-8'), 'viejo.csv'), (xlsx, 'viejo.xlsx')]:
+            with self.subTest(nombre):
+                resumen, reporte = self.importar(contenido, nombre)
+                self.assertEqual((resumen['creadas'], resumen['rechazadas']), (0, 1))
+                self.assertIn('fecha_nacimiento', reporte[1])
+
+    def test_un_formulario_por_fila_con_los_campos_compartidos(self):
+        from .importacion import ImportacionPacienteForm
+        plantilla = ImportacionPacienteForm()
+        mala = plantilla.para_fila({'cedula': 'V-700'})
+        buena = plantilla.para_fila({'cedula': 'V-701', 'nombre': 'Luz', 'apellido': 'Rey', 'fecha_nacimiento': '05/03/1990',
+                                     'sexo': 'F', 'telefono': '0414', 'alergias': 'Ninguna', 'enfermedades_cronicas': 'Ninguna'})
+        self.assertFalse(mala.is_valid())
+        self.assertTrue(buena.is_valid(), buena.errors)
+        self.assertIn('nombre', mala.errors)
+        self.assertIs(buena.fields, plantilla.fields)
+        self.assertIsNot(buena.instance, mala.instance)
+        self.assertEqual(buena.instance.fecha_nacimiento, datetime.date(1990, 3, 5))
+        self.assertFalse(plantilla.is_bound)
+
+    def test_carga_desde_el_admin(self):
+        admin = User.objects.create_superuser('admin', 'admin@clinica.com', 'clave-segura-123')
+        self.client.force_login(admin)
+        url = reverse('admin:miapp_paciente_importar')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        archivo = SimpleUploadedFile('pacientes.csv', self.CSV.encode('latin-1'), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'archivo': archivo, 'codificacion': 'latin-1'}, follow=True)
+        self.assertRedirects(response, reverse('admin:miapp_paciente_changelist'))
+        self.assertEqual(Paciente.objects.get(cedula="V-100").nombre, "Ana María")
+        avisos = [str(m) for m in response.context['messages']]
+        self.assertIn("1 pacientes nuevos y 1 actualizados", avisos[0])  # la cédula repetida cae en el mismo lote
+
+        enlace = re.search(r'href="([^"]+)"', avisos[1]).group(1)
+        descarga = self.client.get(enlace)
+        self.assertEqual(descarga.status_code, 200)
+        self.assertIn(b'V-300', b"".join(descarga.streaming_content))
+        self.assertEqual(self.client.get(reverse('admin:miapp_paciente_importar_errores', args=['..%2Fsettings.py'])).status_code, 404)
+
+
+# ==========================================
+# 18. EXPORTACIÓN DEL LIBRO CONTABLE
+# ==========================================
+
+class ExportacionLibroTests(PresupuestoConsultasMixin, TestCase):
+
+    def setUp(self):
+        self.contador = crear_personal('contador1', 'contador')
+        self.client.force_login(self.contador)
+        hoy = datetime.date(2026, 3, 10)
+        MovimientoContable.objects.create(tipo='ingreso', monto=Decimal('100.00'), descripcion="Consulta, control",
+                                          fecha=hoy, referencia="F-1", responsable=self.contador, tasa_cambio=Decimal('40.00'))
+        MovimientoContable.objects.create(tipo='ingreso', monto=Decimal('25.00'), descripcion="Cirugía <menor>",
+                                          fecha=hoy, es_divisa=True, tasa_cambio=Decimal('40.00'))
+        MovimientoContable.objects.create(tipo='egreso', monto=Decimal('7.50'), descripcion="Gasas",
+                                          fecha=hoy - datetime.timedelta(days=40))
+
+    def descargar(self, **filtros):
+        response = self.client.get(reverse('exportar_libro'), filtros)
+        self.assertDentroDelPresupuesto(response)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_con_conversion_y_filtros(self):
+        response, contenido = self.descargar()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="libro_contable_completo.csv"')
+        self.assertTrue(contenido.startswith('﻿'.encode('utf-8')))
+        filas = list(csv.reader(StringIO(contenido.decode('utf-8-sig'))))
+        self.assertEqual(filas[0][:3], ['Fecha', 'Tipo', 'Concepto'])
+        self.assertEqual(len(filas), 4)
+        # Del más antiguo al más reciente; sin tasa no hay conversión
+        self.assertEqual(filas[1][2], "Gasas")
+        self.assertEqual(filas[1][6:9], ['', '7.50', ''])
+        self.assertEqual(filas[2][2:9], ["Consulta, control", "F-1", 'Bs', '100.00', '40.0000', '100.00', '2.50'])
+        self.assertEqual(filas[2][9], 'contador1')
+        self.assertEqual(filas[3][4:9], ['USD', '25.00', '40.0000', '1000.00', '25.00'])
+
+        response, contenido = self.descargar(desde='2026-03-01', hasta='2026-03-31', moneda='usd')
+        self.assertIn('libro_contable_20260301_20260331.csv', response['Content-Disposition'])
+        self.assertEqual(len(contenido.decode('utf-8-sig').splitlines()), 2)
+
+    def test_xlsx_legible(self):
+        from .importacion import _filas_xlsx
+        response, contenido = self.descargar(tipo='ingreso', formato='xlsx')
+        self.assertTrue(response['Content-Type'].startswith('application/vnd.openxmlformats'))
+        filas = [fila for _, fila in _filas_xlsx(BytesIO(contenido))]
+        self.assertEqual(filas[0][0], 'Fecha')
+        self.assertEqual(len(filas), 3)
+        # Fecha y montos como números de Excel
+        self.assertEqual(filas[1][0], str((datetime.date(2026, 3, 10) - datetime.date(1899, 12, 30)).days))
+        self.assertEqual(filas[1][2], "Consulta, control")
+        self.assertEqual(filas[2][2], "Cirugía <menor>")
+        self.assertEqual(filas[2][7], '1000.00')
+
+    def test_filtro_invalido_y_permisos(self):
+        response = self.client.get(reverse('exportar_libro'), {'desde': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(crear_personal('medico_x', 'medico'))
+        self.assertRedirects(self.client.get(reverse('exportar_libro')), reverse('dashboard'), fetch_redirect_response=False)
+
+
+# ==========================================
+# 19. DOCUMENTOS: SUBIDAS POR PARTES Y ALMACÉN POR CONTENIDO
+# ==========================================
+
+class DocumentosTests(PresupuestoConsultasMixin, TestCase):
+
+    CONTENIDO = b"%PDF-1.4 resultado de laboratorio " * 3
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=f"{directorio}/media", SUBIDAS_DIR=f"{directorio}/subidas")
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.secretaria = crear_personal('secretaria1', 'secretaria')
+        self.paciente = Paciente.objects.create(cedula="V-700", nombre="Luis", apellido="Díaz",
+                                                fecha_nacimiento=datetime.date(1980, 1, 1), sexo='M', telefono='0414')
+        self.client.force_login(self.secretaria)
+
+    def iniciar(self, paciente=None, **extra):
+        datos = {'descripcion': "Hematología", 'nombre_original': "hemato.PDF", 'tamano': len(self.CONTENIDO), **extra}
+        return self.client.post(reverse('iniciar_subida', args=[(paciente or self.paciente).id]), datos)
+
+    def fragmento(self, url, inicio, fin, cuerpo=None):
+        cuerpo = self.CONTENIDO[inicio:fin + 1] if cuerpo is None else cuerpo
+        return self.client.put(url, cuerpo, content_type='application/octet-stream',
+                               headers={'Content-Range': f"bytes {inicio}-{fin}/{len(self.CONTENIDO)}"})
+
+    def test_se_reanuda_desde_el_ultimo_byte_recibido(self):
+        from .documentos import ruta_parcial
+        response = self.iniciar()
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+        self.assertEqual(self.fragmento(url, 0, 39).json()['recibidos'], 40)
+
+        # Se corta la conexión a mitad del fragmento: lo que llegó queda contado
+        response = self.fragmento(url, 40, 79, cuerpo=self.CONTENIDO[40:55])
+        self.assertEqual((response.status_code, response.json()['recibidos']), (400, 55))
+        response = self.client.get(url)
+        self.assertDentroDelPresupuesto(response)
+        self.assertEqual(response.json(), {'recibidos': 55, 'tamano': len(self.CONTENIDO)})
+        # Reenviar desde un byte que no toca: 409 con el punto correcto
+        self.assertEqual(self.fragmento(url, 40, 79).status_code, 409)
+
+        subida = SubidaDocumento.objects.get()
+        response = self.fragmento(url, 55, len(self.CONTENIDO) - 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.json()['duplicado'])
+        documento = Documento.objects.get(id=response.json()['documento'])
+        self.assertEqual((documento.paciente, documento.nombre_original), (self.paciente, "hemato.PDF"))
+        huella = hashlib.sha256(self.CONTENIDO).hexdigest()
+        self.assertEqual(documento.contenido.huella, huella)
+        self.assertEqual(documento.archivo.name, f"documentos/{huella[:2]}/{huella[2:4]}/{huella}.pdf")
+        with documento.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.CONTENIDO)
+        self.assertFalse(SubidaDocumento.objects.exists())
+        self.assertFalse(os.path.exists(ruta_parcial(subida)))
+
+    def test_el_mismo_contenido_se_guarda_una_sola_vez(self):
+        otro = Paciente.objects.create(cedula="V-701", nombre="Ana", apellido="Díaz",
+                                       fecha_nacimiento=datetime.date(1982, 1, 1), sexo='F', telefono='0414')
+        url = self.iniciar(otro, sha256=hashlib.sha256(self.CONTENIDO).hexdigest().upper()).json()['url']
+        self.assertFalse(self.fragmento(url, 0, len(self.CONTENIDO) - 1).json()['duplicado'])
+
+        # Sin JavaScript: el formulario completo en una petición, al mismo almacén
+        response = self.client.get(reverse('subir_documento', args=[self.paciente.id]))
+        self.assertDentroDelPresupuesto(response)
+        response = self.client.post(reverse('subir_documento', args=[self.paciente.id]), {
+            'descripcion': "Copia", 'archivo': SimpleUploadedFile("copia.pdf", self.CONTENIDO),
+        })
+        self.assertRedirects(response, reverse('detalle_paciente', args=[self.paciente.id]), fetch_redirect_response=False)
+
+        self.assertEqual(ContenidoArchivo.objects.count(), 1)
+        documentos = Documento.objects.order_by('id')
+        self.assertEqual(len(documentos), 2)
+        self.assertEqual(documentos[0].archivo.name, documentos[1].archivo.name)
+        self.assertEqual(documentos[1].nombre_original, "copia.pdf")
+        self.assertEqual(len(os.listdir(os.path.dirname(documentos[0].archivo.path))), 1)
+        response = self.client.get(reverse('detalle_paciente', args=[self.paciente.id]))
+        self.assertDentroDelPresupuesto(response)
+        self.assertContains(response, documentos[1].archivo.url)
+
+    def test_huella_distinta_permisos_y_rangos(self):
+        url = self.iniciar(sha256='0' * 64).json()['url']
+        response = self.fragmento(url, 0, len(self.CONTENIDO) - 1)
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(SubidaDocumento.objects.exists())
+        self.assertFalse(ContenidoArchivo.objects.exists())
+
+        url = self.iniciar().json()['url']
+        self.assertEqual(self.fragmento(url, 0, len(self.CONTENIDO)).status_code, 416)
+        self.assertEqual(self.client.put(url, b'x', content_type='application/octet-stream').status_code, 400)
+        self.assertEqual(self.iniciar(tamano=0).status_code, 400)
+
+        self.client.force_login(crear_personal('medico7', 'medico'))
+        self.assertEqual(self.client.get(url).status_code, 404)  # solo quien la abrió
+        self.client.force_login(crear_personal('contador7', 'contador'))
+        self.assertEqual(self.iniciar().status_code, 403)
+
+    def test_mantenimiento(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        originales = [default_storage.save(f"resultados/{nombre}", ContentFile(self.CONTENIDO)) for nombre in ("a.pdf", "b.pdf")]
+        for original in originales:
+            Documento.objects.create(paciente=self.paciente, archivo=original, descripcion="Anterior")
+
+        salida = StringIO()
+        call_command('deduplicar_documentos', '--borrar-originales', stdout=salida)
+        self.assertIn("2 documentos en el almacén (1 eran copias", salida.getvalue())
+        self.assertEqual(ContenidoArchivo.objects.count(), 1)
+        self.assertEqual(Documento.objects.filter(contenido__isnull=False).count(), 2)
+        self.assertFalse(any(default_storage.exists(original) for original in originales))
+
+        url = self.iniciar().json()['url']
+        self.fragmento(url, 0, 9)
+        SubidaDocumento.objects.update(fecha_modificacion=timezone.now() - datetime.timedelta(days=2))
+        Documento.objects.all().delete()
+        contenido = ContenidoArchivo.objects.get()
+        call_command('limpiar_subidas', stdout=StringIO())
+        self.assertFalse(SubidaDocumento.objects.exists())
+        self.assertEqual(os.listdir(settings.SUBIDAS_DIR), [])
+        self.assertFalse(ContenidoArchivo.objects.exists())
+        self.assertFalse(default_storage.exists(contenido.archivo.name))
+
+
+# ==========================================
+# 20. ENVÍO DE ARCHIVOS (RANGOS, CACHÉ, X-SENDFILE)
+# ==========================================
+
+class MediosTests(PresupuestoConsultasMixin, TestCase):
+
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .documentos import asignar_contenido
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.variante = default_storage.save("carrusel/variantes/1/abcdef-480.webp", ContentFile(b"0123456789"))
+        self.original = default_storage.save("carrusel/fachada.jpg", ContentFile(b"jpg"))
+
+        self.paciente = Paciente.objects.create(cedula="V-800", nombre="Rosa", apellido="Gil", sexo='F', telefono='0414',
+                                                fecha_nacimiento=datetime.date(1970, 1, 1),
+                                                usuario=User.objects.create_user('rosa', password='clave-segura-123'))
+        self.documento = Documento(paciente=self.paciente, descripcion="Rayos X")
+        asignar_contenido(self.documento, ContentFile(b"%PDF placa de torax", name="placa.pdf"))
+        self.documento.save()
+        self.url_documento = self.documento.archivo.url
+
+    def test_carrusel_publico_con_rangos_y_condicionales(self):
+        url = default_storage.url(self.variante)
+        response = self.client.get(url)
+        self.assertDentroDelPresupuesto(response)
+        self.assertEqual(b''.join(response.streaming_content), b"0123456789")
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+
+        parcial = self.client.get(url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual((parcial.status_code, parcial['Content-Range'], parcial['Content-Length']), (206, 'bytes 2-5/10', '4'))
+        self.assertEqual(b''.join(parcial.streaming_content), b"2345")
+        self.assertEqual(b''.join(self.client.get(url, headers={'Range': 'bytes=-3'}).streaming_content), b"789")
+        self.assertEqual(b''.join(self.client.get(url, headers={'Range': 'bytes=7-'}).streaming_content), b"789")
+        insatisfacible = self.client.get(url, headers={'Range': 'bytes=10-'})
+        self.assertEqual((insatisfacible.status_code, insatisfacible['Content-Range']), (416, 'bytes */10'))
+        # If-Range de otra versión del archivo: se manda entero
+        self.assertEqual(self.client.get(url, headers={'Range': 'bytes=2-5', 'If-Range': '"otro"'}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'Range': 'bytes=2-5', 'If-Range': response['ETag']}).status_code, 206)
+
+        self.assertEqual(self.client.get(default_storage.url(self.original))['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.client.get('/media/../config/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/subidas/x.part').status_code, 404)
+
+    def test_documentos_solo_para_personal_y_su_paciente(self):
+        response = self.client.get(self.url_documento)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(crear_personal('contador8', 'contador'))
+        self.assertEqual(self.client.get(self.url_documento).status_code, 404)
+
+        self.client.force_login(crear_personal('enfermera8', 'enfermera'))
+        response = self.client.get(self.url_documento)
+        self.assertDentroDelPresupuesto(response)
+        self.assertEqual(b''.join(response.streaming_content), b"%PDF placa de torax")
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="placa.pdf"')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+        self.client.force_login(self.paciente.usuario)
+        self.assertEqual(self.client.get(self.url_documento).status_code, 200)
+        otro = Paciente.objects.create(cedula="V-801", nombre="Eva", apellido="Gil", sexo='F', telefono='0414',
+                                       fecha_nacimiento=datetime.date(1975, 1, 1),
+                                       usuario=User.objects.create_user('eva', password='clave-segura-123'))
+        self.client.force_login(otro.usuario)
+        self.assertEqual(self.client.get(self.url_documento).status_code, 404)
+        # El mismo contenido cargado también para ella: ya es suyo
+        Documento.objects.create(paciente=otro, descripcion="Copia", archivo=self.documento.archivo.name,
+                                 contenido=self.documento.contenido)
+        self.assertEqual(self.client.get(self.url_documento).status_code, 200)
+
+    def test_transferencia_delegada_al_servidor_web(self):
+        self.client.force_login(crear_personal('medico8', 'medico'))
+        with self.settings(MEDIOS_ENVIO='x-sendfile'):
+            response = self.client.get(self.url_documento)
+        self.assertEqual(response['X-Sendfile'], self.documento.archivo.path)
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+
+        with self.settings(MEDIOS_ENVIO='x-accel-redirect', MEDIOS_UBICACIONES_INTERNAS={self.media: '/_media/'}):
+            response = self.client.get(self.url_documento)
+            self.assertEqual(response['X-Accel-Redirect'], f"/_media/{self.documento.archivo.name}")
+            self.assertEqual(response['Content-Disposition'], 'inline; filename="placa.pdf"')
+            # Fuera de las ubicaciones internas sale desde Python
+            with self.settings(MEDIOS_UBICACIONES_INTERNAS={}):
+                self.assertNotIn('X-Accel-Redirect', self.client.get(self.url_documento))
+
+
+# ==========================================
+# 21. VISTAS PREVIAS DE DOCUMENTOS
+# ==========================================
+
+def pdf_de_prueba(paginas=1, texto=None, imagen=None):
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    buffer = BytesIO()
+    lienzo = canvas.Canvas(buffer)
+    for _ in range(paginas):
+        if texto:
+            for numero, linea in enumerate(texto.splitlines()):
+                lienzo.drawString(72, 770 - numero * 16, linea)
+        if imagen:
+            lienzo.drawImage(ImageReader(imagen), 0, 0, width=595, height=842)
+        lienzo.showPage()
+    lienzo.save()
+    return buffer.getvalue()
+
+
+@override_settings(TAREAS_SINCRONAS=True)
+class VistasPreviasTests(PresupuestoConsultasMixin, TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.paciente = Paciente.objects.create(cedula="V-900", nombre="Iris", apellido="Paz", sexo='F', telefono='0414',
+                                                fecha_nacimiento=datetime.date(1965, 1, 1))
+
+    def subir(self, contenido, nombre):
+        from django.core.files.base import ContentFile
+        from .documentos import asignar_contenido
+        documento = Documento(paciente=self.paciente, descripcion=nombre)
+        with self.captureOnCommitCallbacks(execute=True):
+            asignar_contenido(documento, ContentFile(contenido, name=nombre))
+            documento.save()
+        documento.contenido.refresh_from_db()
+        return documento.contenido
+
+    def vista(self, contenido):
+        from PIL import Image
+        with contenido.vista_previa.open('rb') as archivo:
+            imagen = Image.open(BytesIO(archivo.read()))
+        self.assertEqual(imagen.format, 'WEBP')
+        return imagen.convert('RGB')
+
+    def test_pdf_de_texto_y_pdf_escaneado(self):
+        contenido = self.subir(pdf_de_prueba(3, texto="HEMATOLOGIA COMPLETA\nHemoglobina 13.5 g/dL\nLeucocitos 7.200"), "hemato.pdf")
+        self.assertEqual(contenido.paginas, 3)
+        self.assertTrue(contenido.vista_previa.name.endswith(f"{contenido.huella}.vista.webp"))
+        self.assertLess(contenido.vista_previa.size, 20 * 1024)
+        imagen = self.vista(contenido)
+        self.assertLessEqual(imagen.size, (240, 320))
+        self.assertLess(min(imagen.getextrema()[0]), 150)  # hay texto dibujado
+
+        from PIL import Image
+        escaneo = self.subir(pdf_de_prueba(imagen=Image.new('RGB', (600, 850), (200, 30, 30))), "rx.pdf")
+        self.assertEqual(escaneo.paginas, 1)
+        rojo, verde, _ = self.vista(escaneo).getpixel((60, 80))
+        self.assertGreater(rojo, 150)
+        self.assertLess(verde, 80)
+
+    def test_fotos_formatos_desconocidos_y_duplicados(self):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 2000), 'blue').save(buffer, 'JPEG')
+        foto = self.subir(buffer.getvalue(), "lesion.jpg")
+        self.assertEqual(self.vista(foto).size, (240, 160))
+        self.assertIsNone(foto.paginas)
+
+        dicom = self.subir(b"\0" * 128 + b"DICM" + b"\0" * 64, "tac.dcm")
+        self.assertFalse(dicom.vista_previa)
+
+        with mock.patch('miapp.signals.generar_vista_previa') as generar:
+            self.subir(buffer.getvalue(), "copia.jpg")
+        generar.assert_not_called()
+
+    def test_se_muestra_y_se_sirve_como_el_documento(self):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'green').save(buffer, 'PNG')
+        contenido = self.subir(buffer.getvalue(), "herida.png")
+        self.client.force_login(crear_personal('medico9', 'medico'))
+        response = self.client.get(reverse('detalle_paciente', args=[self.paciente.id]))
+        self.assertDentroDelPresupuesto(response)
+        self.assertContains(response, contenido.vista_previa.url)
+
+        response = self.client.get(contenido.vista_previa.url)
+        self.assertDentroDelPresupuesto(response)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.client.force_login(crear_personal('contador9', 'contador'))
+        self.assertEqual(self.client.get(contenido.vista_previa.url).status_code, 404)
+
+
+# ==========================================
+# 22. RECORDATORIOS DE CITAS
+# ==========================================
+
+class FalloSmsBackend:
+    """ Pasarela caída: rechaza todo """
+
+    def enviar(self, mensajes):
+        return {mensaje.clave: "503 Service Unavailable" for mensaje in mensajes}
+
+class RecordatoriosTests(TestCase):
+    AHORA = datetime.datetime(2026, 3, 10, 17, 0, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        self.archivo = os.path.join(carpeta, 'recordatorios.jsonl')
+        ajustes = self.settings(
+            RECORDATORIOS_ARCHIVO=self.archivo, RECORDATORIOS_HORA_DIA_ANTERIOR=16, RECORDATORIOS_HORAS_ANTES=3,
+            RECORDATORIOS_INTENTOS=3, RECORDATORIOS_POR_SEGUNDO=0,
+            RECORDATORIOS_BACKENDS={'sms': 'miapp.recordatorios.ArchivoBackend', 'correo': 'miapp.recordatorios.ArchivoBackend'},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.reloj(self.AHORA)
+        self.medico = crear_personal('medico_rec', 'medico')
+        self.medico.last_name = 'Salas'
+        self.medico.save()
+        self.paciente = Paciente.objects.create(cedula="V-700", nombre="Rosa", apellido="Díaz", sexo='F',
+                                                telefono='0414-123.45.67', correo='rosa@example.com',
+                                                fecha_nacimiento=datetime.date(1970, 1, 1))
+
+    def reloj(self, momento):
+        parche = mock.patch('django.utils.timezone.now', return_value=momento)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def cita(self, dias, hora, paciente=None, **campos):
+        return Cita.objects.create(paciente=paciente or self.paciente, medico=self.medico, motivo="Control",
+                                   fecha=self.AHORA.date() + datetime.timedelta(days=dias), hora=hora, **campos)
+
+    def enviados(self):
+        if not os.path.exists(self.archivo):
+            return []
+        with open(self.archivo, encoding='utf-8') as archivo:
+            return [json.loads(linea) for linea in archivo]
+
+    def test_ventanas_por_rango_y_nunca_dos_veces(self):
+        from .recordatorios import despachar, programar
+        manana = self.cita(1, datetime.time(9, 0))
+        hoy = self.cita(0, datetime.time(18, 30))
+        self.cita(0, datetime.time(16, 0))                       # ya pasó
+        self.cita(0, datetime.time(21, 30))                      # falta más de 3 horas
+        self.cita(1, datetime.time(10, 0), estado='cancelada')
+        self.cita(2, datetime.time(9, 0))                        # pasado mañana
+        self.assertEqual(programar(self.AHORA), {'dia_anterior': 1, 'mismo_dia': 1})
+
+        with self.assertNumQueries(6):  # tomar (3) + un UPDATE de enviados por canal + cola vacía
+            resumen = despachar()
+        self.assertEqual(resumen['enviados'], 4)
+        mensajes = self.enviados()
+        self.assertEqual({(m['canal'], m['destino']) for m in mensajes},
+                         {('sms', '+584141234567'), ('correo', 'rosa@example.com')})
+        textos = {m['clave']: m['texto'] for m in mensajes}
+        sms_manana = Recordatorio.objects.get(cita=manana, canal='sms')
+        self.assertIn("de mañana 11/03 a las 09:00 AM con Dr(a). Salas", textos[f"recordatorio-{sms_manana.id}"])
+        self.assertIn("de hoy a las 06:30 PM", textos[f"recordatorio-{Recordatorio.objects.get(cita=hoy, canal='sms').id}"])
+
+        # Otra corrida (cron) y otra más tarde: nada se encola ni se envía de nuevo
+        self.assertEqual(programar(self.AHORA), {'dia_anterior': 1, 'mismo_dia': 1})
+        self.assertEqual(despachar()['enviados'], 0)
+        self.reloj(self.AHORA + datetime.timedelta(hours=1))
+        programar()
+        despachar()
+        self.assertEqual(len(self.enviados()), 4)
+        self.assertEqual(Recordatorio.objects.filter(estado='enviado').count(), 4)
+
+        # Antes de RECORDATORIOS_HORA_DIA_ANTERIOR no se avisa lo de mañana
+        self.assertEqual(list(programar(self.AHORA.replace(hour=10))), ['mismo_dia'])
+
+    def test_reintentos_con_espera_y_fallido(self):
+        from .recordatorios import despachar, programar
+        self.cita(1, datetime.time(9, 0))
+        with self.settings(RECORDATORIOS_BACKENDS={'sms': 'miapp.tests.FalloSmsBackend'}):
+            programar(self.AHORA)
+            self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 1, 'fallidos': 0, 'descartados': 0})
+            recordatorio = Recordatorio.objects.get()
+            self.assertEqual((recordatorio.estado, recordatorio.intentos), ('pendiente', 1))
+            self.assertEqual(recordatorio.proximo_intento, self.AHORA + datetime.timedelta(minutes=2))
+            self.assertEqual(recordatorio.ultimo_error, "503 Service Unavailable")
+            self.assertEqual(despachar()['reintentos'], 0)  # todavía no le toca
+
+            for minutos in (2, 6):
+                self.reloj(self.AHORA + datetime.timedelta(minutes=minutos))
+                despachar()
+            recordatorio.refresh_from_db()
+            self.assertEqual((recordatorio.estado, recordatorio.intentos), ('fallido', 3))
+
+    def test_descarta_canceladas_y_retoma_envios_interrumpidos(self):
+        from .recordatorios import PLAZO_ENVIO, despachar, programar
+        cancelada = self.cita(1, datetime.time(9, 0))
+        interrumpida = self.cita(1, datetime.time(10, 0), paciente=Paciente.objects.create(
+            cedula="V-701", nombre="Luis", apellido="Gil", sexo='M', telefono='', fecha_nacimiento=datetime.date(1980, 1, 1)))
+        self.assertEqual(programar(self.AHORA)['dia_anterior'], 2)
+        self.assertEqual(Recordatorio.objects.filter(cita=interrumpida).count(), 0)  # sin teléfono ni correo
+
+        Cita.objects.filter(pk=cancelada.pk).update(estado='cancelada')
+        Recordatorio.objects.filter(canal='sms').update(estado='enviando', intentos=1,
+                                                        proximo_intento=self.AHORA + PLAZO_ENVIO)
+        self.assertEqual(despachar()['descartados'], 1)  # el correo; el SMS sigue tomado por otro
+        self.reloj(self.AHORA + PLAZO_ENVIO)
+        self.assertEqual(despachar()['descartados'], 1)  # al vencer el plazo vuelve y se descarta
+        self.assertEqual(self.enviados(), [])
+
+    def test_limitador_de_ritmo(self):
+        from .recordatorios import _Limitador
+        esperas = []
+        with mock.patch('miapp.recordatorios.time.monotonic', return_value=100.0):
+            limitador = _Limitador(10, dormir=esperas.append)
+            limitador.esperar(5)
+            limitador.esperar(5)
+            limitador.esperar(1)
+        self.assertEqual(esperas, [0.5, 1.0])
+        _Limitador(0, dormir=esperas.append).esperar(1000)
+        self.assertEqual(len(esperas), 2)
+
+    def test_comando(self):
+        self.cita(0, datetime.time(19, 0))
+        salida = StringIO()
+        call_command('enviar_recordatorios', stdout=salida)
+        self.assertIn("2 enviados", salida.getvalue())
+        self.assertEqual(len(self.enviados()), 2)
+
+
+# ==========================================
+# 23. LÍNEA DE TIEMPO DEL PACIENTE
+# ==========================================
+
+class HistoriaPacienteTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = crear_personal('medico_hist', 'medico', Especialidad.objects.create(nombre='Endocrinología'))
+        cls.paciente = Paciente.objects.create(cedula="V-800", nombre="Ana", apellido="Rey", sexo='F', telefono='0414',
+                                               fecha_nacimiento=datetime.date(1950, 1, 1))
+        otro = Paciente.objects.create(cedula="V-801", nombre="Otro", apellido="Rey", sexo='M', telefono='0414',
+                                       fecha_nacimiento=datetime.date(1950, 1, 1))
+        inicio = datetime.datetime(2020, 1, 6, 9, 0, tzinfo=datetime.timezone.utc)
+        for i in range(30):
+            momento = inicio + datetime.timedelta(days=14 * i)
+            Cita.objects.create(paciente=cls.paciente, medico=cls.medico, fecha=momento.date(), hora=momento.time(),
+                                motivo=f"Control {i}", realizada=i < 29)
+            if i % 2 == 0:
+                # Orden y documento en el mismo instante que la cita: el desempate no pierde ni repite eventos
+                orden = OrdenMedica.objects.create(paciente=cls.paciente, medico=cls.medico, indicacion=f"Metformina {i}")
+                OrdenMedica.objects.filter(pk=orden.pk).update(fecha_creacion=momento)
+            if i % 3 == 0:
+                documento = Documento.objects.create(paciente=cls.paciente, descripcion=f"HbA1c {i}", archivo='resultados/x.pdf')
+                Documento.objects.filter(pk=documento.pk).update(fecha_subida=momento)
+        Cita.objects.create(paciente=otro, medico=cls.medico, fecha=datetime.date(2030, 1, 1), hora=datetime.time(9), motivo="Ajena")
+
+    def test_paginas_sin_huecos_ni_repetidos(self):
+        from .historia import pagina_historia
+        recorridos, cursor = [], None
+        while True:
+            with self.assertNumQueries(3):
+                pagina = pagina_historia(self.paciente.id, cursor, tamano=7)
+            recorridos += [(evento.tipo, evento.id) for evento in pagina['eventos']]
+            cursor = pagina['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(len(recorridos), 30 + 15 + 10)
+        self.assertEqual(len(set(recorridos)), len(recorridos))
+        self.assertEqual(recorridos[:3], [('cita', Cita.objects.filter(paciente=self.paciente).latest('fecha').id),
+                                          ('cita', Cita.objects.filter(motivo="Control 28").get().id),
+                                          ('orden', OrdenMedica.objects.get(indicacion="Metformina 28").id)])
+        self.assertEqual(recorridos[-3:][0][0], 'cita')
+        self.assertEqual(recorridos[-1][0], 'documento')  # a igual momento: cita, orden, documento
+
+        # Un cursor alterado no rompe la ficha: empieza desde el principio
+        self.assertEqual(pagina_historia(self.paciente.id, "basura_x_1", tamano=7)['eventos'][0].tipo, 'cita')
+
+    def test_ficha_y_carga_incremental(self):
+        self.client.force_login(self.medico)
+        response = self.client.get(reverse('detalle_paciente', args=[self.paciente.id]))
+        self.assertDentroDelPresupuesto(response)
+        self.assertContains(response, "Endocrinología")
+        self.assertContains(response, "Metformina 28")
+        self.assertContains(response, "HbA1c 27")
+        self.assertNotContains(response, "Control 0<")
+        self.assertNotContains(response, "Ajena")
+        cursor = primer_cursor = response.context['historia']['siguiente']
+        self.assertContains(response, "Ver más antiguos")
+
+        vistos = len(response.context['historia']['eventos'])
+        while cursor:
+            response = self.client.get(reverse('historia_paciente', args=[self.paciente.id]), {'despues': cursor})
+            self.assertDentroDelPresupuesto(response)
+            datos = response.json()
+            vistos += datos['html'].count('list-group-item py-3') + datos['html'].count('list-group-item-action')
+            cursor = datos['siguiente']
+        self.assertEqual(vistos, 55)
+        self.assertIn("Control 0<", datos['html'])
+        self.assertEqual(self.client.get(reverse('historia_paciente', args=[999999])).status_code, 404)
+
+        # Sin JS: el enlace abre la ficha desde el cursor
+        response = self.client.get(reverse('detalle_paciente', args=[self.paciente.id]), {'despues': primer_cursor})
+        self.assertDentroDelPresupuesto(response)
+        self.assertEqual(len(response.context['historia']['eventos']), 20)
+        self.assertNotContains(response, "Metformina 28")
+
+
+# ==========================================
+# 24. TASAS BCV Y TOTALES EN DOS MONEDAS
+# ==========================================
+
+@override_settings(TAREAS_SINCRONAS=True)
+class TasasCambioTests(TestCase):
+    VIERNES, SABADO, LUNES = datetime.date(2026, 3, 6), datetime.date(2026, 3, 7), datetime.date(2026, 3, 9)
+
+    def setUp(self):
+        from .contabilidad import olvidar_tasas
+        cache.clear()
+        olvidar_tasas()
+        self.addCleanup(olvidar_tasas)
+
+    def tasa(self, fecha, valor):
+        with self.captureOnCommitCallbacks(execute=True):
+            return TasaCambio.objects.create(fecha=fecha, tasa=Decimal(valor))
+
+    def movimiento(self, tipo, monto, fecha, es_divisa=False, **campos):
+        with self.captureOnCommitCallbacks(execute=True):
+            return MovimientoContable.objects.create(tipo=tipo, monto=Decimal(monto), fecha=fecha, es_divisa=es_divisa,
+                                                     descripcion=f"{tipo} {monto}", **campos)
+
+    def test_cada_movimiento_toma_su_tasa_y_los_totales_no_mezclan_monedas(self):
+        from .contabilidad import reconstruir_resumen, totales_contables
+        self.tasa(self.VIERNES, '40.00')
+        self.tasa(self.LUNES, '42.50')
+        self.assertEqual(self.movimiento('ingreso', '100', self.SABADO, es_divisa=True).tasa_cambio, Decimal('40'))  # rige la del viernes
+        self.assertEqual(self.movimiento('ingreso', '4250', self.LUNES).tasa_cambio, Decimal('42.5'))
+        self.movimiento('egreso', '50', self.LUNES, es_divisa=True, tasa_cambio=Decimal('45'))  # tasa pactada a mano
+        self.movimiento('nomina', '850', self.LUNES)
+
+        with self.assertNumQueries(1):
+            totales = totales_contables()
+        self.assertEqual((totales['ingresos'], totales['egresos'], totales['balance']),
+                         (Decimal('200.00'), Decimal('70.00'), Decimal('130.00')))
+        self.assertEqual((totales['ingresos_ves'], totales['egresos_ves'], totales['balance_ves']),
+                         (Decimal('8250.00'), Decimal('3100.00'), Decimal('5150.00')))
+        self.assertEqual(totales['sin_tasa'], 0)
+        self.assertEqual([(f['tipo'], f['usd'], f['ves']) for f in totales['por_tipo']], [
+            ('ingreso', Decimal('200.00'), Decimal('8250.00')),
+            ('egreso', Decimal('50.00'), Decimal('2250.00')),
+            ('nomina', Decimal('20.00'), Decimal('850.00')),
+        ])
+        reconstruir_resumen()
+        self.assertEqual(totales_contables(), totales)
+
+    def test_tasa_por_fecha_cacheada_en_el_proceso(self):
+        from .contabilidad import tasa_del_dia
+        self.tasa(self.VIERNES, '40.00')
+        self.assertEqual(tasa_del_dia(self.LUNES), Decimal('40'))
+        with self.assertNumQueries(0):
+            self.assertEqual(tasa_del_dia(self.LUNES), Decimal('40'))
+        # Una fecha sin tasa no se cachea: la tasa puede cargarse en otro proceso
+        jueves = self.VIERNES - datetime.timedelta(days=1)
+        self.assertIsNone(tasa_del_dia(jueves))
+        with self.assertNumQueries(1):
+            self.assertIsNone(tasa_del_dia(jueves))
+        self.tasa(self.LUNES, '42.00')
+        self.assertEqual(tasa_del_dia(self.LUNES), Decimal('42'))
+
+        # Pasado el plazo se vuelve a leer aunque la versión no haya cambiado (caché de otro proceso)
+        from .contabilidad import TASAS_VIGENCIA
+        ahora = time.monotonic()
+        with mock.patch('miapp.contabilidad.time.monotonic', return_value=ahora + TASAS_VIGENCIA + 1):
+            with self.assertNumQueries(1):
+                self.assertEqual(tasa_del_dia(self.LUNES), Decimal('42'))
+
+    def test_corregir_o_borrar_una_tasa_recalcula_solo_las_automaticas(self):
+        from .contabilidad import totales_contables
+        viernes = self.tasa(self.VIERNES, '40.00')
+        automatico = self.movimiento('ingreso', '100', self.SABADO, es_divisa=True)
+        manual = self.movimiento('ingreso', '100', self.SABADO, es_divisa=True, tasa_cambio=Decimal('41'))
+        self.assertEqual((automatico.tasa_manual, manual.tasa_manual), (False, True))
+
+        viernes.tasa = Decimal('39.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            viernes.save()
+        automatico.refresh_from_db()
+        manual.refresh_from_db()
+        self.assertEqual((automatico.tasa_cambio, manual.tasa_cambio), (Decimal('39.5'), Decimal('41')))
+        self.assertEqual(totales_contables()['ingresos_ves'], Decimal('8050.00'))
+
+        # Editar el movimiento sin tocar la tasa no la vuelve manual; vaciarla la devuelve a la del día
+        automatico.descripcion = "Consulta"
+        automatico.save()
+        self.assertFalse(automatico.tasa_manual)
+        manual.tasa_cambio = 0
+        manual.save()
+        self.assertEqual((manual.tasa_cambio, manual.tasa_manual), (Decimal('39.5'), False))
+
+        # Borrada, rige la anterior (o ninguna)
+        with self.captureOnCommitCallbacks(execute=True):
+            viernes.delete()
+        automatico.refresh_from_db()
+        self.assertEqual(automatico.tasa_cambio, 0)
+        self.assertEqual(totales_contables()['sin_tasa'], 2)
+
+    def test_tasa_cargada_despues_corrige_el_resumen(self):
+        from .contabilidad import totales_contables
+        self.tasa(self.VIERNES, '40.00')
+        sin_tasa = self.movimiento('ingreso', '800', self.VIERNES - datetime.timedelta(days=3))
+        self.movimiento('ingreso', '400', self.VIERNES)
+        antes = totales_contables()
+        self.assertEqual((antes['ingresos'], antes['ingresos_ves'], antes['sin_tasa']), (Decimal('10.00'), Decimal('1200.00'), 1))
+
+        self.tasa(self.VIERNES - datetime.timedelta(days=4), '39.00')
+        sin_tasa.refresh_from_db()
+        self.assertEqual(sin_tasa.tasa_cambio, Decimal('39'))
+        despues = totales_contables()
+        self.assertEqual((despues['ingresos'], despues['sin_tasa']), (Decimal('30.51'), 0))
+
+    def test_no_pisa_una_tasa_escrita_mientras_se_reasigna(self):
+        from . import contabilidad
+        sin_tasa = self.movimiento('ingreso', '800', self.VIERNES)
+        TasaCambio.objects.bulk_create([TasaCambio(fecha=self.VIERNES, tasa=Decimal('40.00'))])  # sin señales: a mano
+        tasa_del_dia = contabilidad.tasa_del_dia
+
+        def con_edicion_a_mitad(fecha):
+            # Entre la lectura de la lista y el candado alguien le escribe la tasa a mano
+            MovimientoContable.objects.filter(pk=sin_tasa.pk).update(tasa_cambio=Decimal('41'), tasa_manual=True)
+            return tasa_del_dia(fecha)
+
+        with mock.patch.object(contabilidad, 'tasa_del_dia', side_effect=con_edicion_a_mitad):
+            self.assertEqual(contabilidad.reasignar_tasas(self.VIERNES), 0)
+        sin_tasa.refresh_from_db()
+        self.assertEqual((sin_tasa.tasa_cambio, sin_tasa.tasa_manual), (Decimal('41'), True))
+
+    def test_formulario_y_carga_masiva(self):
+        from .contabilidad import totales_contables
+        from .forms import MovimientoContableForm
+        self.tasa(self.VIERNES, '40.00')
+        form = MovimientoContableForm({'tipo': 'ingreso', 'descripcion': "Consulta", 'monto': '20', 'es_divisa': 'on',
+                                       'tasa_cambio': '', 'referencia': '', 'fecha': '2026-03-10'})
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(form.save().tasa_cambio, Decimal('40'))
+
+        # bulk_create no pasa por las señales: el comando asigna las tasas y reconstruye
+        MovimientoContable.objects.bulk_create([
+            MovimientoContable(tipo='egreso', monto=Decimal('80'), fecha=self.LUNES, descripcion="Insumos") for _ in range(3)
+        ])
+        salida = StringIO()
+        call_command('reconstruir_resumen_contable', '--asignar-tasas', stdout=salida)
+        self.assertIn("Movimientos con tasa asignada: 3", salida.getvalue())
+        totales = totales_contables()
+        self.assertEqual((totales['egresos'], totales['egresos_ves'], totales['balance']),
+                         (Decimal('6.00'), Decimal('240.00'), Decimal('14.00')))
@@ -1,13 +1,21 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.routers import SimpleRouter
+
+from . import api, views
 from django.contrib.auth import views as auth_views
 from django.conf import settings
-from django.conf.urls.static import static
+
+router_api = SimpleRouter()
+router_api.register('pacientes', api.PacienteApi, basename='api-pacientes')
+router_api.register('citas', api.CitaApi, basename='api-citas')
+router_api.register('ordenes', api.OrdenMedicaApi, basename='api-ordenes')
+router_api.register('movimientos', api.MovimientoContableApi, basename='api-movimientos')
 
 urlpatterns = [
     # --- PÚBLICO ---
     path('', views.inicio, name='inicio'),
     path('cita-invitado/', views.cita_invitado, name='cita_invitado'),
+    path('turnos-disponibles/', views.turnos_disponibles, name='turnos_disponibles'),
     
     # --- AUTENTICACIÓN ---
     path('accounts/login/', auth_views.LoginView.as_view(), name='login'),
@@ -22,6 +30,7 @@ urlpatterns = [
     
     # --- NUEVAS RUTAS ADMINISTRATIVAS ---
     path('finanzas/', views.panel_finanzas, name='panel_finanzas'),         # <--- NUEVA
+    path('finanzas/exportar/', views.exportar_libro, name='exportar_libro'),
     path('staff/', views.gestion_staff, name='gestion_staff'),              # <--- NUEVA
     path('autorizaciones/', views.gestion_autorizaciones, name='gestion_autorizaciones'), # <--- NUEVA
 
@@ -29,6 +38,10 @@ urlpatterns = [
     path('pacientes/', views.lista_pacientes, name='lista_pacientes'),
     path('pacientes/nuevo/', views.crear_paciente, name='crear_paciente'),
     path('pacientes/<int:id>/', views.detalle_paciente, name='detalle_paciente'),
+    path('pacientes/<int:id>/historia/', views.historia_paciente, name='historia_paciente'),
+    path('pacientes/<int:id>/documentos/subir/', views.subir_documento, name='subir_documento'),
+    path('pacientes/<int:id>/documentos/subidas/', views.iniciar_subida, name='iniciar_subida'),
+    path('subidas/<uuid:subida>/', views.subida_documento, name='subida_documento'),
 
     # --- CMS ---
     path('cms/', views.gestion_cms, name='gestion_cms'),
@@ -43,6 +56,15 @@ urlpatterns = [
     
     # --- ENFERMERÍA ---
     path('orden/ejecutar/<int:id>/', views.ejecutar_orden, name='ejecutar_orden'),
+    path('ordenes/feed/', views.feed_ordenes, name='feed_ordenes'),
+
+    # --- DOCUMENTOS PDF ---
+    path('citas/<int:id>/receta.pdf', views.receta_pdf, name='receta_pdf'),
+    path('pdf/<slug:huella>/estado/', views.pdf_estado, name='pdf_estado'),
+    path('pdf/<slug:huella>/', views.pdf_descargar, name='pdf_descargar'),
+
+    # --- API REST (miapp/api.py) ---
+    path('api/v1/', include(router_api.urls)),
 
     # ... tus otras urls ...
 path('autorizaciones/', views.gestion_autorizaciones, name='gestion_autorizaciones'),
@@ -50,4 +72,50 @@ path('autorizaciones/', views.gestion_autorizaciones, name='gestion_autorizacion
 path('autorizaciones/bloquear/<int:id>/', views.bloquear_personal, name='bloquear_personal'),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# --- ARCHIVOS SUBIDOS: con permisos, rangos y caché (miapp/medios.py) ---
+urlpatterns.append(path(f"{settings.MEDIA_URL.lstrip('/')}<path:ruta>", views.servir_medio, name='servir_medio'))
+
+# ==========================================
+# PRESUPUESTO DE CONSULTAS SQL POR VISTA
+# ==========================================
+# Máximo de consultas por petición GET (incluye sesión y usuario). No depende de cuántas
+# filas haya: si una vista lo supera es casi siempre un N+1 en la plantilla.
+# Lo vigilan PresupuestoConsultasMiddleware (log) y miapp/tests.py (falla la prueba).
+PRESUPUESTOS_CONSULTAS = {
+    'inicio': 5,                # sin caché: CMS (3) + sesión y usuario si está logueado; el anónimo con caché, 0 (PortadaCacheTests)
+    'cita_invitado': 1,
+    'turnos_disponibles': 5,    # filtros (especialidad, médico) + horarios + citas + excepciones
+    'registro_paciente': 0,
+    'registro_personal': 0,
+    'dashboard': 8,             # el peor rol (médico / dirección)
+    'panel_finanzas': 4,
+    'exportar_libro': 3,        # sesión, usuario, rol; el libro se lee después, mientras se envía
+    'gestion_staff': 3,
+    'gestion_autorizaciones': 4,
+    'lista_pacientes': 4,       # con ?q=: ids del ranking + in_bulk (varios términos suman un COUNT acotado cada uno)
+    'crear_paciente': 2,
+    'detalle_paciente': 6,      # sesión, usuario, paciente y la primera página de la historia (una consulta por tipo)
+    'historia_paciente': 6,     # sesión, usuario, existe el paciente y una consulta por tipo de evento con sus relaciones
+    'subir_documento': 4,
+    'subida_documento': 3,      # sesión, usuario y la subida (solo la ve quien la abrió)
+    'gestion_cms': 5,
+    'editar_slide': 3,
+    'editar_faq': 3,
+    'editar_aviso': 3,
+    'ejecutar_orden': 3,
+    'feed_ordenes': 6,          # sesión, usuario, rol, versión (índice de pendientes); con cambios: + ids y filas modificadas
+    'receta_pdf': 7,            # sesión, usuario, cita, perfil (permiso) y guardar la sesión con su savepoint
+    'pdf_estado': 2,
+    'pdf_descargar': 2,
+    'servir_medio': 4,          # documentos: sesión, usuario, rol y el documento; el carrusel, ninguna
+    # API: sesión, usuario, rol, la huella del ETag (values_list de las mismas filas) y la página
+    # (o el objeto) con sus relaciones unidas. Con If-None-Match vigente se queda en 4 (sin la página).
+    'api-pacientes-list': 5,
+    'api-pacientes-detail': 5,
+    'api-citas-list': 5,
+    'api-citas-detail': 5,
+    'api-ordenes-list': 5,
+    'api-ordenes-detail': 5,
+    'api-movimientos-list': 5,
+    'api-movimientos-detail': 5,
+}
\ No newline at end of file
@@ -1,16 +1,14 @@
-from io import BytesIO
 from django.http import HttpResponse
 from django.template.loader import get_template
-from xhtml2pdf import pisa
+
+from .pdf import leer_pdf, ErrorPDF
 
 def render_to_pdf(template_src, context_dict={}):
+    # Síncrono. Para vistas conviene miapp.pdf.responder_pdf (pool de procesos + página de espera);
+    # aquí al menos compartimos la caché en disco por hash del HTML.
     template = get_template(template_src)
     html  = template.render(context_dict)
-    result = BytesIO()
-    
-    # CORRECCIÓN: Usamos UTF-8 para soportar acentos y caracteres especiales
-    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
-    
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
-    return None
\ No newline at end of file
+    try:
+        return HttpResponse(leer_pdf(html), content_type='application/pdf')
+    except ErrorPDF:
+        return None
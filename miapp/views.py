@@ -1,16 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import SuspiciousFileOperation
 from django.contrib.auth.models import User, Group
 from django.contrib.auth import login, logout  # <--- IMPORTANTE: AGREGADO LOGOUT
 from django.contrib import messages
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.conf import settings
+from django.utils import timezone
+from django.utils._os import safe_join
 import datetime
+import os
+import re
+import uuid
+from asgiref.sync import sync_to_async
 from django.db.models import Sum
 
 # --- IMPORTACIÓN DE MODELOS ---
 from .models import (
     Paciente, Cita, Documento, PerfilUsuario, 
     CarruselImagen, PreguntaFrecuente, AvisoImportante,
-    PersonalAutorizado, MovimientoContable, OrdenMedica, Especialidad
+    PersonalAutorizado, MovimientoContable, OrdenMedica, Especialidad, SubidaDocumento
+)
+from .contabilidad import totales_contables
+from .estadisticas import estadisticas_admin, estadisticas_admin_async
+from .asincrono import en_hilo, consultas_concurrentes
+from .cache_paginas import cache_pagina_cms
+from .paginacion import paginar_por_cursor, PaginaSimple
+from .busqueda import pagina_de_busqueda
+from .disponibilidad import turnos_libres
+from .reservas import reservar_cita, cita_de_clave, TurnoOcupado
+from .ordenes import version_de, esperar_cambios, leer_cursor, cambios_desde
+from .pdf import responder_pdf, servir_pdf, estado_pdf, nombre_autorizado
+from .exportacion import libro_csv, libro_xlsx
+from .historia import pagina_historia
+from .medios import servir_archivo, INMUTABLE_PUBLICO, INMUTABLE_PRIVADO, REVALIDAR_PUBLICO, REVALIDAR_PRIVADO
+from .documentos import (
+    ROLES_DOCUMENTOS, ErrorDeSubida, asignar_contenido, recibir_fragmento, completar_subida, descartar_subida
 )
 
 # --- IMPORTACIÓN DE FORMULARIOS (AQUÍ ESTABA EL ERROR) ---
@@ -18,13 +46,15 @@ from .forms import (
     PacienteForm, CitaForm, CitaInvitadoForm, ConsultaForm, DocumentoForm, 
     CarruselForm,   # <--- AHORA SÍ ESTÁ INCLUIDO
     PreguntaForm, AvisoForm,
-    RegistroPersonalForm, MovimientoContableForm, OrdenMedicaForm, EjecucionOrdenForm
+    RegistroPersonalForm, MovimientoContableForm, OrdenMedicaForm, EjecucionOrdenForm,
+    FiltroMovimientosForm, FiltroTurnosForm, SubidaDocumentoForm
 )
 
 # ==========================================
 # 1. VISTAS PÚBLICAS (PORTADA)
 # ==========================================
 
+@cache_pagina_cms
 def inicio(request):
     slides = CarruselImagen.objects.filter(activo=True).order_by('orden')
     faqs = PreguntaFrecuente.objects.filter(activa=True).order_by('orden')
@@ -38,32 +68,44 @@ def inicio(request):
 
 def cita_invitado(request):
     if request.method == 'POST':
+        clave = request.POST.get('clave_idempotencia') or request.headers.get('Idempotency-Key')
+        if cita_de_clave(clave):
+            # Doble clic o reenvío del mismo formulario: la cita ya existe
+            messages.success(request, "Tu cita ya estaba agendada.")
+            return redirect('inicio')
+
         form = CitaInvitadoForm(request.POST)
         if form.is_valid():
             data = form.cleaned_data
-            paciente, created = Paciente.objects.get_or_create(
-                cedula=data['cedula'],
-                defaults={
-                    'nombre': data['nombre'], 'apellido': data['apellido'],
-                    'telefono': data['telefono'], 'fecha_nacimiento': data['fecha_nacimiento'],
-                    'sexo': data['sexo']
-                }
-            )
-            if not created:
-                paciente.telefono = data['telefono']
-                paciente.save()
-
-            Cita.objects.create(
-                paciente=paciente, medico=data['medico'],
-                fecha=data['fecha'], hora=data['hora'],
-                motivo=data['motivo'], estado='pendiente'
-            )
-            messages.success(request, f"Cita agendada para {data['nombre']}.")
-            return redirect('inicio')
+            try:
+                reservar_cita(data, clave)
+            except TurnoOcupado as e:
+                form.add_error('hora', str(e))
+            else:
+                messages.success(request, f"Cita agendada para {data['nombre']}.")
+                return redirect('inicio')
     else:
-        form = CitaInvitadoForm()
+        form = CitaInvitadoForm(initial={'clave_idempotencia': uuid.uuid4().hex})
     return render(request, 'miapp/cita_invitado.html', {'form': form})
 
+def turnos_disponibles(request):
+    """ JSON con los próximos turnos libres: ?especialidad=&medico=&desde=AAAA-MM-DD&cantidad= """
+    form = FiltroTurnosForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errores': form.errors}, status=400)
+    datos = form.cleaned_data
+    turnos = turnos_libres(
+        especialidad=datos['especialidad'], medico=datos['medico'],
+        desde=datos['desde'], cantidad=datos['cantidad'] or 10,
+    )
+    return JsonResponse({'turnos': [
+        {
+            'medico_id': t.medico_id, 'medico': t.medico, 'especialidad': t.especialidad,
+            'fecha': t.fecha.isoformat(), 'hora': t.hora.strftime('%H:%M'), 'duracion': t.duracion,
+        }
+        for t in turnos
+    ]})
+
 # --- NUEVA FUNCIÓN PARA CERRAR SESIÓN SIN ERRORES ---
 def cerrar_sesion(request):
     logout(request)
@@ -142,7 +184,7 @@ def registro_personal(request):
 def dashboard(request):
     if hasattr(request.user, 'paciente_perfil'):
         paciente = request.user.paciente_perfil
-        mis_citas = Cita.objects.filter(paciente=paciente).order_by('-fecha')
+        mis_citas = Cita.objects.filter(paciente=paciente).select_related('medico').order_by('-fecha')
         return render(request, 'miapp/portal_paciente.html', {'paciente': paciente, 'citas': mis_citas})
 
     try:
@@ -158,8 +200,8 @@ def dashboard(request):
     return redirect('inicio')
 
 def dashboard_medico(request):
-    citas_hoy = Cita.objects.filter(medico=request.user, fecha=datetime.date.today())
-    ordenes = OrdenMedica.objects.filter(medico=request.user).order_by('-fecha_creacion')[:10]
+    citas_hoy = Cita.objects.filter(medico=request.user, fecha=datetime.date.today()).select_related('paciente')
+    ordenes = OrdenMedica.objects.filter(medico=request.user).select_related('paciente', 'enfermera_responsable').order_by('-fecha_creacion')[:10]
     
     if request.method == 'POST':
         form_orden = OrdenMedicaForm(request.POST)
@@ -174,11 +216,20 @@ def dashboard_medico(request):
 
     return render(request, 'miapp/panel_medico.html', {'citas': citas_hoy, 'ordenes': ordenes, 'form_orden': form_orden})
 
+def _libro_paginado(request):
+    """ Página del libro contable filtrada y paginada por cursor (fecha, id), con el responsable ya unido """
+    filtro = FiltroMovimientosForm(request.GET or None)
+    movimientos = filtro.filtrar(MovimientoContable.objects.select_related('responsable'))
+    pagina = paginar_por_cursor(
+        movimientos, 'fecha',
+        despues=request.GET.get('despues'), antes=request.GET.get('antes'),
+    )
+    return filtro, pagina
+
 def dashboard_contable(request):
-    movimientos = MovimientoContable.objects.all().order_by('-fecha')
-    total_ingresos = sum(m.monto for m in movimientos if m.tipo == 'ingreso')
-    total_egresos = sum(m.monto for m in movimientos if m.tipo in ['egreso', 'nomina', 'impuesto'])
-    balance = total_ingresos - total_egresos
+    filtro, pagina = _libro_paginado(request)
+    # Totales desde el resumen pre-agregado (no recorremos el libro completo)
+    totales = totales_contables()
     
     if request.method == 'POST':
         form = MovimientoContableForm(request.POST)
@@ -191,51 +242,129 @@ def dashboard_contable(request):
     else:
         form = MovimientoContableForm()
         
-    return render(request, 'miapp/panel_contable.html', {'movimientos': movimientos, 'ingresos': total_ingresos, 'egresos': total_egresos, 'balance': balance, 'form': form})
+    return render(request, 'miapp/panel_contable.html', {'movimientos': pagina['objetos'], 'pagina': pagina, 'filtro': filtro, 'ingresos': totales['ingresos'], 'egresos': totales['egresos'], 'balance': totales['balance'], 'totales': totales, 'form': form}, status=400 if filtro.errors else 200)
 
 def dashboard_enfermera(request):
-    ordenes_pendientes = OrdenMedica.objects.filter(ejecutada=False).order_by('fecha_creacion')
-    return render(request, 'miapp/panel_enfermera.html', {'ordenes': ordenes_pendientes})
+    return render(request, 'miapp/panel_enfermera.html', _contexto_enfermera())
 
 def dashboard_admin_general(request):
-    # 1. Estadísticas Generales
-    total_pacientes = Paciente.objects.count()
-    medicos_count = PerfilUsuario.objects.filter(rol='medico').count()
-    citas_hoy = Cita.objects.filter(fecha=datetime.date.today()).count()
-    
-    # 2. Resumen Financiero
-    movimientos = MovimientoContable.objects.all()
-    
-    # Calculamos
-    ingresos_raw = sum(m.monto for m in movimientos if m.tipo == 'ingreso')
-    egresos_raw = sum(m.monto for m in movimientos if m.tipo in ['egreso', 'nomina', 'impuesto'])
-    balance_raw = ingresos_raw - egresos_raw
-
-    # REDONDEO EN PYTHON (Para evitar el error de floatform en tu versión)
-    total_ingresos = round(ingresos_raw, 2)
-    total_egresos = round(egresos_raw, 2)
-    balance = round(balance_raw, 2)
+    # Estadísticas generales + resumen financiero, cacheados (se invalidan con señales)
+    stats = estadisticas_admin()
+    totales = stats['finanzas']
 
     return render(request, 'miapp/dashboard_admin.html', {
-        'total_pacientes': total_pacientes,
-        'medicos_count': medicos_count,
-        'citas_hoy': citas_hoy,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'balance': balance
+        'total_pacientes': stats['total_pacientes'],
+        'medicos_count': stats['medicos_count'],
+        'citas_hoy': stats['citas_hoy'],
+        'total_ingresos': totales['ingresos'],
+        'total_egresos': totales['egresos'],
+        'balance': totales['balance'],
+        'totales': totales,
     })
+
+# --- VERSIÓN ASYNC (ASGI) ---
+# Con config/asgi.py la ruta 'dashboard' resuelve a dashboard_async (config/urls_asgi.py).
+# Las consultas independientes de cada panel corren a la vez (miapp/asincrono.py) y el
+# render, que es síncrono, va al final. Los POST (formularios) siguen en la vista síncrona.
+
+def _rol_del_usuario(user):
+    """ ('paciente', paciente), ('<rol>', perfil) o (None, None) si no tiene perfil """
+    paciente = Paciente.objects.filter(usuario=user).first()
+    if paciente:
+        return 'paciente', paciente
+    perfil = PerfilUsuario.objects.filter(usuario=user).first()
+    return (perfil.rol, perfil) if perfil else (None, None)
+
+@login_required
+async def dashboard_async(request):
+    if request.method == 'POST':
+        return await sync_to_async(dashboard)(request)
+    # El usuario ya cargado: que la plantilla no lo vuelva a pedir a la base desde el hilo del render
+    request.user = user = await request.auser()
+    rol, perfil = await en_hilo(_rol_del_usuario, user)
+
+    if rol == 'paciente':
+        citas = await en_hilo(lambda: list(Cita.objects.filter(paciente=perfil).select_related('medico').order_by('-fecha')))
+        plantilla, contexto = 'miapp/portal_paciente.html', {'paciente': perfil, 'citas': citas}
+    elif rol == 'medico':
+        plantilla, contexto = 'miapp/panel_medico.html', await _panel_medico_async(user)
+    elif rol in ['contador', 'gerente']:
+        plantilla, contexto = 'miapp/panel_contable.html', await _panel_contable_async(request)
+    elif rol == 'enfermera':
+        plantilla, contexto = 'miapp/panel_enfermera.html', await en_hilo(_contexto_enfermera)
+    elif rol in ['secretaria', None]:
+        plantilla, contexto = 'miapp/dashboard_admin.html', await _panel_admin_general_async()
+    else:
+        return redirect('inicio')
+    # Filtros del libro inválidos: 400, como en exportar_libro
+    estado = 400 if 'filtro' in contexto and contexto['filtro'].errors else 200
+    return await en_hilo(render, request, plantilla, contexto, status=estado)
+
+async def _panel_medico_async(user):
+    hoy = datetime.date.today()
+    datos = await consultas_concurrentes(
+        citas=lambda: list(Cita.objects.filter(medico=user, fecha=hoy).select_related('paciente')),
+        ordenes=lambda: list(OrdenMedica.objects.filter(medico=user).select_related(
+            'paciente', 'enfermera_responsable').order_by('-fecha_creacion')[:10]),
+    )
+    return {**datos, 'form_orden': OrdenMedicaForm()}
+
+async def _panel_contable_async(request):
+    datos = await consultas_concurrentes(
+        libro=lambda: _libro_paginado(request),
+        totales=totales_contables,
+    )
+    filtro, pagina = datos['libro']
+    totales = datos['totales']
+    return {'movimientos': pagina['objetos'], 'pagina': pagina, 'filtro': filtro, 'ingresos': totales['ingresos'],
+            'egresos': totales['egresos'], 'balance': totales['balance'], 'totales': totales, 'form': MovimientoContableForm()}
+
+@login_required
+async def feed_ordenes_async(request):
+    """ Long-polling bajo ASGI: la espera es una corrutina, no un hilo por estación (miapp/ordenes.py) """
+    user = await request.auser()
+    if not await en_hilo(_es_enfermeria, user):
+        return JsonResponse({'error': 'Solo para enfermería'}, status=403)
+    cambios = await esperar_cambios(leer_cursor(request.GET.get('cursor')), request.GET.get('version'),
+                                    settings.FEED_ORDENES_ESPERA)
+    if cambios is None:
+        return HttpResponse(status=204)
+    return JsonResponse(cambios)
+
+def _contexto_enfermera():
+    # El cursor se toma ANTES de consultar: lo que cambie mientras tanto llega por el feed.
+    # La versión es la de estas mismas filas
+    cursor = timezone.now()
+    ordenes = list(OrdenMedica.objects.filter(ejecutada=False).select_related('medico', 'paciente').order_by('fecha_creacion', 'id'))
+    version = version_de(ordenes)
+    return {'ordenes': ordenes, 'version': version, 'cursor': cursor.isoformat()}
+
+async def _panel_admin_general_async():
+    stats = await estadisticas_admin_async()
+    totales = stats['finanzas']
+    return {
+        'total_pacientes': stats['total_pacientes'],
+        'medicos_count': stats['medicos_count'],
+        'citas_hoy': stats['citas_hoy'],
+        'total_ingresos': totales['ingresos'],
+        'total_egresos': totales['egresos'],
+        'balance': totales['balance'],
+        'totales': totales,
+    }
+
 # ==========================================
 # 4. GESTIÓN PACIENTES Y CMS
 # ==========================================
 
 @login_required
 def lista_pacientes(request):
-    query = request.GET.get('q')
+    query = request.GET.get('q', '').strip()
     if query:
-        pacientes = Paciente.objects.filter(nombre__icontains=query) | Paciente.objects.filter(cedula__icontains=query)
+        # Índice de tokens sin acentos (nombre, apellido y cédula por prefijo), con ranking
+        pagina = pagina_de_busqueda(query, request.GET.get('page'))
     else:
-        pacientes = Paciente.objects.all().order_by('-id')
-    return render(request, 'miapp/lista_pacientes.html', {'pacientes': pacientes})
+        pagina = PaginaSimple(Paciente.objects.all().order_by('-id'), request.GET.get('page'))
+    return render(request, 'miapp/lista_pacientes.html', {'pacientes': pagina.object_list, 'pagina': pagina})
 
 @login_required
 def crear_paciente(request):
@@ -252,9 +381,21 @@ def crear_paciente(request):
 @login_required
 def detalle_paciente(request, id):
     paciente = get_object_or_404(Paciente, id=id)
-    historial = Cita.objects.filter(paciente=paciente).order_by('-fecha')
-    ordenes = OrdenMedica.objects.filter(paciente=paciente).order_by('-fecha_creacion')
-    return render(request, 'miapp/detalle_paciente.html', {'paciente': paciente, 'historial': historial, 'ordenes': ordenes})
+    # Primera página de la línea de tiempo (citas, órdenes y documentos); el resto, al hacer scroll
+    historia = pagina_historia(paciente.id, request.GET.get('despues'))
+    return render(request, 'miapp/detalle_paciente.html', {'paciente': paciente, 'historia': historia})
+
+@login_required
+def historia_paciente(request, id):
+    """ Página siguiente de la línea de tiempo (?despues=cursor) como HTML dentro de JSON """
+    # 404 como la ficha: sin esto un id inexistente daba una historia vacía
+    if not Paciente.objects.filter(id=id).exists():
+        raise Http404
+    historia = pagina_historia(id, request.GET.get('despues'))
+    return JsonResponse({
+        'html': render_to_string('miapp/historia_eventos.html', {'eventos': historia['eventos']}, request),
+        'siguiente': historia['siguiente'],
+    })
 
 @login_required
 def gestion_cms(request):
@@ -356,6 +497,24 @@ def ejecutar_orden(request, id):
         form = EjecucionOrdenForm(instance=orden)
     return render(request, 'miapp/editar_generico.html', {'form': form, 'titulo': 'Ejecutar Orden'})
 
+def _es_enfermeria(user):
+    return user.is_superuser or PerfilUsuario.objects.filter(usuario=user, rol='enfermera').exists()
+
+@login_required
+def feed_ordenes(request):
+    """
+    Feed del panel de enfermería: ?version=&cursor= → cambios en JSON, o 204 si no hubo ninguno.
+    Bajo WSGI no espera (no retiene el hilo): el 204 lleva Retry-After. Bajo ASGI, feed_ordenes_async
+    """
+    if not _es_enfermeria(request.user):
+        return JsonResponse({'error': 'Solo para enfermería'}, status=403)
+    cambios = cambios_desde(leer_cursor(request.GET.get('cursor')), request.GET.get('version'))
+    if cambios is None:
+        response = HttpResponse(status=204)
+        response['Retry-After'] = settings.FEED_ORDENES_REINTENTO
+        return response
+    return JsonResponse(cambios)
+
 # --- VISTAS ADMINISTRATIVAS NUEVAS ---
 
 @login_required
@@ -374,29 +533,48 @@ def panel_finanzas(request):
     else:
         form = MovimientoContableForm()
 
-    # Cálculos
-    movimientos = MovimientoContable.objects.all().order_by('-fecha')
-    ingresos_raw = sum(m.monto for m in movimientos if m.tipo == 'ingreso')
-    egresos_raw = sum(m.monto for m in movimientos if m.tipo in ['egreso', 'nomina', 'impuesto'])
-    balance_raw = ingresos_raw - egresos_raw
-    
-    # Redondeo seguro para la plantilla
-    total_ingresos = round(ingresos_raw, 2)
-    total_egresos = round(egresos_raw, 2)
-    balance = round(balance_raw, 2)
+    # Cálculos (desde el resumen contable, ya redondeados para la plantilla)
+    filtro, pagina = _libro_paginado(request)
+    totales = totales_contables()
 
     return render(request, 'miapp/panel_finanzas.html', {
         'form': form,
-        'movimientos': movimientos,
-        'total_ingresos': total_ingresos,
-        'total_egresos': total_egresos,
-        'balance': balance
-    })
+        'filtro': filtro,
+        'pagina': pagina,
+        'movimientos': pagina['objetos'],
+        'total_ingresos': totales['ingresos'],
+        'total_egresos': totales['egresos'],
+        'balance': totales['balance'],
+        'totales': totales,
+    }, status=400 if filtro.errors else 200)
+
+@login_required
+def exportar_libro(request):
+    """ Libro contable filtrado, en CSV o XLSX, enviado mientras se lee (ver miapp/exportacion.py) """
+    puede = request.user.is_staff or PerfilUsuario.objects.filter(usuario=request.user, rol__in=['contador', 'gerente']).exists()
+    if not puede:
+        return redirect('dashboard')
+    filtro = FiltroMovimientosForm(request.GET)
+    if not filtro.is_valid():
+        # Sin esto un filtro mal escrito exportaría el libro completo
+        return HttpResponseBadRequest("Filtros inválidos: " + "; ".join(f"{c}: {' '.join(e)}" for c, e in filtro.errors.items()))
+
+    movimientos = filtro.filtrar(MovimientoContable.objects.all())
+    formato = 'xlsx' if request.GET.get('formato') == 'xlsx' else 'csv'
+    if formato == 'xlsx':
+        response = StreamingHttpResponse(libro_xlsx(movimientos),
+                                         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    else:
+        response = StreamingHttpResponse(libro_csv(movimientos), content_type='text/csv; charset=utf-8')
+    datos = filtro.cleaned_data
+    periodo = "_".join(f"{fecha:%Y%m%d}" for fecha in [datos['desde'], datos['hasta']] if fecha) or "completo"
+    response['Content-Disposition'] = f'attachment; filename="libro_contable_{periodo}.{formato}"'
+    return response
 
 @login_required
 def gestion_staff(request):
     # Solo muestra médicos activos
-    medicos = PerfilUsuario.objects.filter(rol='medico')
+    medicos = PerfilUsuario.objects.filter(rol='medico').select_related('usuario', 'especialidad')
     return render(request, 'miapp/gestion_staff.html', {'medicos': medicos})
 
 @login_required
@@ -422,7 +600,7 @@ def gestion_autorizaciones(request):
         messages.success(request, f"Autorizado: {nombre}")
         return redirect('gestion_autorizaciones')
 
-    autorizados = PersonalAutorizado.objects.all().order_by('-id')
+    autorizados = PersonalAutorizado.objects.select_related('especialidad_asignada').order_by('-id')
     especialidades = Especialidad.objects.all()
     
     return render(request, 'miapp/gestion_autorizaciones.html', {
@@ -453,4 +631,155 @@ def bloquear_personal(request, id):
     # 3. Borramos/Marcamos la autorización para que no se pueda volver a registrar con esa cédula
     personal.delete() 
     
-    return redirect('gestion_autorizaciones')
\ No newline at end of file
+    return redirect('gestion_autorizaciones')
+
+
+# ==========================================
+# 5. DOCUMENTOS PDF
+# ==========================================
+
+def _puede_ver_cita(user, cita):
+    # El paciente solo ve sus citas; el personal de la clínica ve todas
+    if user.is_superuser or cita.paciente.usuario_id == user.id:
+        return True
+    return PerfilUsuario.objects.filter(usuario=user).exists()
+
+@login_required
+def receta_pdf(request, id):
+    cita = get_object_or_404(Cita.objects.select_related('paciente', 'medico'), id=id)
+    if not _puede_ver_cita(request.user, cita):
+        messages.error(request, "No tienes acceso a esa receta.")
+        return redirect('dashboard')
+
+    html = render_to_string('miapp/receta_pdf.html', {
+        'cita': cita, 'paciente': cita.paciente, 'fecha_emision': datetime.date.today()
+    })
+    return responder_pdf(request, html, f"receta_{cita.paciente.cedula}_{cita.fecha:%Y%m%d}.pdf")
+
+@login_required
+def pdf_estado(request, huella):
+    nombre_autorizado(request, huella)
+    estado = estado_pdf(huella)
+    datos = {'estado': estado}
+    if estado == 'listo':
+        datos['url'] = reverse('pdf_descargar', args=[huella])
+    return JsonResponse(datos)
+
+@login_required
+def pdf_descargar(request, huella):
+    nombre = nombre_autorizado(request, huella)
+    if estado_pdf(huella) != 'listo':
+        raise Http404("El documento aún no está listo")
+    return servir_pdf(request, huella, nombre)
+
+# ==========================================
+# 6. DOCUMENTOS DEL PACIENTE (SUBIDAS POR PARTES)
+# ==========================================
+# Protocolo en miapp/documentos.py. La página sube con fetch por fragmentos; sin
+# JavaScript el mismo formulario se envía entero y pasa igual por el almacén.
+
+def _puede_subir_documentos(user):
+    return user.is_superuser or PerfilUsuario.objects.filter(usuario=user, rol__in=ROLES_DOCUMENTOS).exists()
+
+@login_required
+def subir_documento(request, id):
+    if not _puede_subir_documentos(request.user):
+        messages.error(request, "No tienes permiso para subir documentos.")
+        return redirect('dashboard')
+    paciente = get_object_or_404(Paciente, id=id)
+    if request.method == 'POST':
+        form = DocumentoForm(request.POST, request.FILES)
+        if form.is_valid():
+            documento = form.save(commit=False)
+            documento.paciente = paciente
+            asignar_contenido(documento, form.cleaned_data['archivo'])
+            documento.save()
+            messages.success(request, 'Documento cargado.')
+            return redirect('detalle_paciente', id=paciente.id)
+    else:
+        form = DocumentoForm()
+    return render(request, 'miapp/subir_documento.html', {
+        'form': form, 'paciente': paciente, 'fragmento': settings.SUBIDAS_FRAGMENTO,
+    })
+
+@login_required
+def iniciar_subida(request, id):
+    """ POST: abre una subida por partes y devuelve su URL """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Use POST'}, status=405)
+    if not _puede_subir_documentos(request.user):
+        return JsonResponse({'error': 'No tienes permiso para subir documentos'}, status=403)
+    paciente = get_object_or_404(Paciente, id=id)
+    form = SubidaDocumentoForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errores': form.errors}, status=400)
+    subida = form.save(commit=False)
+    subida.paciente, subida.usuario = paciente, request.user
+    subida.save()
+    return JsonResponse({
+        'url': reverse('subida_documento', args=[subida.pk]),
+        'recibidos': 0, 'tamano': subida.tamano, 'fragmento': settings.SUBIDAS_FRAGMENTO,
+    }, status=201)
+
+@login_required
+def subida_documento(request, subida):
+    """ GET: bytes recibidos (para reanudar). PUT: un fragmento con Content-Range. DELETE: cancelar. """
+    subida = get_object_or_404(SubidaDocumento, pk=subida, usuario=request.user)
+    if request.method == 'DELETE':
+        descartar_subida(subida)
+        return HttpResponse(status=204)
+    if request.method == 'PUT':
+        try:
+            if recibir_fragmento(subida, request.headers.get('Content-Range'), request) < subida.tamano:
+                return JsonResponse({'recibidos': subida.recibidos, 'tamano': subida.tamano})
+            documento, duplicado = completar_subida(subida)
+        except ErrorDeSubida as e:
+            return JsonResponse({'error': str(e), 'recibidos': subida.recibidos, 'tamano': subida.tamano}, status=e.estado)
+        return JsonResponse({
+            'documento': documento.id, 'duplicado': duplicado,
+            'url': reverse('detalle_paciente', args=[documento.paciente_id]),
+        }, status=201)
+    return JsonResponse({'recibidos': subida.recibidos, 'tamano': subida.tamano})
+
+# ==========================================
+# 7. ARCHIVOS SUBIDOS (MEDIA)
+# ==========================================
+# Reemplaza a static(MEDIA_URL), que servía todo sin permisos, sin rangos ni caché
+# (y solo con DEBUG). El carrusel es público; un documento lo ve el personal clínico
+# y el paciente al que pertenece. El envío lo hace miapp/medios.py.
+
+MEDIOS_PUBLICOS = ('carrusel/',)
+MEDIOS_DOCUMENTOS = ('documentos/', 'resultados/')
+
+def servir_medio(request, ruta):
+    try:
+        absoluta = safe_join(settings.MEDIA_ROOT, ruta)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado")
+    if not os.path.isfile(absoluta):
+        raise Http404("Archivo no encontrado")
+
+    if ruta.startswith(MEDIOS_PUBLICOS):
+        # Las variantes llevan el hash de la imagen en el nombre: su URL nunca cambia de contenido
+        cache_control = INMUTABLE_PUBLICO if ruta.startswith('carrusel/variantes/') else REVALIDAR_PUBLICO
+        return servir_archivo(request, absoluta, cache_control)
+    if not ruta.startswith(MEDIOS_DOCUMENTOS):
+        raise Http404("Archivo no encontrado")
+
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    # Un mismo contenido puede ser de varios pacientes (almacén por contenido): basta uno propio.
+    # La vista previa (<sha256>.vista.webp) se autoriza como el documento del que sale.
+    vista_previa = re.fullmatch(r'documentos/.+/([0-9a-f]{64})\.vista\.webp', ruta)
+    if vista_previa:
+        documentos = Documento.objects.filter(contenido__huella=vista_previa.group(1))
+    else:
+        documentos = Documento.objects.filter(archivo=ruta)
+    if not _puede_subir_documentos(request.user):
+        documentos = documentos.filter(paciente__usuario=request.user)
+    documento = documentos.only('nombre_original').first()
+    if documento is None:
+        raise Http404("Archivo no encontrado")
+    # Los del almacén se nombran por su SHA-256; los de 'resultados/' se pueden reemplazar
+    cache_control = INMUTABLE_PRIVADO if ruta.startswith('documentos/') else REVALIDAR_PRIVADO
+    return servir_archivo(request, absoluta, cache_control, nombre=None if vista_previa else documento.nombre_original or None)